@@ -25,6 +25,8 @@ from content.models import event, album
 from league.admin import standings_update, standings_save       
 
 from league.utils import *
+from league import lichess_client
+from league.ingest import import_games
 
 
 def get_players(club):
@@ -33,47 +35,19 @@ def get_players(club):
 def get_tournaments(user):
     return [ t['id'] for t in client.tournaments.stream_by_creator('sfarry') if 'wallasey' in t['fullName'].lower() ]
 
+# the games are fetched by league.lichess_client, concurrently and cached
+
 def get_pgn(game):
-    return client.games.export(game, as_pgn=True)
+    return lichess_client.get_pgn(game)
 
 def get_game(game):
-    toReturn = {}
-    g = client.games.export(game)
-    pgn = client.games.export(game, as_pgn = True)
-    result = 0
-    if 'winner' in g.keys():
-        if g['winner'] == 'white' : result = 1
-        if g['winner'] == 'black' : result = 2
-    toReturn[g['id']] = { 'white' : g['players']['white']['user']['id'], 'black' : g['players']['black']['user']['id'], 'result' : result, 'date' : g['createdAt'], 'pgn' : pgn}
-    return toReturn
+    return lichess_client.get_game(game)
 
 def get_games(tournament):
-    games = client.tournaments.export_games(tournament)
-    toReturn = {}
-    for g in games:
-        result = 0
-        if 'winner' in g.keys():
-            if g['winner'] == 'white' : result = 1
-            if g['winner'] == 'black' : result = 2
-        toReturn[g['id']] = { 'white' : g['players']['white']['user']['id'], 'black' : g['players']['black']['user']['id'], 'result' : result, 'date' : g['createdAt']}
-    return toReturn
+    return lichess_client.get_arena_games(tournament)
 
 def get_games_from_pgn(pgn):
-    game = chess.pgn.read_game(pgn)
-    toReturn = {}
-    while (game):
-        heads = game.headers
-        id = heads['Site'].replace('https://lichess.org/','')
-        result = 0
-        time = heads['UTCTime']
-        date = heads['Date']
-        format = '%Y.%m.%d %H:%M:%S'
-        print(heads['Result'])
-        if heads['Result'] == '1-0' : result = 1
-        if heads['Result'] == '0-1' : result = 2
-        toReturn[id] = {'white': heads['White'].lower(), 'black' : heads['Black'].lower(), 'result' : result, 'date' : datetime.datetime.strptime(date + ' ' + time,format), 'pgn' : game}
-        game = chess.pgn.read_game(pgn)
-    return toReturn
+    return lichess_client.get_games_from_pgn(pgn)
 
 def add_arena_event(e):
     tournament    = lichess.api.tournament(e)
@@ -124,6 +98,8 @@ if __name__ == "__main__":
     parser.add_argument('--arena', dest='arenas', default = [], nargs = '+', type=str, help='Arena tournament results to add')
     parser.add_argument('--league', dest='league', type=str, default='Lichess Blitz')
     parser.add_argument('--season', dest='season', type=str, default='2020/2021')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true', help='Report what the import would do without changing the database')
+    parser.add_argument('--validate-pgn', dest='validate_pgn', action='store_true', help='Parse the PGNs and leave out those with errors')
     parser.add_argument('--games', dest='games', type=str, nargs='+', help = "Lichess games to add", default = [])
     parser.add_argument('--arena_events', nargs = '+', dest='arena_events', type=str, help = 'Upcoming Arena Events to Add', default = [])
     parser.add_argument('--swiss_events', nargs = '+', dest='swiss_events', type=str, help = 'Upcoming Swiss Events to Add', default = [])
@@ -153,51 +129,16 @@ if __name__ == "__main__":
     #tournaments = get_tournaments('sfarry')
     
     tournaments = []
-    games = {}
-
-    for g in args.games:
-        games.update(get_game(g))
-
-    for t in args.arenas:
-        games.update(get_games(t))
-
-    for t in args.swiss:
-        pgn = requests.get('https://lichess.org/api/swiss/'+t+'/games',allow_redirects=True)
-        pgn_bytes = io.BytesIO(pgn.content)
-        wrapper = io.TextIOWrapper(pgn_bytes, encoding='utf-8')
-        games.update(get_games_from_pgn(wrapper))
+    # the games are streamed into the league a batch at a time, a game seen
+    # twice is only added once
+    games = lichess_client.iter_lichess_games(arenas=args.arenas, swiss=args.swiss, games=args.games)
 
     season = Season.objects.filter(name=args.season)[0]
     league = League.objects.filter(season=season).filter(name=args.league)[0]
-    for g,v in games.items():
-        if len(Schedule.objects.filter(lichess=g)) > 0:
-            schedule = Schedule.objects.filter(lichess=g)[0]
-            print('game already in database')
-            if schedule.league != league:
-                print('updating league')
-                schedule.league = league
-                schedule.save()
-            continue
-        white = Player.objects.filter(lichess=v['white'])
-        black = Player.objects.filter(lichess=v['black'])
-        if len(white) == 0:
-            raise Exception(v['white'],'is not in the database')
-        if len(black) == 0:
-            raise Exception(v['black'],'is not in the database')
-        if white[0] not in league.players.all():
-            raise Warning(v['white'], 'is in the database but not the league')
-        if black[0] not in league.players.all():
-            raise Warning(v['black'], 'is in the database but not the league')
-        schedule = Schedule(league=league,lichess=g,white=white[0],black=black[0],date=v['date'],result=v['result'])
-        if 'pgn' in v.keys():
-            schedule.pgn = v['pgn']
-        else:
-            schedule.pgn = get_pgn(g)
-        print(schedule.white,schedule.black,"result:",schedule.result)
-        schedule.save()
-    if len(games.items()) > 0 :
-        standings_save(league)
-        standings_update(league)
+    result = import_games(league, games, dry_run=args.dry_run, validate_pgn=args.validate_pgn)
+    for message in result.messages():
+        print(message)
+    print(result.summary(league))
 
     for e in args.arena_events:
         add_arena_event(e)
@@ -17,6 +17,7 @@ os.environ["DJANGO_SETTINGS_MODULE"] = "chessclub.settings"
 django.setup()
 
 from content.models import Puzzle
+from league.pgnscan import scan_pgn
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__)
@@ -27,15 +28,10 @@ if __name__ == "__main__":
     parser.add_argument("--max-puzzles", type=int, dest='max_puzzles', default=-1)
     settings = parser.parse_args()
     
-    puzzles = []
-    all_games = open(settings.games, "r")
-    ngames = 0
-    game = chess.pgn.read_game(all_games)
-    while True:
-        game = chess.pgn.read_game(all_games)
-        if game == None:
-            break
-        puzzles += [ game ]
+    # only the headers are read, the puzzles are stored as they are in the
+    # file, the first game is left out as it always was
+    all_games = open(settings.games, "rb")
+    puzzles = list(scan_pgn(all_games))[1:]
 
     print('there are ',len(puzzles),' in the tactics database')
     random.shuffle(puzzles)
@@ -48,8 +44,6 @@ if __name__ == "__main__":
     
     for i,p in enumerate(puzzles):
         if i > max and max != -1 : break
-        exporter = chess.pgn.StringExporter(headers=True, variations=True, comments=True)
-        pgn =  p.accept(exporter)
-        a = Puzzle(pgn=pgn,date = today + datetime.timedelta(days = -i), fen=p.headers['FEN'])
+        a = Puzzle(pgn=p.text(),date = today + datetime.timedelta(days = -i), fen=p.headers['FEN'])
         a.save()
     
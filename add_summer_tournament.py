@@ -30,6 +30,7 @@ players = Player.objects.all()
 player_names = {p.__str__() : p  for p in players}
 summer_tournament_players = {}
 import pandas as pd
+import numpy as np
 
 
 season = Season.objects.all()[2]
@@ -0,0 +1,97 @@
+'''
+Helpers shared by the benchmarks that need the database. They run against a
+throwaway test database, created with the project settings or whatever
+DJANGO_SETTINGS_MODULE points at, so the club data is never touched.
+'''
+import contextlib
+import datetime
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chessclub.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(verbosity=0):
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def seed_league(nplayers, cycles=1, seed=0, slug='benchmark', **kwargs):
+    '''
+    A round robin league of nplayers played cycles times over with random
+    results, standings up to date
+    '''
+    from django.utils import timezone
+    from league.models import Season, League, Player, Schedule
+    from league.standings import standings_rebuild
+    from league.utils import create_balanced_round_robin
+
+    rng = random.Random(seed)
+    season, created = Season.objects.get_or_create(slug='benchmark', defaults={
+        'name': 'Benchmark', 'start': datetime.date(2020, 1, 1), 'end': datetime.date(2020, 12, 31) })
+    kwargs.setdefault('name', slug)
+    league = League.objects.create(season=season, slug=slug, **kwargs)
+    players = Player.objects.bulk_create([
+        Player(name='Player', surename='%s %04i' % (slug, i), rating=rng.randint(1000, 2400)) for i in range(nplayers) ])
+    if players[0].pk is None:
+        players = list(Player.objects.filter(surename__startswith=slug + ' ').order_by('surename'))
+    league.players.set(players)
+
+    start = timezone.make_aware(datetime.datetime(2020, 1, 1, 19, 30))
+    # every other round, the others are the same pairings with colours reversed
+    rounds = create_balanced_round_robin(list(range(nplayers)))[::2]
+    games = []
+    for c in range(cycles):
+        for r, pairs in enumerate(rounds):
+            date = start + datetime.timedelta(days=7 * (c * len(rounds) + r))
+            for white, black in pairs:
+                if c % 2: white, black = black, white
+                if white is None or black is None: continue
+                games += [ Schedule(league=league, round=c * len(rounds) + r + 1, date=date,
+                    white=players[white], black=players[black], result=rng.choice([0, 1, 2])) ]
+    Schedule.objects.bulk_create(games)
+    standings_rebuild(None, None, league)
+    league.refresh_from_db()
+    return league
+
+
+def timed(func, repeat=5):
+    '''
+    Best wall time of repeat calls of func, in seconds, and its last result
+    '''
+    best, result = None, None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def count_queries(func):
+    '''
+    Number of queries run by func
+    '''
+    from django.db import connection
+    count = [0]
+    def counter(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+    with connection.execute_wrapper(counter):
+        func()
+    return count[0]
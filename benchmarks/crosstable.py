@@ -0,0 +1,60 @@
+'''
+Times building the crosstable of a double round robin, from one fetch of the
+games, against the per cell queryset filtering it replaced.
+
+    python benchmarks/crosstable.py --players 10 20 40
+'''
+import argparse
+
+from common import setup_django, test_database, seed_league, timed, count_queries
+
+
+def legacy_crosstable(league):
+    # the cell texts as make_crosstable used to build them
+    from league.models import Schedule, Standings
+    standings = Standings.objects.filter(league=league).order_by("position")
+    games     = Schedule.objects.filter(league=league)
+    cells = []
+    for p1 in standings:
+        p1_white_games = games.filter(white = p1.player)
+        p1_black_games = games.filter(black = p1.player)
+        row = []
+        for p2 in standings:
+            p1_p2_white_games = p1_white_games.filter(black = p2.player)
+            p1_p2_black_games = p1_black_games.filter(white = p2.player)
+            points_text = '\n'
+            if len(p1_p2_white_games) > 0:
+                points_text = '%i\n'%(sum(g.get_white_points() for g in p1_p2_white_games))
+            if len(p1_p2_black_games) > 0:
+                points_text += '%i'%(sum(g.get_black_points() for g in p1_p2_black_games))
+            row += [ points_text ]
+        cells += [ row ]
+    return cells
+
+
+def matrix_crosstable(league):
+    from league.crosstable import build_crosstable
+    crosstable = build_crosstable(league)
+    return [ [ crosstable.cell_text(i, j) for j in range(len(crosstable)) ] for i in range(len(crosstable)) ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[10, 20, 40])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        print('%8s %10s %10s %10s %10s %8s' % ('players', 'old (s)', 'queries', 'new (s)', 'queries', 'speedup'))
+        for n in args.players:
+            league = seed_league(n, cycles=2, slug='crosstable-%i' % n)
+            old, _ = timed(lambda: legacy_crosstable(league), args.repeat)
+            new, _ = timed(lambda: matrix_crosstable(league), args.repeat)
+            print('%8i %10.4f %10i %10.4f %10i %7.0fx' % (n,
+                old, count_queries(lambda: legacy_crosstable(league)),
+                new, count_queries(lambda: matrix_crosstable(league)), old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+'''
+Time of importing Lichess games into a league with league.ingest, against
+the loop of a few queries a game it replaced, on synthetic games between the
+players of the league.
+
+Each run imports into a fresh league: a dry run, the import itself, the
+standings rebuilt once, then the same games again, all already there. The
+old loop, without its standings, is run on --serial games only, it is slow.
+
+    python benchmarks/lichess_import.py --games 10000 --players 100
+'''
+import argparse
+import datetime
+import random
+import time
+
+from common import setup_django, test_database, count_queries
+
+
+def make_games(ngames, nplayers, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2021, 1, 4, 19, 30, tzinfo=datetime.timezone.utc)
+    games = []
+    for i in range(ngames):
+        white, black = rng.sample(range(nplayers), 2)
+        games += [ ('bench%05i' % (i), { 'white' : 'player%03i' % (white), 'black' : 'player%03i' % (black),
+            'result' : rng.choice([0, 1, 2]), 'date' : start + datetime.timedelta(minutes=i),
+            'pgn' : '[Event "Benchmark"]\n[Site "https://lichess.org/bench%05i"]\n\n1. e4 e5 2. Nf3 Nc6 *\n' % (i) }) ]
+    return games
+
+
+def make_league(slug, nplayers):
+    from league.models import Season, League, Player
+    season, created = Season.objects.get_or_create(slug='benchmark', defaults={
+        'name': 'Benchmark', 'start': datetime.date(2021, 1, 1), 'end': datetime.date(2021, 12, 31) })
+    league = League.objects.create(season=season, slug=slug, name=slug, format=3)
+    Player.objects.bulk_create([ Player(name='Player', surename='%s %03i' % (slug, i),
+        lichess='%s-player%03i' % (slug, i)) for i in range(nplayers) ])
+    players = list(Player.objects.filter(surename__startswith=slug + ' ').order_by('surename'))
+    league.players.set(players)
+    return league
+
+
+def league_games(slug, games):
+    return [ (slug + '-' + g, dict(v, white=slug + '-' + v['white'], black=slug + '-' + v['black'])) for g, v in games ]
+
+
+def serial_import(league, games):
+    '''
+    The per game loop of manage_league_view before league.ingest
+    '''
+    from league.models import Player, Schedule
+    for g, v in games:
+        if len(Schedule.objects.filter(lichess=g)) > 0:
+            schedule = Schedule.objects.filter(lichess=g)[0]
+            if schedule.league != league:
+                schedule.league = league
+                schedule.save()
+            continue
+        white = Player.objects.filter(lichess=v['white'])
+        black = Player.objects.filter(lichess=v['black'])
+        if len(white) == 0 or len(black) == 0:
+            continue
+        white[0] in league.players.all()
+        black[0] in league.players.all()
+        Schedule(league=league, lichess=g, white=white[0], black=black[0], date=v['date'], result=v['result']).save()
+
+
+def timed(func):
+    '''
+    Wall time of func, in seconds, and the number of queries it ran
+    '''
+    start = time.perf_counter()
+    queries = count_queries(func)
+    return time.perf_counter() - start, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--serial', type=int, default=1000, help='games imported by the old loop')
+    args = parser.parse_args()
+
+    setup_django()
+    from league.ingest import ingest_games, import_games
+
+    games = make_games(args.games, args.players)
+    print('%-28s %8s %10s %9s' % ('case', 'games', 'ms', 'queries'))
+    with test_database():
+        league = make_league('bulk', args.players)
+        games = league_games('bulk', games)
+        rows = [
+            ('dry run', lambda : import_games(league, games, dry_run=True)),
+            ('import and standings', lambda : import_games(league, games)),
+            ('import again', lambda : ingest_games(league, games)),
+        ]
+        for name, func in rows:
+            elapsed, queries = timed(func)
+            print('%-28s %8i %10.1f %9i' % (name, len(games), elapsed * 1000, queries))
+
+        league = make_league('serial', args.players)
+        serial = league_games('serial', make_games(args.serial, args.players))
+        elapsed, queries = timed(lambda : serial_import(league, serial))
+        print('%-28s %8i %10.1f %9i' % ('per game loop, no standings', len(serial), elapsed * 1000, queries))
+
+
+if __name__ == '__main__':
+    main()
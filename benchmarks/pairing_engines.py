@@ -0,0 +1,108 @@
+'''
+Pairing time and quality of the Dutch engine and the weighted matching
+engine on synthetic Swiss tournaments.
+
+The tournament is played with the pairings of the matching engine and random
+results drawn from the ratings, and every round both engines pair the same
+standings. The Dutch engine is given --budget seconds a round, as on the
+create round page. The quality is counted on the pairs of each round: the
+rematches, the players given the same colour three times running or two more
+of one colour than the other, and the floaters, players paired outside their
+score group.
+
+    python benchmarks/pairing_engines.py --players 30 100 300 --rounds 7
+'''
+import argparse
+import random
+import time
+
+from common import setup_django
+
+
+def play_results(rng, players):
+    '''
+    Results for the round just paired, drawn from the ratings
+    '''
+    by_number = { p.pairing_no : p for p in players }
+    for p in players:
+        opponent = p.opponents[-1]
+        if opponent == 0 or opponent < p.pairing_no:
+            continue
+        q = by_number[opponent]
+        expected = 1 / (1 + 10 ** ((q.rating - p.rating) / 400))
+        x = rng.random()
+        if x < 0.2:
+            p._score += 0.5
+            q._score += 0.5
+        elif x < 0.2 + 0.8 * expected:
+            p._score += 1
+        else:
+            q._score += 1
+
+
+def pair(engine, round_no, players, budget):
+    from league.matching import pairing_metrics
+    from league.pairingjobs import run_with_budget
+    start = time.perf_counter()
+    status, result = run_with_budget(engine.pair_round, (round_no, tuple(players)), budget)
+    elapsed = time.perf_counter() - start
+    if status != 'done':
+        return elapsed, status, None, None
+    return elapsed, status, list(result), pairing_metrics(result)
+
+
+def run(nplayers, nrounds, budget, seed):
+    from swissdutch.constants import Colour
+    from swissdutch.dutch import DutchPairingEngine
+    from swissdutch.player import Player as PairingPlayer
+    from league.matching import MatchingPairingEngine
+
+    rng = random.Random(seed)
+    players = [ PairingPlayer(name='Player %04i' % (i), rating=rng.randint(1000, 2400)) for i in range(nplayers) ]
+    engines = [ ('dutch', DutchPairingEngine(lambda : Colour.white)), ('matching', MatchingPairingEngine(lambda : Colour.white)) ]
+    rows = []
+    for r in range(1, nrounds + 1):
+        paired = None
+        for name, engine in engines:
+            elapsed, status, result, metrics = pair(engine, r, players, budget)
+            rows += [ (nplayers, r, name, elapsed, status, metrics) ]
+            if name == 'matching':
+                paired = result
+        players = paired
+        play_results(rng, players)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[30, 100, 300])
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--budget', type=float, default=10, help='seconds the Dutch engine is given a round')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    print('%7s %5s %-9s %10s %-8s %9s %8s %9s' % ('players', 'round', 'engine', 'ms', 'status', 'rematches', 'colours', 'floaters'))
+    totals = {}
+    for nplayers in args.players:
+        for n, r, name, elapsed, status, metrics in run(nplayers, args.rounds, args.budget, args.seed):
+            metrics = metrics or {}
+            print('%7i %5i %-9s %10.1f %-8s %9s %8s %9s' % (n, r, name, elapsed * 1000, status,
+                metrics.get('rematches', '-'), metrics.get('colour_violations', '-'), metrics.get('floaters', '-')))
+            total = totals.setdefault((n, name), [ 0.0, 0, 0, 0, 0 ])
+            total[0] += elapsed
+            if metrics:
+                total[1] += metrics['rematches']
+                total[2] += metrics['colour_violations']
+                total[3] += metrics['floaters']
+            else:
+                total[4] += 1
+
+    print()
+    print('%7s %-9s %10s %9s %8s %9s %7s' % ('players', 'engine', 'total ms', 'rematches', 'colours', 'floaters', 'failed'))
+    for (n, name), (elapsed, rematches, colours, floaters, failed) in totals.items():
+        print('%7i %-9s %10.1f %9i %8i %9i %7i' % (n, name, elapsed * 1000, rematches, colours, floaters, failed))
+
+
+if __name__ == '__main__':
+    main()
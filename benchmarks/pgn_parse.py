@@ -0,0 +1,60 @@
+'''
+Parsing every game of a PGN file in full with league.pgnparse, by number of
+worker processes, against python-chess reading the file in one process.
+
+The file is made as in pgn_scan.py. The speed up is only near linear with as
+many cores as workers, the number of CPUs is printed with the results.
+
+    python benchmarks/pgn_parse.py --games 20000 --workers 1 2 4 8
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from league.pgnparse import parse_pgn_file, CHUNK_SIZE
+from pgn_scan import write_pgn
+
+
+def python_chess_games(path):
+    n = 0
+    with open(path) as f:
+        while chess.pgn.read_game(f) is not None:
+            n += 1
+    return n
+
+
+def pgnparse_games(path, workers, chunk_size):
+    return sum(1 for game in parse_pgn_file(path, workers, chunk_size))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.pgn')
+        with open(path, 'w') as f:
+            write_pgn(f, args.games)
+        print('%i games, %.1f MB, %i CPUs' % (args.games, os.path.getsize(path) / 1e6, os.cpu_count() or 1))
+        print('%-24s %8s %10s %12s %8s' % ('reader', 'games', 'ms', 'games/s', 'speedup'))
+
+        baseline, n = timed(python_chess_games, path)
+        print('%-24s %8i %10.1f %12.0f %8.2f' % ('python-chess read_game', n, baseline * 1000, n / baseline, 1.0))
+        for workers in sorted(set(args.workers)):
+            elapsed, n = timed(pgnparse_games, path, workers, args.chunk_size)
+            print('%-24s %8i %10.1f %12.0f %8.2f' % ('pgnparse, %i workers' % (workers), n, elapsed * 1000,
+                n / elapsed, baseline / elapsed))
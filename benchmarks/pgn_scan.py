@@ -0,0 +1,104 @@
+'''
+Reading the headers of every game of a large PGN file: league.pgnscan,
+python-chess reading only the headers, and python-chess parsing every game
+as get_games_from_pgn and add_puzzles.py used to.
+
+The file is made of --games games, Lichess style, their moves taken from a
+pool of random games. Full parsing is slow, it is timed on the first --full
+games and the time for the whole file estimated from it.
+
+    python benchmarks/pgn_scan.py --games 100000
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import chess
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from league.pgnscan import scan_pgn
+
+
+def random_movetext(rng, plies):
+    board = chess.Board()
+    moves = []
+    for i in range(plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        if board.turn == chess.WHITE:
+            moves += [ '%i.' % (board.fullmove_number) ]
+        moves += [ board.san(move) ]
+        board.push(move)
+    return ' '.join(moves)
+
+
+def write_pgn(f, ngames, seed=0, pool=200):
+    rng = random.Random(seed)
+    movetexts = [ random_movetext(rng, rng.randint(20, 120)) for i in range(pool) ]
+    for i in range(ngames):
+        result = rng.choice(['1-0', '0-1', '1/2-1/2'])
+        f.write('[Event "Wallasey Swiss"]\n[Site "https://lichess.org/g%07i"]\n[Date "2021.03.11"]\n'
+            '[Round "%i"]\n[White "player%03i"]\n[Black "player%03i"]\n[Result "%s"]\n[UTCDate "2021.03.11"]\n'
+            '[UTCTime "19:30:15"]\n[WhiteElo "1500"]\n[BlackElo "1500"]\n[Variant "Standard"]\n\n%s %s\n\n\n'
+            % (i, i % 7 + 1, rng.randrange(500), rng.randrange(500), result, rng.choice(movetexts), result))
+
+
+def pgnscan_headers(path):
+    with open(path, 'rb') as f:
+        return sum(1 for g in scan_pgn(f) if g.headers['Site'])
+
+
+def python_chess_headers(path):
+    n = 0
+    with open(path) as f:
+        while True:
+            headers = chess.pgn.read_headers(f)
+            if headers is None:
+                return n
+            n += 1 if headers['Site'] else 0
+
+
+def python_chess_games(path, limit):
+    n = 0
+    with open(path) as f:
+        while n < limit:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            n += 1 if game.headers['Site'] else 0
+    return n
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--full', type=int, default=5000, help='games parsed in full')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.pgn')
+        with open(path, 'w') as f:
+            write_pgn(f, args.games)
+        print('%i games, %.1f MB' % (args.games, os.path.getsize(path) / 1e6))
+        print('%-28s %8s %10s %12s' % ('reader', 'games', 'ms', 'games/s'))
+
+        for name, func, fargs in [
+                ('pgnscan headers', pgnscan_headers, (path,)),
+                ('python-chess read_headers', python_chess_headers, (path,)),
+                ('python-chess read_game', python_chess_games, (path, args.full)) ]:
+            elapsed, n = timed(func, *fargs)
+            print('%-28s %8i %10.1f %12.0f' % (name, n, elapsed * 1000, n / elapsed))
+            if n < args.games:
+                print('%-28s %8i %10.1f %12s' % ('  estimated whole file', args.games, elapsed * 1000 * args.games / n, ''))
@@ -0,0 +1,134 @@
+'''
+Query plans and timings of the hot Schedule lookups without and with the
+indexes of the Schedule model, on a synthetic club with 10 seasons of 5
+leagues each and 50,000 games.
+
+The indexes are dropped for the first measurement and created again for the
+second, the database is a throwaway test database.
+
+    python benchmarks/schedule_indexes.py --games 50000
+'''
+import argparse
+import datetime
+import random
+
+from common import setup_django, test_database, timed
+
+
+def seed(nseasons, nleagues, ngames, nplayers, seed=0):
+    from django.utils import timezone
+    from league.models import Season, League, Player, Schedule
+
+    rng = random.Random(seed)
+    players = Player.objects.bulk_create([
+        Player(name='Player', surename='%04i' % (i), rating=rng.randint(1000, 2400), lichess='player%04i' % (i))
+        for i in range(nplayers) ])
+    if players[0].pk is None:
+        players = list(Player.objects.order_by('pk'))
+
+    leagues = []
+    for s in range(nseasons):
+        year = 2010 + s
+        season = Season.objects.create(name='%i' % year, slug='season-%i' % year,
+            start=datetime.date(year, 1, 1), end=datetime.date(year, 12, 31))
+        for l in range(nleagues):
+            leagues += [ League.objects.create(season=season, name='League %i' % l, slug='league-%i-%i' % (year, l), format=l % 2) ]
+
+    per_league = ngames // len(leagues)
+    games = []
+    for league in leagues:
+        start = timezone.make_aware(datetime.datetime(league.season.start.year, 1, 1, 19, 30))
+        members = rng.sample(players, min(40, len(players)))
+        for i in range(per_league):
+            white, black = rng.sample(members, 2)
+            games += [ Schedule(league=league, white=white, black=black, round=i // 20 + 1,
+                date=start + datetime.timedelta(days=i // 20 * 7), result=rng.choice([0, 1, 2, 2, 1, 3]),
+                # about half the games were imported from Lichess
+                lichess='%s%06i' % (league.slug[-6:], i) if rng.random() < 0.5 else None) ]
+    Schedule.objects.bulk_create(games)
+    return leagues, players
+
+
+def hot_queries(leagues, players):
+    '''
+    The lookups of the standings, pairings, fixtures, player page, ECF export
+    and Lichess imports, as querysets
+    '''
+    from django.db.models import Q
+    from django.utils import timezone
+    from league.models import Schedule
+
+    league = leagues[len(leagues) // 2]
+    player = Schedule.objects.filter(league=league).values_list('white', flat=True).first()
+    some = list(Schedule.objects.filter(league=league).values_list('white', flat=True).distinct()[:3])
+    lichess = list(Schedule.objects.filter(league=league, lichess__isnull=False).values_list('lichess', flat=True)[:50])
+    start = timezone.make_aware(datetime.datetime(league.season.start.year, 3, 1))
+    return [
+        ('standings (league, white|black)', Schedule.objects.filter(Q(white__in=some) | Q(black__in=some), league=league)),
+        ('(league, white)', Schedule.objects.filter(league=league, white=player)),
+        ('(league, black)', Schedule.objects.filter(league=league, black=player)),
+        ('pairing (league, round)', Schedule.objects.filter(league=league, round=3)),
+        ('completed rounds (league, result)', Schedule.objects.filter(league=league).exclude(result=3).values('round').distinct()),
+        ('unplayed (league, result)', Schedule.objects.filter(league=league, result=3)),
+        ('fixtures (league) by date', Schedule.objects.filter(league=league).order_by('date')),
+        ('player page (white|black) by date', Schedule.objects.filter(Q(white=player) | Q(black=player)).order_by('date')),
+        ('ECF export (date range)', Schedule.objects.filter(date__range=(start, start + datetime.timedelta(days=30)))),
+        ('Lichess dedup (lichess in)', Schedule.objects.filter(lichess__in=lichess)),
+    ]
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, qs in queries:
+        plan = qs.explain()
+        best, result = timed(lambda: len(list(qs.all())), repeat)
+        results[name] = (best, result, plan)
+    return results
+
+
+def set_indexes(enabled):
+    from django.db import connection
+    from league.models import Schedule
+    with connection.schema_editor() as editor:
+        for index in Schedule._meta.indexes:
+            if enabled: editor.add_index(Schedule, index)
+            else: editor.remove_index(Schedule, index)
+        for constraint in Schedule._meta.constraints:
+            if enabled: editor.add_constraint(Schedule, constraint)
+            else: editor.remove_constraint(Schedule, constraint)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seasons', type=int, default=10)
+    parser.add_argument('--leagues', type=int, default=5, help='leagues per season')
+    parser.add_argument('--games', type=int, default=50000)
+    parser.add_argument('--players', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--plans', action='store_true', help='print the query plans')
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        leagues, players = seed(args.seasons, args.leagues, args.games, args.players)
+        queries = hot_queries(leagues, players)
+
+        set_indexes(False)
+        before = measure(queries, args.repeat)
+        set_indexes(True)
+        after = measure(queries, args.repeat)
+
+    print('%-36s %6s %10s %10s %8s' % ('query', 'rows', 'before ms', 'after ms', 'speedup'))
+    for name, qs in queries:
+        b, rows, plan_before = before[name]
+        a, rows, plan_after = after[name]
+        print('%-36s %6i %10.3f %10.3f %7.1fx' % (name, rows, b * 1000, a * 1000, b / a))
+        if args.plans:
+            print('    before: %s' % plan_before.replace('\n', '\n            '))
+            print('    after:  %s' % plan_after.replace('\n', '\n            '))
+
+
+if __name__ == '__main__':
+    main()
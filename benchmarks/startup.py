@@ -0,0 +1,97 @@
+'''
+Measures a cold worker start, django.setup() and importing the URLconf, in a
+fresh interpreter for each run, along with the peak RSS and which of the heavy
+dependencies were loaded on the way. --compare runs the same measurement on
+another revision, checked out in a temporary git worktree.
+
+The settings must point at a migrated database, the admin forms query it when
+they are imported.
+
+    python benchmarks/startup.py --runs 5 --compare HEAD~1
+'''
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('matplotlib', 'numpy', 'berserk', 'lichess', 'chess', 'swissdutch', 'fidetournament', 'openpyxl', 'requests')
+
+
+def child(root):
+    import resource
+    from importlib import import_module
+    sys.path.insert(0, root)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chessclub.settings')
+    start = time.perf_counter()
+    import django
+    django.setup()
+    setup = time.perf_counter() - start
+    from django.conf import settings
+    import_module(settings.ROOT_URLCONF)
+    total = time.perf_counter() - start
+    print(json.dumps({
+        'setup' : setup,
+        'total' : total,
+        # kilobytes on Linux
+        'maxrss' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'loaded' : [ m for m in HEAVY if m in sys.modules ],
+    }))
+
+
+def measure(root, runs):
+    results = []
+    for i in range(runs):
+        out = subprocess.run([ sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--child', root ],
+            cwd=root, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        results += [ json.loads(out.strip().splitlines()[-1]) ]
+    return {
+        'setup' : statistics.median(r['setup'] for r in results),
+        'total' : statistics.median(r['total'] for r in results),
+        'maxrss' : max(r['maxrss'] for r in results),
+        'loaded' : results[-1]['loaded'],
+    }
+
+
+def report(name, m):
+    print('%-12s setup %7.1f ms  setup+urls %7.1f ms  peak RSS %6.1f MB  heavy modules: %s' % (name,
+        m['setup'] * 1000, m['total'] * 1000, m['maxrss'] / 1024.0, ', '.join(m['loaded']) or '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--compare', metavar='REV', help='git revision to measure as well')
+    parser.add_argument('--json', action='store_true', help='print the measurements as JSON')
+    parser.add_argument('--child', metavar='ROOT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    measurements = {}
+    if args.compare:
+        worktree = tempfile.mkdtemp(prefix='startup-')
+        try:
+            subprocess.run([ 'git', 'worktree', 'add', '--detach', worktree, args.compare ], cwd=ROOT, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            measurements[args.compare] = measure(worktree, args.runs)
+        finally:
+            subprocess.run([ 'git', 'worktree', 'remove', '--force', worktree ], cwd=ROOT)
+            shutil.rmtree(worktree, ignore_errors=True)
+    measurements['working tree'] = measure(ROOT, args.runs)
+
+    if args.json:
+        print(json.dumps(measurements, indent=2))
+    else:
+        for name, m in measurements.items():
+            report(name, m)
+
+
+if __name__ == '__main__':
+    main()
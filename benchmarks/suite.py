@@ -0,0 +1,178 @@
+'''
+End to end benchmarks of the league code on a synthetic club made by
+league.synthetic, the same data as the generate_club_data command.
+
+Each case is timed, the best of --repeat runs, and its queries counted. The
+results are printed or written as JSON with --output, and compared against an
+earlier run with --baseline, to follow regressions from commit to commit:
+
+    python benchmarks/suite.py --output before.json
+    git checkout other-branch
+    python benchmarks/suite.py --baseline before.json
+'''
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from common import ROOT, setup_django, test_database, count_queries
+
+
+class MessageSite(object):
+    '''
+    Stands in for the admin site for the standings engine
+    '''
+    def message_user(self, request, message):
+        pass
+
+
+def run_case(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times += [ time.perf_counter() - start ]
+    return {
+        'best' : min(times),
+        'median' : statistics.median(times),
+        'queries' : count_queries(func),
+    }
+
+
+def get_cases(prefix):
+    '''
+    The benchmarked cases as (name, function), on the season in progress
+    '''
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import Client
+    from league.models import Season, League, Player, Schedule
+    from league import utils
+
+    season = Season.objects.filter(slug__startswith=prefix + '-').order_by('end').last()
+    leagues = { l.get_format_display() : l for l in League.objects.filter(season=season) }
+    league, swiss = leagues['League'], leagues['Swiss']
+    player = league.players.order_by('pk').first()
+
+    client = Client()
+    admin = Client()
+    admin.force_login(User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark'))
+
+    def standings_update():
+        utils.standings_update(MessageSite(), None, league)
+
+    def pairing():
+        from swissdutch.dutch import DutchPairingEngine
+        # the round in progress is paired again
+        rounds = swiss.get_rounds()
+        last_round = utils.get_last_round(swiss)
+        next_round = utils.get_next_round(max(rounds), DutchPairingEngine(), last_round)
+        utils.get_pairs(next_round)
+
+    def figure(make):
+        def func():
+            from matplotlib import pyplot as plt
+            plt.close(make(league))
+        return func
+
+    def page(url, cached=False):
+        def func():
+            if not cached:
+                cache.clear()
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return func
+
+    def ecf_export():
+        response = admin.post('/admin/league/schedule/exportgames/', {
+            'start_0' : season.start.strftime('%Y-%m-%d'), 'start_1' : '00:00:00',
+            'end_0' : season.end.strftime('%Y-%m-%d'), 'end_1' : '23:59:59',
+            'leagues' : [ l.pk for l in leagues.values() ],
+            'export_ecf_txt' : '1', 'ecf_code' : 'X', 'minutes' : '90',
+        })
+        assert response.status_code == 200, response.status_code
+
+    return [
+        ('standings_update', standings_update),
+        ('get_last_round + pairing', pairing),
+        ('make_table', figure(utils.make_table)),
+        ('make_crosstable', figure(utils.make_crosstable)),
+        ('view fixtures', page('/league/%s' % league.slug)),
+        ('view fixtures (cached)', page('/league/%s' % league.slug, cached=True)),
+        ('view swiss fixtures', page('/league/%s' % swiss.slug)),
+        ('view crosstable', page('/crosstable/%s' % league.slug)),
+        ('view player', page('/player/%i/' % player.pk)),
+        ('view season', page('/season/%s' % season.slug)),
+        ('view team fixtures', page('/team_fixtures/%s' % season.slug)),
+        ('view team squads', page('/team_squads/%s' % season.slug)),
+        ('ECF export', ecf_export),
+    ]
+
+
+def revision():
+    try:
+        return subprocess.run([ 'git', 'describe', '--always', '--dirty' ], cwd=ROOT, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    print('%-28s %10s %10s %8s' % ('case', 'best ms', 'median ms', 'queries') + ('  vs baseline' if baseline else ''))
+    for name, r in results['cases'].items():
+        line = '%-28s %10.2f %10.2f %8i' % (name, r['best'] * 1000, r['median'] * 1000, r['queries'])
+        if baseline and name in baseline['cases']:
+            b = baseline['cases'][name]
+            line += '  %5.2fx time, %+i queries' % (r['best'] / b['best'], r['queries'] - b['queries'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--players', type=int, default=60)
+    parser.add_argument('--league-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cases', nargs='*', help='only run the cases with these words in their names')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    setup_django()
+    import django
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    with test_database():
+        from league.synthetic import generate_club
+        start = time.perf_counter()
+        dataset = generate_club(seasons=args.seasons, players=args.players, league_size=args.league_size, prefix='bench')
+        dataset['seconds'] = time.perf_counter() - start
+        results = {
+            'revision' : revision(),
+            'python' : platform.python_version(),
+            'django' : django.get_version(),
+            'arguments' : { k : v for k, v in vars(args).items() if k not in ('output', 'baseline') },
+            'dataset' : dataset,
+            'cases' : {},
+        }
+        for name, func in get_cases('bench'):
+            if args.cases and not any(word in name for word in args.cases):
+                continue
+            results['cases'][name] = run_case(func, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
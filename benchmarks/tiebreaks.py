@@ -0,0 +1,84 @@
+'''
+Times the score matrix tie breaks on a simulated open, against the per
+player list loops they replaced.
+
+    python benchmarks/tiebreaks.py --players 500 --rounds 11
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from league.tiebreaks import ScoreMatrix
+
+
+def simulate(nplayers, nrounds, seed=0):
+    '''
+    Random pairings and results, returns the points of each player and a list
+    of (player, opponent, score) from the point of view of each player
+    '''
+    rng = random.Random(seed)
+    players = list(range(nplayers))
+    points = [0.0] * nplayers
+    results = []
+    for r in range(nrounds):
+        rng.shuffle(players)
+        for white, black in zip(players[::2], players[1::2]):
+            score = rng.choice([1.0, 0.5, 0.0])
+            points[white] += score
+            points[black] += 1.0 - score
+            results += [ (white, black, score), (black, white, 1.0 - score) ]
+    return points, results
+
+
+def python_tiebreaks(points, ratings, results):
+    against = { p : [] for p in range(len(points)) }
+    for p, o, score in results:
+        against[p] += [ (o, score) ]
+    tiebreaks = {}
+    for p, games in against.items():
+        nbs = sum(score * points[o] for o, score in games)
+        scores = [ points[o] for o, score in games ]
+        opp_ratings = [ ratings[o] for o, score in games ]
+        buchholz = sum(scores)
+        tiebreaks[p] = (nbs, buchholz, buchholz - min(scores), (sum(opp_ratings) - min(opp_ratings)) / max(1, len(opp_ratings) - 1))
+    return tiebreaks
+
+
+def numpy_tiebreaks(points, ratings, rows, cols, scores):
+    matrix = ScoreMatrix(range(len(points)), points, ratings)
+    matrix.add_games(rows, cols, scores)
+    return (matrix.sonneborn_berger(), matrix.buchholz(), matrix.buchholz_cut1(),
+        matrix.median_buchholz(), matrix.opponent_rating(), matrix.performance())
+
+
+def best_of(repeat, fn, *args):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=11)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    points, results = simulate(args.players, args.rounds)
+    ratings = [ random.Random(p).randint(1000, 2400) for p in range(args.players) ]
+
+    t_python = best_of(args.repeat, python_tiebreaks, points, ratings, results)
+    rows, cols, scores = (np.array(c) for c in zip(*results))
+    t_numpy = best_of(args.repeat, numpy_tiebreaks, points, ratings, rows, cols, scores)
+    print('%i players, %i rounds' % (args.players, args.rounds))
+    print('python lists: %8.2f ms' % (t_python * 1000))
+    print('score matrix: %8.2f ms' % (t_numpy * 1000))
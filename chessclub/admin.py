@@ -8,7 +8,7 @@ from django.conf.urls import url, include
 
 from content.models import htmlobject
 
-from .views import preview
+from .views import preview, instrumentation
 
 
 class MyAdminSite(AdminSite):
@@ -28,7 +28,8 @@ class MyAdminSite(AdminSite):
         urls = super().get_urls()
 
         my_urls = [
-            url(r'^preview/$', self.admin_view(preview))
+            url(r'^preview/$', self.admin_view(preview)),
+            url(r'^instrumentation/$', self.admin_view(instrumentation), name='instrumentation'),
         ]
 
         return my_urls + urls
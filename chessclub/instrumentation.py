@@ -0,0 +1,184 @@
+'''
+Optional per-request instrumentation: the wall time, number of SQL queries
+and time spent in SQL of every request, by view, with the queries repeated
+within a request, the N+1 patterns, found by their fingerprint, the SQL with
+its literals taken out.
+
+The middleware is switched on with REQUEST_INSTRUMENTATION, when off Django
+drops it from the middleware chain at startup so it costs nothing. Requests
+slower than REQUEST_INSTRUMENTATION_SLOW_MS, or repeating a query more than
+REQUEST_INSTRUMENTATION_DUPLICATES times, are logged to the
+chessclub.instrumentation logger. The last REQUEST_INSTRUMENTATION_WINDOW
+seconds of requests are kept in memory, per process, and summed up on a
+staff-only admin page.
+'''
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# most requests kept whatever the window
+MAX_RECORDS = 10000
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|[\d.]+|\'\?\')\s*,?)+\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    '''
+    The SQL of a query with its parameters and literals replaced by ?, so
+    that the same query for different rows gives the same fingerprint
+    '''
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestRecord(object):
+    '''
+    The measurements of one request, filled in by QueryRecorder while it runs
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.view = None
+        self.status = None
+        self.started = time.time()
+        self.wall = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+
+    def duplicates(self):
+        '''
+        The fingerprints run more than once, with their counts
+        '''
+        return { sql : n for sql, n in self.fingerprints.items() if n > 1 }
+
+
+class QueryRecorder(object):
+    '''
+    An execute wrapper, see connection.execute_wrapper, counting and timing
+    the queries of a request
+    '''
+    def __init__(self, record):
+        self.record = record
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record.sql_time += time.perf_counter() - start
+            self.record.queries += 1
+            self.record.fingerprints[fingerprint(sql)] += 1
+
+
+class RequestLog(object):
+    '''
+    The requests of the last window seconds
+    '''
+    def __init__(self, maxlen = MAX_RECORDS):
+        self.records = deque(maxlen = maxlen)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def recent(self, window = None):
+        if window is None:
+            window = get_setting('REQUEST_INSTRUMENTATION_WINDOW', 3600)
+        since = time.time() - window
+        with self.lock:
+            while self.records and self.records[0].started < since:
+                self.records.popleft()
+            return list(self.records)
+
+    def summary(self, window = None):
+        '''
+        The requests of the window by view, slowest total first, as a list
+        of dicts
+        '''
+        views = {}
+        for r in self.recent(window):
+            v = views.get(r.view)
+            if v is None:
+                v = views[r.view] = { 'view' : r.view, 'requests' : 0, 'wall' : 0.0, 'max_wall' : 0.0,
+                    'queries' : 0, 'max_queries' : 0, 'sql_time' : 0.0, 'duplicates' : Counter() }
+            v['requests'] += 1
+            v['wall'] += r.wall
+            v['max_wall'] = max(v['max_wall'], r.wall)
+            v['queries'] += r.queries
+            v['max_queries'] = max(v['max_queries'], r.queries)
+            v['sql_time'] += r.sql_time
+            for sql, n in r.duplicates().items():
+                v['duplicates'][sql] = max(v['duplicates'][sql], n)
+
+        summary = sorted(views.values(), key = lambda v : v['wall'], reverse = True)
+        for v in summary:
+            n = v['requests']
+            v['mean_wall'] = v['wall'] / n
+            v['mean_queries'] = v['queries'] / n
+            v['mean_sql_time'] = v['sql_time'] / n
+            # the most repeated queries, with the most times in one request
+            v['duplicates'] = v['duplicates'].most_common(5)
+        return summary
+
+
+REQUEST_LOG = RequestLog()
+
+
+class InstrumentationMiddleware(object):
+    '''
+    Records every request into REQUEST_LOG and logs the slow ones
+    '''
+    def __init__(self, get_response):
+        if not get_setting('REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        record = RequestRecord(request.path)
+        recorder = QueryRecorder(record)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        record.wall = time.perf_counter() - start
+        record.status = response.status_code
+
+        match = getattr(request, 'resolver_match', None)
+        record.view = match.view_name if match is not None else request.path
+        REQUEST_LOG.add(record)
+        self.log(record)
+        return response
+
+    def log(self, record):
+        slow = get_setting('REQUEST_INSTRUMENTATION_SLOW_MS', 500)
+        if record.wall * 1000 >= slow:
+            logger.warning('slow request %s (%s): %.0f ms, %i queries in %.0f ms',
+                record.path, record.view, record.wall * 1000, record.queries, record.sql_time * 1000)
+        repeated = get_setting('REQUEST_INSTRUMENTATION_DUPLICATES', 10)
+        for sql, n in record.duplicates().items():
+            if n > repeated:
+                logger.warning('%s (%s) ran the same query %i times: %s', record.path, record.view, n, sql)
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_user_agents.middleware.UserAgentMiddleware',
+    'chessclub.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'chessclub.urls'
@@ -165,3 +166,59 @@ TINYMCE_DEFAULT_CONFIG = {
     }
 
 APPEND_SLASH = True
+
+# how the league table and crosstable PDFs are drawn, 'matplotlib' or the
+# lightweight 'native' writer
+LEAGUE_PDF_BACKEND = os.environ.get('LEAGUE_PDF_BACKEND', 'matplotlib')
+
+# the cached pages, PDFs and pairing jobs are shared by every process serving
+# the site through a file-based cache, a local-memory one would leave the
+# other processes serving pages out of date until they expire
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, 'django_cache')),
+        'OPTIONS': { 'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', 5000)) },
+    }
+}
+
+# seconds the public league pages stay cached, they are invalidated as soon
+# as a league changes but the site notification is only picked up on expiry
+LEAGUE_PAGE_CACHE_TIMEOUT = int(os.environ.get('LEAGUE_PAGE_CACHE_TIMEOUT', 600))
+
+# check the stored Swiss pairing state against a replay of every round each
+# time a round is paired
+LEAGUE_PAIRING_VERIFY = os.environ.get('LEAGUE_PAIRING_VERIFY', '0') == '1'
+
+# Swiss rounds are paired in the background, when the cache above is shared
+# by the processes, the pairing engine is given the budget in seconds before
+# the round is paired by score instead, and runs in a child 'process' or a
+# 'thread'
+LEAGUE_PAIRING_BACKGROUND = os.environ.get('LEAGUE_PAIRING_BACKGROUND', '1') == '1'
+LEAGUE_PAIRING_BUDGET = int(os.environ.get('LEAGUE_PAIRING_BUDGET', 30))
+LEAGUE_PAIRING_WORKER = os.environ.get('LEAGUE_PAIRING_WORKER', 'process')
+
+# the pairing engine offered first, 'dutch' or the weighted 'matching'
+LEAGUE_PAIRING_ENGINE = os.environ.get('LEAGUE_PAIRING_ENGINE', 'dutch')
+
+# the server games are imported from, the tests point it at a local one
+LICHESS_URL = os.environ.get('LICHESS_URL', 'https://lichess.org')
+
+# at most this many requests to Lichess at once, spaced to the rate, in
+# requests a second, with bursts of up to LICHESS_BURST. A rate limited
+# request is tried again LICHESS_RETRIES times. The exports of finished
+# tournaments and games are kept in the cache directory, none if it is empty
+LICHESS_CONCURRENCY = int(os.environ.get('LICHESS_CONCURRENCY', 4))
+LICHESS_RATE = float(os.environ.get('LICHESS_RATE', 2))
+LICHESS_BURST = int(os.environ.get('LICHESS_BURST', 4))
+LICHESS_RETRIES = int(os.environ.get('LICHESS_RETRIES', 3))
+LICHESS_CACHE_DIR = os.environ.get('LICHESS_CACHE_DIR', os.path.join(BASE_DIR, 'lichess_cache'))
+
+# per-request timing and query counts, summed up at /admin/instrumentation/,
+# off unless REQUEST_INSTRUMENTATION=1. Requests slower than the threshold, in
+# milliseconds, or running the same query more than the given number of
+# times are logged, the summary covers the window, in seconds
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', '0') == '1'
+REQUEST_INSTRUMENTATION_SLOW_MS = int(os.environ.get('REQUEST_INSTRUMENTATION_SLOW_MS', 500))
+REQUEST_INSTRUMENTATION_DUPLICATES = int(os.environ.get('REQUEST_INSTRUMENTATION_DUPLICATES', 10))
+REQUEST_INSTRUMENTATION_WINDOW = int(os.environ.get('REQUEST_INSTRUMENTATION_WINDOW', 3600))
@@ -64,3 +64,18 @@ def page_not_found(request, *args, **kwargs):
 
 def server_error(request, *args, **kwargs):
     return render(request, "500.html", *args, **kwargs)
+
+def instrumentation(request):
+    from django.conf import settings
+    from .instrumentation import REQUEST_LOG
+    window = getattr(settings, 'REQUEST_INSTRUMENTATION_WINDOW', 3600)
+    return render(
+        request,
+        "admin/instrumentation.html",
+        {
+            "enabled": getattr(settings, 'REQUEST_INSTRUMENTATION', False),
+            "window": window // 60,
+            "views": REQUEST_LOG.summary(window),
+            "title": "Request instrumentation",
+        },
+    )
@@ -4,7 +4,7 @@ from tinymce.widgets import TinyMCE
 from django import forms
 from functools import update_wrapper
 from .forms import LichessEventForm
-from league.utils import create_arena_event
+from league import utils
 import datetime
 from django.utils import timezone
 from django.core.mail import send_mail
@@ -68,7 +68,7 @@ class EventAdmin(admin.ModelAdmin):
             date = request.POST.get('datetime_0')
             time = request.POST.get('datetime_1')
             tournament_datetime = datetime.datetime.strptime('%s %s'%(date,time), '%Y-%m-%d %H:%M:%S')
-            tournament = create_arena_event(request.POST.get('name'), tournament_datetime, time = request.POST.get('time'), increment = request.POST.get('increment'),
+            tournament = utils.create_arena_event(request.POST.get('name'), tournament_datetime, time = request.POST.get('time'), increment = request.POST.get('increment'),
             duration = request.POST.get('duration'))
             lichess_event = event(title=tournament['fullName'],date=tournament_datetime,link='https://lichess.org/tournament/'+tournament['id'], location='Lichess Online')
             lichess_event.save()
@@ -10,7 +10,7 @@ from django.urls import resolve, reverse
 from django.utils.safestring import mark_safe
 from django import forms
 from datetime import datetime
-from .utils import standings_save, standings_update
+from .utils import standings_save, standings_update, standings_rebuild, standings_games_update, standings_check
 from django.contrib.admin import DateFieldListFilter, SimpleListFilter
 
 from django.template.defaultfilters import slugify
@@ -19,7 +19,6 @@ from django_reverse_admin import ReverseModelAdmin
 
 
 from django.forms import BaseInlineFormSet
-import requests
 
 import utils
 
@@ -125,9 +124,8 @@ from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
 
-from matplotlib.backends.backend_pdf import PdfPages
 from django.http import HttpResponse
-from io import BytesIO
+from .pdf import export_pdfs
 
 class LeagueAdmin(ModelAdmin):
     change_form_template = 'change_form.html'
@@ -148,14 +146,20 @@ class LeagueAdmin(ModelAdmin):
         return mark_safe("<a href='%s' target='blank'>Open</a>" % url)
 
     #prepopulated_fields = {'slug': ('name', 'season_name',), }
-    actions=['update_standings', 'make_pdf', 'make_crosstable', 'update_ratings', 'update_historical_ratings']
+    actions=['update_standings', 'check_standings', 'make_pdf', 'make_crosstable', 'update_ratings', 'update_historical_ratings']
     list_display = ('name','link')
     def update_standings(self,request,queryset):
         for obj in queryset:
-            standings_save(self, request, obj)
-            standings_update(self, request, obj)
+            standings_rebuild(self, request, obj)
             self.message_user(request, "Standings for %s updated"%(obj))
 
+    def check_standings(self, request, queryset):
+        for obj in queryset:
+            diffs = standings_check(obj)
+            for s, field, stored, expected in diffs:
+                self.message_user(request, "%s: %s is %s but should be %s"%(s.player, field, stored, expected))
+            self.message_user(request, "Standings for %s have %i inconsistencies"%(obj, len(diffs)))
+
     def update_ratings(self,request,queryset):
         for obj in queryset:
             standings = Standings.objects.filter(league=obj)
@@ -176,6 +180,7 @@ class LeagueAdmin(ModelAdmin):
                     self.message_user(request, '%s has no ECF code currently'%(p))
                     continue
                 url = 'https://www.ecfrating.org.uk/v2/new/api.php?v2/ratings/Standard/%s/%s'%(p.ecf, ratings_date)
+                import requests
                 grade = requests.get(url)
                 if grade:
                     grade = grade.json()
@@ -193,30 +198,14 @@ class LeagueAdmin(ModelAdmin):
         response = HttpResponse(content_type='application/pdf')
         filename = 'league_tables'
         response['Content-Disposition'] = 'attachement; filename={0}.pdf'.format(filename)
-        buffer = BytesIO()
-        with PdfPages(buffer) as pdf:
-            for obj in queryset:
-                fig = make_table(obj)
-                pdf.savefig()
-
-        pdf = buffer.getvalue()
-        buffer.close()
-        response.write(pdf)
+        response.write(export_pdfs('table', queryset.select_related('season')))
         return response
 
     def make_crosstable(self, request, queryset):
         response = HttpResponse(content_type='application/pdf')
         filename = 'league_crosstables'
         response['Content-Disposition'] = 'attachement; filename={0}.pdf'.format(filename)
-        buffer = BytesIO()
-        with PdfPages(buffer) as pdf:
-            for obj in queryset:
-                fig = make_crosstable(obj)
-                pdf.savefig()
-
-        pdf = buffer.getvalue()
-        buffer.close()
-        response.write(pdf)
+        response.write(export_pdfs('crosstable', queryset.select_related('season')))
         return response
 
 
@@ -313,6 +302,7 @@ class PlayerAdmin(admin.ModelAdmin):
                 self.message_user(request, '%s has no ECF code currently'%(p))
                 continue
             url = 'https://www.ecfrating.org.uk/v2/new/api.php?v2/ratings/Standard/%s/%s'%(p.ecf, datetime.today().date())
+            import requests
             grade = requests.get(url)
             if grade:
                 grade = grade.json()
@@ -351,6 +341,8 @@ class ScheduleAdmin(ReverseModelAdmin):
         return urls + super_urls
 
     def save_model(self, request, obj, form, change):
+        # the players before the change also need their standings updated
+        games = list(Schedule.objects.filter(pk=obj.pk).values_list('league', 'white', 'black')) if change else []
         super(ScheduleAdmin, self).save_model(request, obj, form, change)
         if not change and (not obj.white_rating or not obj.black_rating):
             if obj.white:
@@ -358,6 +350,12 @@ class ScheduleAdmin(ReverseModelAdmin):
             if obj.black:
                 obj.black_rating = obj.black.rating
             obj.save()
+        standings_games_update(self, request, games + [(obj.league_id, obj.white_id, obj.black_id)])
+
+    def delete_model(self, request, obj):
+        game = (obj.league_id, obj.white_id, obj.black_id)
+        super(ScheduleAdmin, self).delete_model(request, obj)
+        standings_games_update(self, request, [game])
 
     def update_ratings(self,request,queryset):
         for obj in queryset:
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class leagueConfig(AppConfig):
     name = 'league'
+
+    def ready(self):
+        # connect the invalidation of the cached league pages
+        from . import signals
@@ -0,0 +1,116 @@
+'''
+The games of a player for their profile page and their career summary. The
+games shown are read with one query over the season or league selected, or,
+when the summary is not cached, with one query over every game the player
+has played, which the summary is built from too.
+
+The summary, games, score and performance for each season, is cached per
+player. league.signals drops it when one of their games is saved or deleted.
+'''
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Schedule
+
+# results of games played over the board, forfeits and unplayed games are
+# left out of the summary
+PLAYED_SCORES = { 0 : (0.5, 0.5), 1 : (1, 0), 2 : (0, 1) }
+
+
+def get_player_games(player, season = None, league = None):
+    '''
+    The games of a player, every one or only those of a season or league,
+    oldest first, with both players and the league and its season joined in
+    '''
+    games = Schedule.objects.filter(Q(white = player.pk) | Q(black = player.pk))
+    if league is not None:
+        games = games.filter(league = league.pk)
+    if season is not None:
+        games = games.filter(league__season = season.pk)
+    return list(games.select_related('white', 'black', 'league', 'league__season').order_by('date', 'pk'))
+
+
+class SeasonRecord(object):
+    '''
+    The games played by a player over a season
+    '''
+    def __init__(self, season):
+        self.season = season
+        self.games = 0
+        self.score = 0.0
+        # for the performance rating
+        self.rated_games = 0
+        self.rated_total = 0.0
+
+    def add(self, game, player_id):
+        if game.result not in PLAYED_SCORES:
+            return
+        white = game.white_id == player_id
+        score = PLAYED_SCORES[game.result][0 if white else 1]
+        self.games += 1
+        self.score += score
+        # the rating of the opponent when the game was played
+        if white:
+            rating = game.black_rating or (game.black.rating if game.black else None)
+        else:
+            rating = game.white_rating or (game.white.rating if game.white else None)
+        if rating and rating > 0:
+            self.rated_games += 1
+            self.rated_total += rating + 400 * (2 * score - 1)
+
+    def performance(self):
+        if self.rated_games > 0:
+            return self.rated_total / self.rated_games
+        return 0.0
+
+
+def career_cache_key(player_id):
+    return 'player-career-%s' % (player_id)
+
+
+def invalidate_careers(*player_ids):
+    cache.delete_many([ career_cache_key(p) for p in player_ids if p is not None ])
+
+
+def player_page(player, season = None, league = None):
+    '''
+    The games of a player in league, or in every league of season, grouped
+    by league, along with their career summary as a list of SeasonRecord,
+    most recent season first. The summary is taken from the cache when there,
+    and only the games shown are read, otherwise it is computed in the same
+    pass over every game of the player.
+    '''
+    key = career_cache_key(player.pk)
+    career = cache.get(key)
+    records = None if career is not None else {}
+
+    if career is not None:
+        games = get_player_games(player, season, league)
+    else:
+        games = get_player_games(player)
+    by_league = {}
+    for g in games:
+        if g.league is None:
+            continue
+        if records is not None:
+            s = g.league.season
+            if s.pk not in records:
+                records[s.pk] = SeasonRecord(s)
+            records[s.pk].add(g, player.pk)
+        if league is not None and g.league_id != league.pk:
+            continue
+        if season is not None and g.league.season_id != season.pk:
+            continue
+        by_league.setdefault(g.league, []).append(g)
+
+    if records is not None:
+        career = sorted(records.values(), key = lambda r : (r.season.end is not None, r.season.end), reverse = True)
+        cache.set(key, career, getattr(settings, 'LEAGUE_PAGE_CACHE_TIMEOUT', 600))
+
+    # in the order of the leagues
+    by_league = dict(sorted(by_league.items(), key = lambda item : item[0].pk))
+    for l, games in by_league.items():
+        # for the round column of the game list
+        l.has_rounds = any(g.round is not None for g in games)
+    return by_league, career
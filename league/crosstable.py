@@ -0,0 +1,80 @@
+from .models import Schedule, Standings
+
+
+def format_points(points):
+    '''
+    Points as shown in a crosstable cell, halves as a vulgar fraction
+    '''
+    if points is None:
+        return ''
+    whole, half = int(points), points % 1 == 0.5
+    if half:
+        return '%s½' % (whole if whole else '')
+    return '%i' % whole
+
+
+class Crosstable(object):
+    '''
+    Results between every pair of players of a league.
+
+    Rows and columns follow the standings, so cell (i, j) holds the points the
+    player on row i took from the player on row j as a (white points, black
+    points) pair, either of them None when they have not played with that
+    colour. Only games with a result are counted.
+    '''
+    def __init__(self, league, standings, games):
+        self.league = league
+        self.standings = list(standings)
+        self.index = { s.player_id : i for i, s in enumerate(self.standings) }
+        n = len(self.standings)
+        self.cells = [ [ (None, None) for j in range(n) ] for i in range(n) ]
+
+        win  = league.get_win_points_display()
+        draw = league.get_draw_points_display()
+        lost = league.get_lost_points_display()
+        # points for white and black for each result
+        points = { 0 : (draw, draw), 1 : (win, lost), 2 : (lost, win) }
+        for g in games:
+            if g.result == 3: continue
+            i, j = self.index.get(g.white_id), self.index.get(g.black_id)
+            if i is None or j is None: continue
+            white, black = points.get(g.result, (0, 0))
+            self.add(i, j, 0, white)
+            self.add(j, i, 1, black)
+
+    def add(self, i, j, colour, points):
+        cell = list(self.cells[i][j])
+        cell[colour] = (cell[colour] or 0) + points
+        self.cells[i][j] = tuple(cell)
+
+    def __len__(self):
+        return len(self.standings)
+
+    def __getitem__(self, key):
+        i, j = key
+        return self.cells[i][j]
+
+    def rows(self):
+        '''
+        (standing, cells) for each player in standings order
+        '''
+        return zip(self.standings, self.cells)
+
+    def cell_text(self, i, j, separator = '\n'):
+        '''
+        The white points over the black points, as in the printed crosstable
+        '''
+        white, black = self.cells[i][j]
+        if white is None and black is None:
+            return ''
+        return format_points(white) + separator + format_points(black)
+
+
+def build_crosstable(league):
+    '''
+    Crosstable of a league from one query for the standings and one for the
+    games
+    '''
+    standings = Standings.objects.filter(league = league.pk).select_related('player').order_by('position', 'player__surename')
+    games = Schedule.objects.filter(league = league.pk).only('white', 'black', 'result')
+    return Crosstable(league, standings, games)
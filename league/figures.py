@@ -0,0 +1,146 @@
+'''
+Drawing of the league table and crosstable PDFs.
+
+The figures are drawn from plain data, lists of strings and numbers built by
+table_data and crosstable_data in league.utils, and nothing here touches
+Django so that the drawing can run in a worker process.
+'''
+import matplotlib
+import matplotlib.image as image
+from matplotlib import pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+matplotlib.use("pdf") ## Include this line to make PDF output
+
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import cycle
+from functools import lru_cache
+import os
+
+@lru_cache(maxsize=None)
+def get_logo(path):
+    '''
+    The club logo for the PDFs, read from disk once per process
+    '''
+    return image.imread(path)
+
+def draw_table(data):
+    fig, (ax1, ax2) = plt.subplots(figsize=(8.27, 11.69), nrows=2, gridspec_kw={'height_ratios': [1, 19], 'hspace' : 0.15})
+    ax1.set_axis_off()
+    ax2.set_axis_off()
+    rows = data['rows']
+    ax2.text(0.5, 1.02, data['title'], horizontalalignment='center', verticalalignment='center', fontsize=20.0)
+    table = ax2.table(
+        cellText = rows,
+        colLabels = ['Name', 'P', 'W', 'D', 'L', 'Pts'],
+        colWidths = [0.4, 0.12, 0.12, 0.12, 0.12, 0.12],
+        cellLoc ='center',
+        cellColours = [ [c for i in range(6)] for j,c in zip(range(len(rows)),cycle([(1,1,1,1.0), (0,0,0,0.1)])) ],
+        loc ='upper left',
+        rowLabels = data['positions'],
+    )
+    table.auto_set_font_size(False)
+    table.set_fontsize(14)
+    table_props = table.properties()
+    for i,c in table_props['celld'].items():
+        c.set_height(0.03)
+
+
+    ax2.text(0.5, 0.05, "Last updated on %s"%(data['updated']), horizontalalignment='center', verticalalignment='center')
+
+    ax1.imshow(get_logo(data['logo']))
+
+    return fig
+
+def draw_crosstable(data):
+    fig, (ax1, ax2) = plt.subplots(figsize=(11.69, 8.27), nrows=2, gridspec_kw={'height_ratios': [1, 19], 'hspace' : 0.15})
+    plt.subplots_adjust(left=0.1, right=0.9, top=0.95, bottom=0.05)
+    ax1.set_axis_off()
+    ax2.set_axis_off()
+    n = len(data['rows'])
+    ax2.text(0.5, 1.02, data['title'], horizontalalignment='center', verticalalignment='center', fontsize=20.0)
+
+    cellColours = []
+    colLabels = ['Name'] + [str(i+1) for i in range(n)] + ['P','W','D','L','Pts' ]
+    for i in range(n):
+        rowColour = [ (1, 1, 1, 1.0) ]
+        for j in range(n):
+            if i == j: rowColour += [ (0,0,0,0.2)]
+            else: rowColour += [(1,1,1,1.0)]
+        rowColour += [(1,1,1,1.0), (1,1,1,1.0), (1,1,1,1.0), (1,1,1,1.0), (1,1,1,1.0)]
+        cellColours += [ rowColour ]
+
+
+    crosstable = ax2.table(
+        cellText = data['rows'],
+        colLabels = colLabels,
+        colWidths = [0.2] + n * [ (1.0 - 0.2 - 0.05*5)/n ] + ([ 0.05]*5),
+        cellColours = cellColours,
+        cellLoc ='center',
+        loc ='upper left',
+        rowLabels = data['positions'],
+    )
+
+    crosstable.auto_set_font_size(False)
+    crosstable.set_fontsize(min(10, int(200.0/n)))
+    crosstable_props = crosstable.properties()
+    for i,c in crosstable_props['celld'].items():
+        c.set_height(min(0.06,0.9/n))
+
+    cells = [key for key in crosstable._cells if ((key[1] in [-1,0] + [ n + i for i in [1,2,3,4,5] ]) or (key[0] == 0)) ]
+    for cell in cells:
+        crosstable._cells[cell].get_text().set_ha('right')
+        font_size = min(14, int(280.0/n))
+        text_size = len(crosstable._cells[cell].get_text().get_text())
+        # reduce font size if we really have a lot of text
+        if text_size > 15:
+            font_size = 15.0 / text_size * font_size
+
+
+        crosstable._cells[cell].set_fontsize(font_size)
+    ax2.text(0.5, 0.01, "Last updated on %s"%(data['updated']), horizontalalignment='center', verticalalignment='center')
+
+    ax1.imshow(get_logo(data['logo']))
+
+    return fig
+
+DRAW = { 'table' : draw_table, 'crosstable' : draw_crosstable }
+
+def render(kind, data):
+    '''
+    Render the PDF of one league, the figure is closed once saved
+    '''
+    fig = DRAW[kind](data)
+    buffer = BytesIO()
+    try:
+        fig.savefig(buffer, format="pdf")
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_many(kind, data, workers = None):
+    '''
+    One PDF with a page for each item of data. The pages are drawn and saved
+    in a pool of worker processes, the number of CPUs by default, each
+    returning the PDF of its page, and joined here in order. With one worker
+    the pages are saved straight into the document in this process.
+    '''
+    workers = min(workers or os.cpu_count() or 1, len(data))
+    if workers <= 1:
+        buffer = BytesIO()
+        with PdfPages(buffer) as pdf:
+            for d in data:
+                fig = DRAW[kind](d)
+                try:
+                    pdf.savefig(fig)
+                finally:
+                    plt.close(fig)
+        return buffer.getvalue()
+
+    from .pdfwriter import PdfDocument
+    document = PdfDocument()
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for page in executor.map(render, [ kind ] * len(data), data):
+            document.add_pdf(page)
+    return document.write()
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.admin import widgets
-from .models import Player, Schedule, League, Season
+from .models import Player, Schedule, League, Season, PAIRING_ENGINES
+from django.conf import settings
 from datetime import datetime, timedelta
 from django.db.models import Q
 
@@ -11,15 +12,20 @@ class RoundForm(forms.Form):
     datetime = forms.DateTimeField(label='Date for Next Round', widget = widgets.AdminSplitDateTime, )
     last_round = forms.BooleanField(label='Last Round', initial = False, required = False)
     byes    = forms.ModelMultipleChoiceField( required = False, label = 'Byes', queryset = Player.objects.all() )
+    engine  = forms.ChoiceField(label = 'Pairing Engine', choices = PAIRING_ENGINES,
+        initial = lambda : getattr(settings, 'LEAGUE_PAIRING_ENGINE', 'dutch'))
 class RoundRobinForm(forms.Form):
     datetime = forms.DateTimeField(label='Date for Round Robin', widget = widgets.AdminSplitDateTime, )
 
 class LichessArenaForm(forms.Form):
     lichess_arena_id = forms.CharField(label='Lichess Arena ID', max_length=100)
+    dry_run = forms.BooleanField(label='Dry Run', initial = False, required = False)
 class LichessSwissForm(forms.Form):
     lichess_swiss_id = forms.CharField(label='Lichess Swiss ID', max_length=100)
+    dry_run = forms.BooleanField(label='Dry Run', initial = False, required = False)
 class LichessGameForm(forms.Form):
     lichess_game_id = forms.CharField(label='Lichess Game ID', max_length=100)
+    dry_run = forms.BooleanField(label='Dry Run', initial = False, required = False)
 class PrintRoundForm(forms.Form):
     round_no = forms.ChoiceField(label="Round No.", choices = [0,1,2])
 
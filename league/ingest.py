@@ -0,0 +1,193 @@
+'''
+Importing games played on Lichess into a league, for the manage league page
+and the add_lichess.py script.
+
+The games come as an iterable of (Lichess id, game dict), as yielded by the
+helpers of lichess_client, and are taken BATCH_SIZE at a time: the players
+and the games already in the database are looked up with one query each for
+the whole batch, and the new games and their PGNs are inserted with
+bulk_create, so the number of queries does not grow with the number of games.
+The standings are recomputed once at the end.
+
+With dry_run nothing is written, the report tells what an import would do.
+With validate_pgn the PGNs are parsed, in a pool of workers, by pgnparse.
+'''
+import itertools
+
+from django.db import connection, transaction
+
+from .models import Player, Schedule, PGN
+from .standings import save_games, standings_rebuild
+from .pagecache import bump_league_version, invalidate_league_pages
+from .career import invalidate_careers
+from .signals import invalidate_pairing_states
+
+# games resolved and inserted together, a whole tournament in one go
+BATCH_SIZE = 1000
+
+
+class IngestResult(object):
+    '''
+    The report of an import, by Lichess id: the games added, moved from
+    another league as (id, game, league name), already in the league, and
+    skipped as (id, Lichess name of the unknown player), with the players
+    in the database but not the league. With validate_pgn the PGNs of the
+    new games are parsed, those python-chess finds errors in are not stored
+    and listed in invalid_pgn as (id, error). It stands in for the admin site
+    for the standings, their messages are kept in warnings.
+    '''
+    def __init__(self, dry_run = False, validate_pgn = False):
+        self.dry_run = dry_run
+        self.validate_pgn = validate_pgn
+        self.invalid_pgn = []
+        self.added = []
+        self.moved = []
+        self.existing = []
+        self.unknown = []
+        self.not_in_league = set()
+        self.warnings = []
+
+    def message_user(self, request, message):
+        self.warnings.append(message)
+
+    def changed(self):
+        return len(self.added) + len(self.moved)
+
+    def unknown_players(self):
+        '''
+        The games skipped by Lichess name of the player not in the database
+        '''
+        players = {}
+        for g, lichess in self.unknown:
+            players.setdefault(lichess, []).append(g)
+        return players
+
+    def counts(self):
+        return { 'added' : len(self.added), 'moved' : len(self.moved), 'existing' : len(self.existing),
+            'unknown' : len(self.unknown), 'not_in_league' : len(self.not_in_league), 'invalid_pgn' : len(self.invalid_pgn) }
+
+    def messages(self):
+        messages = []
+        for g, v, league in self.moved:
+            messages += [ "Game between %s and %s is in %s, changing to %s" % (v['white'], v['black'], league, v['league']) ]
+        if self.existing:
+            messages += [ "%i games are already in the database" % (len(self.existing)) ]
+        for lichess, games in sorted(self.unknown_players().items()):
+            messages += [ "Player %s is not in the database, skipping %i games" % (lichess, len(games)) ]
+        for lichess in sorted(self.not_in_league):
+            messages += [ "Warning: Player %s is in the database but not the league" % (lichess) ]
+        for g, error in self.invalid_pgn:
+            messages += [ "Warning: the PGN of game %s is not valid, it is left out: %s" % (g, error) ]
+        return messages + self.warnings
+
+    def summary(self, league):
+        if self.dry_run:
+            return "dry run, would add %i games to %s and move %i from other leagues" % (len(self.added), league, len(self.moved))
+        return "added %i games to %s" % (self.changed(), league)
+
+
+def batches(games, size):
+    games = iter(games)
+    while True:
+        batch = list(itertools.islice(games, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def ingest_batch(league, batch, members, seen, result):
+    dry_run = result.dry_run
+    unique = []
+    for g, v in batch:
+        if g not in seen:
+            seen.add(g)
+            unique += [ (g, v) ]
+    batch = unique
+    names = set(v['white'] for g, v in batch) | set(v['black'] for g, v in batch)
+    players = { p.lichess : p for p in Player.objects.filter(lichess__in = names) }
+    existing = { row[0] : row[1:] for row in Schedule.objects.filter(lichess__in = [ g for g, v in batch ]).values_list(
+        'lichess', 'pk', 'league_id', 'league__slug', 'league__name', 'white_id', 'black_id', 'round') }
+
+    games, pgns, moved, moved_players = [], {}, [], set()
+    for g, v in batch:
+        if g in existing:
+            pk, league_id, slug, name, white_id, black_id, round = existing[g]
+            if league_id != league.pk:
+                result.moved += [ (g, dict(v, league = league), name) ]
+                moved += [ (pk, slug, league_id, round) ]
+                moved_players.update((white_id, black_id))
+            else:
+                result.existing += [ (g, v) ]
+            continue
+        white, black = players.get(v['white']), players.get(v['black'])
+        if white is None or black is None:
+            result.unknown += [ (g, v['white'] if white is None else v['black']) ]
+            continue
+        for p in (white, black):
+            if p.pk not in members:
+                result.not_in_league.add(p.lichess)
+        games += [ Schedule(league = league, lichess = g, white = white, black = black, date = v['date'], result = v['result']) ]
+        if v.get('pgn'):
+            pgns[g] = str(v['pgn'])
+        result.added += [ g ]
+
+    if result.validate_pgn and pgns:
+        # python-chess is only imported when the PGNs are validated
+        from .pgnparse import parse_pgn_texts
+        for g, parsed in zip(list(pgns), parse_pgn_texts(list(pgns.values()))):
+            if parsed.errors:
+                result.invalid_pgn += [ (g, parsed.errors[0]) ]
+                del pgns[g]
+    if dry_run:
+        return
+    with transaction.atomic():
+        if moved:
+            # update sends no signals, the pages and pairing states of the
+            # leagues the games leave and join and the careers of their
+            # players are invalidated here
+            Schedule.objects.filter(pk__in = [ pk for pk, slug, league_id, round in moved ]).update(league = league)
+            invalidate_pairing_states([ (league_id, round) for pk, slug, league_id, round in moved ]
+                + [ (league.pk, round) for pk, slug, league_id, round in moved ])
+        save_games(games)
+        if pgns:
+            # only some databases give bulk_create the ids of the rows
+            if all(s.pk is not None for s in games):
+                ids = { s.lichess : s.pk for s in games }
+            else:
+                ids = dict(Schedule.objects.filter(lichess__in = list(pgns)).values_list('lichess', 'pk'))
+            PGN.objects.bulk_create([ PGN(game_id = ids[g], body = body) for g, body in pgns.items() ])
+    if moved:
+        for slug in set(slug for pk, slug, league_id, round in moved if slug is not None):
+            bump_league_version(slug)
+        invalidate_league_pages(league)
+        invalidate_careers(*moved_players)
+
+
+def ingest_games(league, games, batch_size = BATCH_SIZE, dry_run = False, validate_pgn = False):
+    '''
+    Add the games of an iterable of (Lichess id, game dict) to league: new
+    games are created, games in another league are moved to this one and the
+    games already there, or with a player not in the database, are left out.
+    Returns an IngestResult, the standings are left to the caller.
+    '''
+    result = IngestResult(dry_run, validate_pgn)
+    # the ids of a batch, and the names of up to twice as many players, go
+    # into the IN of one query
+    if connection.features.max_query_params:
+        batch_size = min(batch_size, connection.features.max_query_params // 2)
+    members = set(league.players.values_list('pk', flat = True))
+    seen = set()
+    for batch in batches(games, batch_size):
+        ingest_batch(league, batch, members, seen, result)
+    return result
+
+
+def import_games(league, games, batch_size = BATCH_SIZE, dry_run = False, validate_pgn = False):
+    '''
+    ingest_games then, if any game was added or moved, the standings of
+    the league rebuilt once
+    '''
+    result = ingest_games(league, games, batch_size, dry_run, validate_pgn)
+    if result.changed() > 0 and not dry_run:
+        standings_rebuild(result, None, league)
+    return result
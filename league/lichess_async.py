@@ -0,0 +1,282 @@
+'''
+Asynchronous access to the Lichess API, for importing many tournaments at
+once.
+
+Requests run concurrently, at most LICHESS_CONCURRENCY at a time, and are
+spaced by a token bucket refilled at LICHESS_RATE requests a second. A 429,
+or a 503, holds every request back for the Retry-After the server asks for,
+a minute if it gives none, before the request is tried again, up to
+LICHESS_RETRIES times.
+
+The exports of finished tournaments and games never change, so they are kept
+on disk in LICHESS_CACHE_DIR, by tournament or game id, and importing them
+again makes no request at all. Bodies are written to disk, or kept in memory
+while small, as they are received and handed back as binary files, so a
+large export is never held in memory whole.
+
+The blocking requests are made by the pooled session of lichess_client in a
+thread pool, there is no asynchronous HTTP client among the dependencies.
+lichess_client has the synchronous helpers built on this.
+'''
+import asyncio
+import email.utils
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NDJSON = 'application/x-ndjson'
+PGN = 'application/x-chess-pgn'
+JSON = 'application/json'
+
+# bodies up to this size stay in memory, larger ones are spooled to disk
+SPOOL_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# what Lichess asks for after a 429 without a Retry-After
+RETRY_AFTER = 60
+RETRY_STATUSES = (429, 503)
+
+# the statuses of a game still being played
+PLAYING = ('created', 'started')
+
+SAFE_KEY_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def retry_after(response):
+    '''
+    The seconds to wait before trying a request again, from the Retry-After
+    header, either seconds or an HTTP date
+    '''
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return RETRY_AFTER
+
+
+class TokenBucket(object):
+    '''
+    Lets through rate requests a second, with bursts of up to capacity, and
+    none at all while paused. Must be created in the event loop using it.
+    '''
+    def __init__(self, rate, capacity = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class ResponseCache(object):
+    '''
+    Response bodies on disk, by kind and id
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, kind, key):
+        return os.path.join(self.directory, kind, SAFE_KEY_RE.sub('_', key))
+
+    def get(self, kind, key):
+        '''
+        The cached body opened for reading, or None
+        '''
+        try:
+            return open(self.path(kind, key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, kind, key, body):
+        '''
+        Store the body, a binary file read from its current position, which
+        is rewound afterwards
+        '''
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        start = body.tell()
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(body, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        finally:
+            body.seek(start)
+
+
+class AsyncLichess(object):
+    '''
+    The Lichess API for coroutines, to be used as an async context manager:
+
+        async with AsyncLichess() as lichess:
+            bodies = await asyncio.gather(*[ lichess.arena_games(t) for t in ids ])
+
+    Every method returns the body as a binary file for the caller to close.
+    '''
+    def __init__(self, session = None, url = None, concurrency = None, rate = None, burst = None, retries = None, cache_dir = None):
+        from .lichess_client import get_session, get_lichess_url
+        self.session = session or get_session()
+        self.url = (url or get_lichess_url()).rstrip('/')
+        self.concurrency = concurrency or get_setting('LICHESS_CONCURRENCY', 4)
+        self.rate = rate or get_setting('LICHESS_RATE', 2)
+        self.burst = burst or get_setting('LICHESS_BURST', 4)
+        self.retries = retries if retries is not None else get_setting('LICHESS_RETRIES', 3)
+        if cache_dir is None:
+            cache_dir = get_setting('LICHESS_CACHE_DIR', None)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+
+    async def __aenter__(self):
+        self.executor = ThreadPoolExecutor(max_workers = self.concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(self.rate, self.burst)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.executor.shutdown(wait = True)
+
+    def download(self, path, accept, params):
+        '''
+        Make one request, in a worker thread, returning the body, or None and
+        the seconds to wait before trying again
+        '''
+        response = self.session.get(self.url + path, params = params, headers = { 'Accept' : accept }, stream = True)
+        with response:
+            if response.status_code in RETRY_STATUSES:
+                return None, retry_after(response)
+            response.raise_for_status()
+            body = tempfile.SpooledTemporaryFile(max_size = SPOOL_SIZE)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                body.write(chunk)
+            body.seek(0)
+            return body, None
+
+    async def request(self, path, accept, params = None):
+        loop = asyncio.get_event_loop()
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            async with self.semaphore:
+                body, wait = await loop.run_in_executor(self.executor, self.download, path, accept, params)
+            if body is not None:
+                return body
+            logger.warning('Lichess rate limit on %s, waiting %.0f seconds', path, wait)
+            self.bucket.pause(wait)
+        raise requests.exceptions.HTTPError('Lichess is still rate limiting %s after %i retries' % (path, self.retries))
+
+    def cached(self, kind, key):
+        return self.cache.get(kind, key) if self.cache is not None else None
+
+    def store(self, kind, key, body):
+        if self.cache is not None:
+            self.cache.put(kind, key, body)
+
+    async def info(self, path):
+        with await self.request(path, JSON) as body:
+            return json.load(body)
+
+    async def arena_games(self, tournament_id):
+        '''
+        The NDJSON export of an arena, PGNs included
+        '''
+        body = self.cached('arena', tournament_id)
+        if body is not None:
+            return body
+        # the tournament is checked first, a finished one has all its games
+        info = await self.info('/api/tournament/%s' % (tournament_id))
+        body = await self.request('/api/tournament/%s/games' % (tournament_id), NDJSON, { 'pgnInJson' : 'true' })
+        if info.get('isFinished'):
+            self.store('arena', tournament_id, body)
+        return body
+
+    async def swiss_games(self, tournament_id):
+        '''
+        The PGN export of a swiss
+        '''
+        body = self.cached('swiss', tournament_id)
+        if body is not None:
+            return body
+        info = await self.info('/api/swiss/%s' % (tournament_id))
+        body = await self.request('/api/swiss/%s/games' % (tournament_id), PGN)
+        if info.get('status') == 'finished':
+            self.store('swiss', tournament_id, body)
+        return body
+
+    async def game(self, game_id):
+        '''
+        The JSON export of a game, PGN included
+        '''
+        body = self.cached('game', game_id)
+        if body is not None:
+            return body
+        body = await self.request('/game/export/%s' % (game_id), JSON, { 'pgnInJson' : 'true' })
+        status = json.load(body).get('status')
+        body.seek(0)
+        if status not in PLAYING:
+            self.store('game', game_id, body)
+        return body
+
+    async def fetch(self, kind, key):
+        return await { 'arena' : self.arena_games, 'swiss' : self.swiss_games, 'game' : self.game }[kind](key)
+
+    async def fetch_all(self, items):
+        '''
+        The bodies of (kind, id) items, fetched concurrently, in order
+        '''
+        bodies = await asyncio.gather(*[ self.fetch(kind, key) for kind, key in items ], return_exceptions = True)
+        errors = [ b for b in bodies if isinstance(b, BaseException) ]
+        if errors:
+            for b in bodies:
+                if not isinstance(b, BaseException):
+                    b.close()
+            raise errors[0]
+        return bodies
+
+
+def fetch_all(items, **kwargs):
+    '''
+    fetch_all for synchronous code, kwargs are passed to AsyncLichess
+    '''
+    async def main():
+        async with AsyncLichess(**kwargs) as lichess:
+            return await lichess.fetch_all(items)
+    return asyncio.run(main())
@@ -0,0 +1,208 @@
+'''
+Fetching games from Lichess and creating club events there
+
+Every request goes through one pooled requests session. The games are
+fetched by lichess_async, concurrently, rate limited and cached on disk, and
+the helpers here read them back one by one, so a large event is never held
+in memory whole. LICHESS_URL points the helpers at another server, e.g. a
+local one replaying recorded responses in the tests.
+'''
+import berserk
+import lichess.api
+import fidetournament.tournament
+import os
+import json
+import threading
+
+
+import chess.pgn
+import datetime
+from pytz import timezone
+
+import argparse
+import requests
+import io
+import dateutil.parser
+
+from django.conf import settings
+
+from .pgnscan import scan_pgn
+
+# connections kept open to Lichess by the shared session
+POOL_SIZE = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_lichess_url():
+    return getattr(settings, 'LICHESS_URL', 'https://lichess.org').rstrip('/')
+
+
+def get_session():
+    '''
+    The requests session shared by every call to Lichess, created on first
+    use, with the LICHESS_TOKEN if there is one
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections = POOL_SIZE, pool_maxsize = POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if 'LICHESS_TOKEN' in os.environ:
+                session.headers['Authorization'] = 'Bearer %s' % (os.environ['LICHESS_TOKEN'])
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+# for creating online tournaments
+
+def get_client():
+    return berserk.Client(session = get_session(), base_url = get_lichess_url())
+
+def get_players(club):
+    client = get_client()
+    return [ m['id'] for m in client.teams.get_members(club) ]
+    del(client)
+
+def get_tournaments(user):
+    client = get_client()
+    return [ t['id'] for t in client.tournaments.stream_by_creator(user) if 'wallasey' in t['fullName'].lower() ]
+    del(client)
+
+def get_pgn(game):
+    for id, g in iter_game(game):
+        return g['pgn']
+
+def game2dict(g, pgn=''):
+    if pgn == '' and 'pgn' in g.keys():
+        pgn = g['pgn']
+    result = 0
+    if 'winner' in g.keys():
+        if g['winner'] == 'white' : result = 1
+        if g['winner'] == 'black' : result = 2
+    date = g['createdAt']
+    # the raw exports give milliseconds since the epoch
+    if isinstance(date, int):
+        date = datetime.datetime.fromtimestamp(date / 1000, tz = datetime.timezone.utc)
+    toReturn = { 'white' : g['players']['white']['user']['id'], 'black' : g['players']['black']['user']['id'], 'result' : result, 'date' : date, 'pgn' : pgn}
+    return toReturn
+
+
+def pgn2dict(game):
+    '''
+    The game dict of a game found by scan_pgn, from its headers
+    '''
+    heads = game.headers
+    pgn = game.text()
+    result = 0
+    if heads['Result'] == '1-0' : result = 1
+    if heads['Result'] == '0-1' : result = 2
+    date = (heads.get('UTCDate') or heads['Date']) + ' ' + heads['UTCTime']
+    date = datetime.datetime.strptime(date, '%Y.%m.%d %H:%M:%S').replace(tzinfo = datetime.timezone.utc)
+    id = heads['Site'].replace('https://lichess.org/','')
+    return id, {'white': heads['White'].lower(), 'black' : heads['Black'].lower(), 'result' : result, 'date' : date, 'pgn' : pgn}
+
+
+def read_ndjson(body):
+    with body:
+        for line in body:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_pgn(body):
+    with body:
+        for game in scan_pgn(body, keep_text = True):
+            yield game
+
+
+def read_games(kind, body):
+    '''
+    The (id, game dict) of a body fetched by lichess_async
+    '''
+    if kind == 'arena':
+        for g in read_ndjson(body):
+            yield g['id'], game2dict(g)
+    elif kind == 'swiss':
+        for game in read_pgn(body):
+            yield pgn2dict(game)
+    else:
+        with body:
+            g = json.load(body)
+        yield g['id'], game2dict(g)
+
+
+def iter_lichess_games(arenas = (), swiss = (), games = ()):
+    '''
+    The games of arenas, swiss tournaments and single games, all fetched
+    concurrently before the first is yielded
+    '''
+    from .lichess_async import fetch_all
+    items = [ ('arena', t) for t in arenas ] + [ ('swiss', t) for t in swiss ] + [ ('game', g) for g in games ]
+    bodies = fetch_all(items)
+    try:
+        for (kind, key), body in zip(items, bodies):
+            for g in read_games(kind, body):
+                yield g
+    finally:
+        for body in bodies:
+            body.close()
+
+
+def iter_game(game_id):
+    '''
+    One game, with its PGN in the same request
+    '''
+    return iter_lichess_games(games = [ game_id ])
+
+
+def iter_arena_games(tournament_id):
+    return iter_lichess_games(arenas = [ tournament_id ])
+
+
+def iter_games_from_pgn(pgn):
+    '''
+    The games of a PGN file or of the lines of one
+    '''
+    for game in scan_pgn(pgn, keep_text = True):
+        yield pgn2dict(game)
+
+
+def iter_swiss_games(t):
+    return iter_lichess_games(swiss = [ t ])
+
+
+def get_game(game_id):
+    return dict(iter_game(game_id))
+
+def get_arena_games(tournament_id):
+    return dict(iter_arena_games(tournament_id))
+
+def get_games_from_pgn(pgn):
+    return dict(iter_games_from_pgn(pgn))
+
+def get_swiss_games(t):
+    return dict(iter_swiss_games(t))
+
+def create_arena_event(name, d, time=5, increment=3, duration=90):
+    client = get_client()
+    epoch = datetime.datetime(1970, 1, 1, 0, 0, 0, tzinfo = timezone('UTC'))
+    date = d.replace(tzinfo = timezone('Europe/London'))
+    date = date.replace(hour=19,minute=30, second=0)
+    timestamp = int((date -epoch).total_seconds())*1000
+
+    tournament = client.tournaments.create(time, increment, duration, name=name,
+            berserkable=True, rated=True, start_date=timestamp, conditions={ 'teamMember' : {'teamId' : 'wallasey-chess-club'}})
+    del(client)
+    return tournament
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from league.models import League
+from league.pdf import export_pdfs, PDF_KINDS
+
+
+class Command(BaseCommand):
+    help = 'Export the tables or crosstables of leagues into one PDF, a page per league'
+
+    def add_arguments(self, parser):
+        parser.add_argument('leagues', nargs='*', help='league slugs, every league of the season if none are given')
+        parser.add_argument('--season', help='season slug')
+        parser.add_argument('--kind', choices=PDF_KINDS, default='table')
+        parser.add_argument('--workers', type=int, default=None, help='worker processes drawing the figures')
+        parser.add_argument('-o', '--output', required=True, help='PDF file to write')
+
+    def handle(self, *args, **options):
+        leagues = League.objects.select_related('season').order_by('pk')
+        if options['leagues']:
+            leagues = leagues.filter(slug__in=options['leagues'])
+        elif options['season']:
+            leagues = leagues.filter(season__slug=options['season'])
+        else:
+            raise CommandError('Give the leagues to export or a --season')
+        # knockouts have no table
+        leagues = leagues.exclude(format=3)
+        if not leagues:
+            raise CommandError('No leagues to export')
+
+        pdf = export_pdfs(options['kind'], leagues, workers=options['workers'])
+        with open(options['output'], 'wb') as f:
+            f.write(pdf)
+        self.stdout.write('Exported %i leagues to %s' % (len(leagues), options['output']))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from league.models import Season
+from league.synthetic import generate_club
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic club, seasons with a league of every format, teams and news, for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seasons', type=int, default=3)
+        parser.add_argument('--players', type=int, default=60, help='members of the club')
+        parser.add_argument('--league-size', type=int, default=16, help='players in each league')
+        parser.add_argument('--teams', type=int, default=3, help='teams in each season')
+        parser.add_argument('--news', type=int, default=10, help='news items')
+        parser.add_argument('--pgn-fraction', type=float, default=0.2, help='fraction of the played games with a PGN')
+        parser.add_argument('--prefix', default='synthetic', help='start of the generated slugs')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Season.objects.filter(slug__startswith=options['prefix'] + '-').exists():
+            raise CommandError('There are already seasons starting with %s, pick another --prefix' % options['prefix'])
+        with transaction.atomic():
+            counts = generate_club(seasons=options['seasons'], players=options['players'],
+                league_size=options['league_size'], teams=options['teams'], news=options['news'],
+                pgn_fraction=options['pgn_fraction'], prefix=options['prefix'], seed=options['seed'])
+        self.stdout.write('Generated %s' % ', '.join('%i %s' % (n, kind) for kind, n in counts.items()))
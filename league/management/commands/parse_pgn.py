@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from league.pgnparse import parse_pgn_file, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Parse every game of a PGN file in a pool of workers, reporting the games with errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pgn', help='PGN file to parse')
+        parser.add_argument('--workers', type=int, default=None, help='worker processes parsing the games')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='games parsed by a worker at a time')
+        parser.add_argument('-o', '--output', help='JSON lines file to write the parsed games to')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        output = open(options['output'], 'w') if options['output'] else None
+        ngames, plies, invalid = 0, 0, 0
+        try:
+            for i, game in enumerate(parse_pgn_file(options['pgn'], options['workers'], options['chunk_size'])):
+                ngames += 1
+                plies += game.plies
+                if game.errors:
+                    invalid += 1
+                    self.stderr.write('game %i (%s): %s' % (i + 1, game.headers.get('Site', '?'), game.errors[0]))
+                if output is not None:
+                    output.write(json.dumps({ 'headers' : game.headers, 'moves' : game.moves,
+                        'fen' : game.fen, 'plies' : game.plies, 'errors' : game.errors }) + '\n')
+        except FileNotFoundError as e:
+            raise CommandError(e)
+        finally:
+            if output is not None:
+                output.close()
+        self.stdout.write('Parsed %i games, %i half moves, %i with errors, in %.1f s' % (
+            ngames, plies, invalid, time.perf_counter() - start))
@@ -0,0 +1,590 @@
+'''
+Swiss pairing as a maximum weight matching.
+
+Every pair of players that could meet is an edge of a graph, weighted down
+by how much the pairing goes against the Swiss rules: a rematch, an absolute
+colour preference that can't be met, the score difference, a player
+floating the same way twice, a weaker colour preference and finally the
+distance from the top half against bottom half order. The round is the
+maximum weight matching of all the players, found with Edmonds' blossom
+algorithm in max_weight_matching, with an extra vertex standing for the bye
+when the number of players is odd.
+
+MatchingPairingEngine has the interface of the swissdutch engines, so
+get_next_round and get_pairs take either. Round 1 is paired the same way as
+by the Dutch engine.
+'''
+from swissdutch.constants import Colour, FloatStatus
+from swissdutch.swiss import SwissPairingEngine
+
+# penalties, each outweighing every smaller one added up over a round
+REMATCH = 10 ** 12
+ABSOLUTE_COLOUR = 10 ** 9
+SCORE = 10 ** 5
+FLOAT = 10 ** 4
+FLOAT_PREV = 10 ** 3
+STRONG_COLOUR = 10 ** 2
+MILD_COLOUR = 10
+ORDER = 1
+
+# the players each player is joined to in the ranking, on either side, the
+# graph is only made complete should that leave someone unpaired
+NEIGHBOURS = 24
+
+
+def max_weight_matching(edges, maxcardinality = False):
+    '''
+    A maximum weight matching of a general graph, given as a list of
+    (i, j, weight) edges between vertices numbered from 0, with integer
+    weights. Returns mate, mate[i] the vertex matched to i or -1. With
+    maxcardinality the matching is the heaviest of those with the most edges.
+
+    This is Edmonds' blossom algorithm with dual variables, in O(n^3), as
+    described by Galil in "Efficient algorithms for finding maximum matching
+    in graphs" (1986), after the public domain implementation by Joris van
+    Rantwijk.
+    '''
+    if not edges:
+        return []
+    nedge = len(edges)
+    nvertex = 0
+    for (i, j, w) in edges:
+        assert i >= 0 and j >= 0 and i != j
+        nvertex = max(nvertex, i + 1, j + 1)
+    # the weights are doubled so that the dual variables stay integers
+    edges = [ (i, j, 2 * w) for (i, j, w) in edges ]
+    maxweight = max(0, max(w for (i, j, w) in edges))
+
+    # endpoint[p] is the vertex of the end p of an edge, edge k has the ends
+    # 2k and 2k+1
+    endpoint = [ edges[p // 2][p % 2] for p in range(2 * nedge) ]
+    # the remote ends of the edges of each vertex
+    neighbend = [ [] for i in range(nvertex) ]
+    for k, (i, j, w) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # the remote end of the matched edge of each vertex, or -1
+    mate = nvertex * [ -1 ]
+    # the label of each top level blossom and vertex, 0 free, 1 S and 2 T,
+    # and the end of the edge it was reached through
+    label = (2 * nvertex) * [ 0 ]
+    labelend = (2 * nvertex) * [ -1 ]
+    # the top level blossom of each vertex, blossoms are numbered from nvertex
+    inblossom = list(range(nvertex))
+    blossomparent = (2 * nvertex) * [ -1 ]
+    # the sub-blossoms of each blossom around the cycle from its base, and
+    # the ends of the edges joining them
+    blossomchilds = (2 * nvertex) * [ None ]
+    blossombase = list(range(nvertex)) + nvertex * [ -1 ]
+    blossomendps = (2 * nvertex) * [ None ]
+    # the least slack edge to an S blossom, of each vertex and blossom, and
+    # the least slack edges to the other S blossoms of each S blossom
+    bestedge = (2 * nvertex) * [ -1 ]
+    blossombestedges = (2 * nvertex) * [ None ]
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+    dualvar = nvertex * [ maxweight ] + nvertex * [ 0 ]
+    # the edges known to have no slack
+    allowedge = nedge * [ False ]
+    queue = []
+
+    # the ends and twice the weight of each edge, for the slack
+    edgei = [ i for (i, j, w) in edges ]
+    edgej = [ j for (i, j, w) in edges ]
+    edgew = [ 2 * w for (i, j, w) in edges ]
+
+    def slack(k):
+        return dualvar[edgei[k]] + dualvar[edgej[k]] - edgew[k]
+
+    def blossom_leaves(b):
+        if b < nvertex:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < nvertex:
+                    yield t
+                else:
+                    yield from blossom_leaves(t)
+
+    def assign_label(w, t, p):
+        # label the top level blossom of w with t, reached through the end p
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossom_leaves(b))
+        elif t == 2:
+            # the mate of the base of a T blossom becomes S
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v, w):
+        # trace back from v and w, returning the base of the new blossom
+        # they close, or -1 when they are on an augmenting path
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                # the root of the alternating tree
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, k):
+        # make the cycle closed by edge k with the given base a blossom
+        (v, w, wt) = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossom_leaves(b):
+            if label[inblossom[v]] == 2:
+                # the former T vertices are now S
+                queue.append(v)
+            inblossom[v] = b
+        # the least slack edges to the other S blossoms
+        bestedgeto = (2 * nvertex) * [ -1 ]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [ [ p // 2 for p in neighbend[v] ] for v in blossom_leaves(bv) ]
+            else:
+                nblists = [ blossombestedges[bv] ]
+            for nblist in nblists:
+                for k in nblist:
+                    (i, j, wt) = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if bj != b and label[bj] == 1 and (bestedgeto[bj] == -1 or slack(k) < slack(bestedgeto[bj])):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [ k for k in bestedgeto if k != -1 ]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expand_blossom(b, endstage):
+        # turn the sub-blossoms of b back into top level blossoms
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in blossom_leaves(s):
+                    inblossom[v] = s
+        if not endstage and label[b] == 2:
+            # relabel the sub-blossoms on the even path from the one the
+            # blossom was entered through to the base
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            # the base becomes T, without its mate becoming S again
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            # the sub-blossoms on the odd path are labelled as reached
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossom_leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        # swap the matched and unmatched edges of b on the path from v to
+        # the base, v becoming the base
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augment_blossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k):
+        # swap the matched and unmatched edges along the augmenting path
+        # through edge k, from both its ends back to the roots
+        (v, w, wt) = edges[k]
+        for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # each stage adds an edge to the matching, or ends the search
+    for stage in range(nvertex):
+        label[:] = (2 * nvertex) * [ 0 ]
+        bestedge[:] = (2 * nvertex) * [ -1 ]
+        blossombestedges[nvertex:] = nvertex * [ None ]
+        allowedge[:] = nedge * [ False ]
+        queue[:] = []
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            # grow the alternating trees along the edges without slack
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = dualvar[edgei[k]] + dualvar[edgej[k]] - edgew[k]
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            # w is in a T blossom but not yet reached itself
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+
+            # no augmenting path, change the dual variables by the least
+            # amount that adds an edge or expands a blossom
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            if not maxcardinality:
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            for v in range(nvertex):
+                k = bestedge[v]
+                if k != -1 and label[inblossom[v]] == 0:
+                    d = dualvar[edgei[k]] + dualvar[edgej[k]] - edgew[k]
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = k
+            for b in range(2 * nvertex):
+                k = bestedge[b]
+                if k != -1 and label[b] == 1 and blossomparent[b] == -1:
+                    d = (dualvar[edgei[k]] + dualvar[edgej[k]] - edgew[k]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1 and label[b] == 2 and (deltatype == -1 or dualvar[b] < delta):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+            if deltatype == -1:
+                # no further improvement possible with maxcardinality
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+
+            for v in range(nvertex):
+                t = label[inblossom[v]]
+                if t == 1:
+                    dualvar[v] -= delta
+                elif t == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                # optimum reached
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+        # expand the S blossoms whose dual variables have reached zero
+        for b in range(nvertex, 2 * nvertex):
+            if blossomparent[b] == -1 and blossombase[b] >= 0 and label[b] == 1 and dualvar[b] == 0:
+                expand_blossom(b, True)
+
+    for v in range(nvertex):
+        if mate[v] >= 0:
+            mate[v] = endpoint[mate[v]]
+    return mate
+
+
+def colour_wish(player):
+    '''
+    The colour a player should get and how much, 3 absolute, 2 strong, 1
+    mild and 0 without any games
+    '''
+    played = [ c for c in player.colour_hist if c != Colour.none ]
+    if len(played) == 0:
+        return Colour.none, 0
+    difference = sum(played)
+    other = Colour.black if played[-1] == Colour.white else Colour.white
+    if abs(difference) > 1 or (len(played) > 1 and played[-1] == played[-2]):
+        return (Colour.black if difference > 0 or (difference == 0 and played[-1] == Colour.white) else Colour.white), 3
+    if abs(difference) == 1:
+        return (Colour.black if difference > 0 else Colour.white), 2
+    return other, 1
+
+
+def score_steps(a, b):
+    # the score difference in half points
+    return int(round(abs(a.score - b.score) * 2))
+
+
+def pair_penalty(a, b, group):
+    '''
+    How much pairing a and b goes against the Swiss rules, group has the
+    position of each player in their score group and its size, by pairing
+    number
+    '''
+    penalty = 0
+    if b.pairing_no in a.opponents or a.pairing_no in b.opponents:
+        penalty += REMATCH
+    wish_a, strength_a = colour_wish(a)
+    wish_b, strength_b = colour_wish(b)
+    if wish_a == wish_b and wish_a != Colour.none:
+        strength = min(strength_a, strength_b)
+        penalty += ABSOLUTE_COLOUR if strength == 3 else STRONG_COLOUR if strength == 2 else MILD_COLOUR
+    steps = score_steps(a, b)
+    if steps > 0:
+        penalty += SCORE * steps * steps
+        high, low = (a, b) if a.score > b.score else (b, a)
+        if high.float_status == FloatStatus.down: penalty += FLOAT
+        elif high.float_status == FloatStatus.downPrev: penalty += FLOAT_PREV
+        if low.float_status == FloatStatus.up: penalty += FLOAT
+        elif low.float_status == FloatStatus.upPrev: penalty += FLOAT_PREV
+    else:
+        # top half against bottom half of the score group
+        position, size = group[a.pairing_no]
+        other, size = group[b.pairing_no]
+        penalty += ORDER * abs(abs(position - other) - size // 2)
+    return penalty
+
+
+def bye_penalty(player, rank, nplayers):
+    '''
+    How much giving player the bye goes against the rules, it goes to the
+    lowest player without one
+    '''
+    penalty = REMATCH if 0 in player.opponents else 0
+    return penalty + SCORE * int(round(player.score * 2)) + ORDER * (nplayers - 1 - rank)
+
+
+def match_round(players, neighbours = NEIGHBOURS):
+    '''
+    Pair the players, ordered by score then pairing number, returning the
+    pairs as (i, j) indices of players, j None for a bye
+    '''
+    n = len(players)
+    group = {}
+    start = 0
+    for i in range(n + 1):
+        if i == n or (i > start and players[i].score != players[start].score):
+            for k in range(start, i):
+                group[players[k].pairing_no] = (k - start, i - start)
+            start = i
+    bye = n if n % 2 == 1 else None
+
+    def edges(window):
+        weights = []
+        for i in range(n):
+            for j in range(i + 1, min(n, i + 1 + window)):
+                weights += [ (i, j, pair_penalty(players[i], players[j], group)) ]
+            if bye is not None and i >= n - 1 - window:
+                weights += [ (i, bye, bye_penalty(players[i], i, n)) ]
+        # the heaviest matching has the least penalty
+        top = max(w for (i, j, w) in weights) + 1
+        return [ (i, j, top - w) for (i, j, w) in weights ]
+
+    size = n + (1 if bye is not None else 0)
+    mate = max_weight_matching(edges(neighbours), maxcardinality = True)
+    if len(mate) < size or -1 in mate:
+        # someone could not be paired within the window
+        mate = max_weight_matching(edges(n), maxcardinality = True)
+    return [ (i, mate[i] if mate[i] != bye else None) for i in range(n) if mate[i] > i or mate[i] == bye ]
+
+
+class MatchingPairingEngine(SwissPairingEngine):
+    '''
+    A swissdutch engine pairing the rounds after the first by maximum weight
+    matching
+    '''
+    def __init__(self, top_seed_colour_selection_fn = None, bye_value = 1, neighbours = NEIGHBOURS):
+        super().__init__(top_seed_colour_selection_fn, bye_value)
+        self._neighbours = neighbours
+
+    def _pair_round(self):
+        players = sorted(self._players, key = lambda p : (-p.score, p.pairing_no))
+        for board, (i, j) in enumerate(match_round(players, self._neighbours)):
+            if j is None:
+                players[i].bye(self._bye_value)
+                continue
+            # the higher ranked player first
+            a, b = players[i], players[j]
+            wish_a, strength_a = colour_wish(a)
+            wish_b, strength_b = colour_wish(b)
+            if wish_a != wish_b:
+                colour = wish_a if wish_a != Colour.none else (Colour.white if wish_b == Colour.black else Colour.black)
+            elif wish_a == Colour.none:
+                colour = Colour.white if board % 2 == 0 else Colour.black
+            elif strength_b > strength_a:
+                colour = Colour.white if wish_a == Colour.black else Colour.black
+            else:
+                colour = wish_a
+            a.pair_both(b, colour)
+        return self._players
+
+
+def pairing_metrics(players):
+    '''
+    Quality of the last round of paired players: the rematches, the players
+    given the same colour three times running or two more of one colour than
+    the other, and the floaters, players paired outside their score group
+    '''
+    by_number = { p.pairing_no : p for p in players }
+    rematches = colour_violations = floaters = 0
+    for p in players:
+        opponent = p.opponents[-1] if p.opponents else 0
+        if opponent == 0:
+            continue
+        if opponent in p.opponents[:-1]:
+            rematches += 1
+        if by_number[opponent].score != p.score:
+            floaters += 1
+        played = [ c for c in p.colour_hist if c != Colour.none ]
+        if abs(sum(played)) > 2 or (len(played) > 2 and played[-1] == played[-2] == played[-3]):
+            colour_violations += 1
+    # each rematch is counted by both players
+    return { 'rematches' : rematches // 2, 'colour_violations' : colour_violations, 'floaters' : floaters }
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+def clear_duplicate_lichess_ids(apps, schema_editor):
+    # games without a Lichess ID have a null one, and the imports always
+    # matched the first game with an ID, the later copies lose theirs so that
+    # the ID can be made unique
+    Schedule = apps.get_model('league', 'Schedule')
+    Schedule.objects.filter(lichess='').update(lichess=None)
+    seen = set()
+    duplicates = []
+    for pk, lichess in Schedule.objects.exclude(lichess__isnull=True).order_by('pk').values_list('pk', 'lichess'):
+        if lichess in seen:
+            duplicates.append(pk)
+        seen.add(lichess)
+    Schedule.objects.filter(pk__in=duplicates).update(lichess=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('league', '0050_auto_20220924_1314'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['league', 'white'], name='schedule_league_white_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['league', 'black'], name='schedule_league_black_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['league', 'round'], name='schedule_league_round_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['league', 'result'], name='schedule_league_result_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['league', 'date'], name='schedule_league_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['date'], name='schedule_date_idx'),
+        ),
+        migrations.RunPython(clear_duplicate_lichess_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='schedule',
+            constraint=models.UniqueConstraint(condition=models.Q(lichess__isnull=False), fields=('lichess',), name='schedule_unique_lichess'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('league', '0051_schedule_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairingState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.IntegerField(verbose_name='Round')),
+                ('score', models.FloatField(default=0, verbose_name='Score')),
+                ('float_status', models.IntegerField(default=0, verbose_name='Float status')),
+                ('opponents', models.TextField(blank=True, default='', verbose_name='Opponents')),
+                ('colour_hist', models.TextField(blank=True, default='', verbose_name='Colour history')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League', verbose_name='League')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.Player', verbose_name='Player')),
+            ],
+            options={
+                'verbose_name': 'Pairing state',
+                'verbose_name_plural': 'Pairing states',
+                'unique_together': {('league', 'player')},
+            },
+        ),
+    ]
@@ -31,6 +31,10 @@ RESULTS = (
 TOURNAMENT_FORMATS = (
     (0, 'League',), (1,'Swiss'), (2,'Round Robin'), (3,'Knockout')
 )
+# the Swiss pairing engines of league.pairing.get_pairing_engine
+PAIRING_ENGINES = (
+    ('dutch', 'Dutch'), ('matching', 'Weighted matching'),
+)
 POINTS = (
     (0, 0), (1,0.5), (2,1), (3, 2), (4,3),
 )
@@ -169,6 +173,22 @@ class Schedule(models.Model):
     class Meta:
         verbose_name = _('Game')
         verbose_name_plural = _('Games')
+        # the lookups of the standings, pairings, fixtures, player pages,
+        # ECF export and Lichess imports
+        indexes = [
+            models.Index(fields=['league', 'white'], name='schedule_league_white_idx'),
+            models.Index(fields=['league', 'black'], name='schedule_league_black_idx'),
+            models.Index(fields=['league', 'round'], name='schedule_league_round_idx'),
+            models.Index(fields=['league', 'result'], name='schedule_league_result_idx'),
+            models.Index(fields=['league', 'date'], name='schedule_league_date_idx'),
+            models.Index(fields=['date'], name='schedule_date_idx'),
+        ]
+        constraints = [
+            # a Lichess game is only imported once, games without one have
+            # a null ID which the lookups by ID can use the index for
+            models.UniqueConstraint(fields=['lichess'], condition=Q(lichess__isnull=False),
+                name='schedule_unique_lichess'),
+        ]
 
     def print_result(self, plain = False):
         for a,b in RESULTS:
@@ -370,4 +390,28 @@ class Standings(models.Model):
 
 
 
+class PairingState(models.Model):
+    '''
+    The Swiss pairing state of a player after the completed rounds of a
+    league up to round, kept by league.pairing so that pairing the next round
+    does not replay the earlier ones. opponents are player ids, 0 for a bye,
+    and colour_hist the swissdutch colours, both comma separated.
+    '''
+    league       = models.ForeignKey(League, on_delete=models.CASCADE, verbose_name=_('League'))
+    player       = models.ForeignKey(Player, on_delete=models.CASCADE, verbose_name=_('Player'))
+    round        = models.IntegerField(verbose_name=_('Round'))
+    score        = models.FloatField(default=0, verbose_name=_('Score'))
+    float_status = models.IntegerField(default=0, verbose_name=_('Float status'))
+    opponents    = models.TextField(blank=True, default='', verbose_name=_('Opponents'))
+    colour_hist  = models.TextField(blank=True, default='', verbose_name=_('Colour history'))
+
+    class Meta:
+        unique_together = ('league', 'player')
+        verbose_name = _('Pairing state')
+        verbose_name_plural = _('Pairing states')
+
+    def __str__(self):
+        return "{0} {1} round {2}".format(self.league, self.player, self.round)
+
+
 # Create your models here.
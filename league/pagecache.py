@@ -0,0 +1,125 @@
+'''
+Cached public league pages, the fixtures, standings and schedule, and the
+standings widget.
+
+Every league has a version counter in the Django cache, keyed by its slug,
+and the pages are cached under the slug and the current version, so bumping
+the counter makes every cached page of the league unreachable at once.
+league.signals bumps it whenever a League, Schedule or Standings is saved or
+deleted and the standings engine, which writes with bulk_update and so sends
+no signals, bumps it itself. The old entries are left to expire, after
+LEAGUE_PAGE_CACHE_TIMEOUT seconds, which also bounds how long a change of the
+site notification takes to show.
+
+Only the cache's get, set, add and incr are used, which the local-memory and
+file-based backends both provide. The cache must be shared by the processes
+serving the site, as the file-based one of the settings is, for a bump in
+one process to reach the pages cached by the others.
+'''
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from django_user_agents.utils import get_user_agent
+
+# hits and misses of this process, by kind of page
+PAGE_CACHE_STATS = Counter()
+
+
+def get_page_cache_timeout():
+    return getattr(settings, 'LEAGUE_PAGE_CACHE_TIMEOUT', 600)
+
+
+def league_version_key(slug):
+    return 'league-version-%s' % (slug)
+
+
+def get_league_version(slug):
+    '''
+    The current version of the pages of a league. A missing counter starts
+    from the clock so that a counter evicted from the cache never goes back
+    to a version that still has pages cached.
+    '''
+    key = league_version_key(slug)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_league_version(slug):
+    key = league_version_key(slug)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # not cached, there is nothing to invalidate
+        cache.add(key, int(time.time() * 1000), None)
+
+
+def invalidate_league_pages(league):
+    bump_league_version(league.slug)
+
+
+def page_cache_key(kind, slug, variant = ''):
+    return 'league-page-%s-%s-%s-%s' % (kind, slug, get_league_version(slug), variant)
+
+
+def page_cache_stats():
+    '''
+    The hits and misses of this process as { kind : (hits, misses) }
+    '''
+    kinds = set(kind for kind, outcome in PAGE_CACHE_STATS)
+    return { kind : (PAGE_CACHE_STATS[kind, 'hit'], PAGE_CACHE_STATS[kind, 'miss']) for kind in kinds }
+
+
+def get_cached(kind, slug, build, variant = ''):
+    '''
+    The value cached for a league under kind, built by build() and cached if
+    missing
+    '''
+    key = page_cache_key(kind, slug, variant)
+    value = cache.get(key)
+    if value is not None:
+        PAGE_CACHE_STATS[kind, 'hit'] += 1
+        return value
+    PAGE_CACHE_STATS[kind, 'miss'] += 1
+    value = build()
+    cache.set(key, value, get_page_cache_timeout())
+    return value
+
+
+def cache_league_page(kind):
+    '''
+    Decorator caching the responses of a view taking the league slug as its
+    league argument. The templates render differently on phones so those get
+    their own copy.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            slug = kwargs.get('league')
+            if slug is None or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            variant = 'mobile' if get_user_agent(request).is_mobile else 'desktop'
+
+            key = page_cache_key(kind, slug, variant)
+            cached = cache.get(key)
+            if cached is not None:
+                PAGE_CACHE_STATS[kind, 'hit'] += 1
+                content, content_type = cached
+                return HttpResponse(content, content_type = content_type)
+            PAGE_CACHE_STATS[kind, 'miss'] += 1
+
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if response.status_code == 200:
+                cache.set(key, (response.content, response['Content-Type']), get_page_cache_timeout())
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,253 @@
+'''
+Pairing of a Swiss round in the background, for the create round page.
+
+The Dutch engine can backtrack for a long time on a large event, so instead
+of pairing inside the admin request the round is paired by a job, in a
+thread of the web process, and the page polls for the result. The engine
+itself runs in a child process, or in a thread with LEAGUE_PAIRING_WORKER
+set to 'thread', and is given LEAGUE_PAIRING_BUDGET seconds. The child is
+spawned, not forked, as forking from a thread of a threaded server can leave
+the child with locks held by the other threads. Should it run out of time or
+fail, the round is paired by fallback_round, by score, and the admin is told
+so before confirming.
+
+The progress and result of a job are kept in the Django cache, which must be
+shared by the processes serving the site, e.g. the file-based one of the
+settings, for the page polling to find the job whichever process it reaches.
+With a local-memory cache the job runs in the request instead.
+'''
+import copy
+import multiprocessing
+import pickle
+import threading
+import time
+import traceback
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+# how long the result of a job is kept for the admin to confirm it
+JOB_TIMEOUT = 3600
+
+
+def get_pairing_budget():
+    return getattr(settings, 'LEAGUE_PAIRING_BUDGET', 30)
+
+
+def run_in_background():
+    '''
+    Whether jobs run in the background, only with LEAGUE_PAIRING_BACKGROUND
+    and a cache the other processes can see
+    '''
+    from django.core.cache import caches
+    from django.core.cache.backends.locmem import LocMemCache
+    if not getattr(settings, 'LEAGUE_PAIRING_BACKGROUND', True):
+        return False
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def job_key(job_id):
+    return 'pairing-job-%s' % (job_id)
+
+
+def get_job(job_id):
+    return cache.get(job_key(job_id))
+
+
+def update_job(job_id, **fields):
+    '''
+    Set fields of a job, the job is only written by the thread running it
+    '''
+    job = get_job(job_id) or {}
+    job.update(fields)
+    cache.set(job_key(job_id), job, JOB_TIMEOUT)
+    return job
+
+
+def pair_with_engine(round_no, last_round, byes, engine = None):
+    from .pairing import get_next_round, get_pairing_engine
+    return get_next_round(round_no, get_pairing_engine(engine), last_round, byes = byes)
+
+
+def engine_process(conn, func, args):
+    '''
+    The spawned process starts afresh, Django is set up before the players
+    in args can be unpickled
+    '''
+    try:
+        import django
+        django.setup()
+        conn.send(('done', func(*pickle.loads(args))))
+    except Exception:
+        conn.send(('failed', traceback.format_exc(limit = 3)))
+    finally:
+        conn.close()
+
+
+def run_in_process(func, args, budget):
+    '''
+    Run func in a spawned child process, which is killed after budget seconds
+    '''
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex = False)
+    process = context.Process(target = engine_process, args = (child, func, pickle.dumps(args)), daemon = True)
+    process.start()
+    child.close()
+    try:
+        if not parent.poll(budget):
+            return 'timeout', None
+        return parent.recv()
+    except EOFError:
+        return 'failed', 'the pairing process exited'
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        parent.close()
+
+
+def run_in_thread(func, args, budget):
+    '''
+    Run func in a thread, which is left to finish in the background should it
+    take more than budget seconds
+    '''
+    result = []
+    def target():
+        try:
+            result.append(('done', func(*args)))
+        except Exception:
+            result.append(('failed', traceback.format_exc(limit = 3)))
+    thread = threading.Thread(target = target, daemon = True)
+    thread.start()
+    thread.join(budget)
+    if len(result) == 0:
+        return 'timeout', None
+    return result[0]
+
+
+def run_with_budget(func, args, budget):
+    '''
+    Run func(*args), returning ('done', result), ('failed', error) or
+    ('timeout', None) after budget seconds
+    '''
+    worker = getattr(settings, 'LEAGUE_PAIRING_WORKER', 'process')
+    if worker == 'process':
+        return run_in_process(func, args, budget)
+    return run_in_thread(func, args, budget)
+
+
+def fallback_round(round_no, last_round, byes = None):
+    '''
+    Pair a round by score, the same shape as get_next_round. The players
+    are taken by score then pairing number and each meets the next one they
+    have not played, if they can with the colour they expect. Should there
+    be an odd number, the lowest player without a bye gets one.
+    '''
+    from swissdutch.constants import Colour
+
+    # the engine may still be running on the players in a thread
+    last_round = copy.deepcopy(last_round)
+    byes = set(b.pk for b in byes or [])
+    next_round = {}
+    order = []
+    def give_bye(p, pp):
+        pp._colour_hist += (Colour.none,)
+        pp._opponents += (0,)
+        # to avoid any issue with non unique pairing numbers
+        pp.pairing_no = -1 * pp.pairing_no
+        next_round[p.pk] = pp
+
+    for p, pp in last_round.items():
+        if p.pk in byes:
+            give_bye(p, pp)
+        else:
+            order += [ (p, pp) ]
+    order.sort(key = lambda item : (-item[1].score, item[1].pairing_no))
+
+    if len(order) % 2 == 1:
+        bye = next((item for item in reversed(order) if 0 not in item[1].opponents), order[-1])
+        order.remove(bye)
+        give_bye(*bye)
+
+    while len(order) > 0:
+        p, pp = order.pop(0)
+        candidates = [ item for item in order if item[1].pairing_no not in pp.opponents ] or order
+        # the colours only decide between players of the same score
+        group = [ item for item in candidates if item[1].score == candidates[0][1].score ]
+        q, qq = next((item for item in group if item[1].expected_colour != pp.expected_colour), group[0])
+        order.remove((q, qq))
+        if pp.expected_colour == Colour.black or qq.expected_colour == Colour.white:
+            qq.pair_both(pp, Colour.white)
+        else:
+            pp.pair_both(qq, Colour.white)
+        next_round[p.pk] = pp
+        next_round[q.pk] = qq
+    return next_round
+
+
+def run_pairing_job(job_id, league_id, round_no, bye_ids, budget, engine = None):
+    '''
+    Pair round_no of a league, recording the progress and the pairs in the
+    job
+    '''
+    from .models import League
+    from .pairing import get_last_round, get_pairs
+
+    start = time.time()
+    try:
+        update_job(job_id, status = 'loading')
+        league = League.objects.get(pk = league_id)
+        last_round = get_last_round(league)
+        byes = [ p for p in last_round if p.pk in bye_ids ]
+
+        update_job(job_id, status = 'pairing', pairing_started = time.time())
+        status, result = run_with_budget(pair_with_engine, (round_no, last_round, byes, engine), budget)
+        fallback = None
+        if status == 'timeout':
+            fallback = 'the pairing engine took more than %i seconds' % (budget)
+        elif status == 'failed':
+            fallback = 'the pairing engine failed: %s' % (result.strip().splitlines()[-1])
+        if fallback is not None:
+            result = fallback_round(round_no, last_round, byes)
+
+        pairs, id_pairs = get_pairs(result)
+        update_job(job_id, status = 'done', elapsed = time.time() - start, fallback = fallback,
+            pairs = [ (str(a), str(b) if b is not None else None) for a, b in pairs ], id_pairs = id_pairs)
+    except Exception:
+        update_job(job_id, status = 'failed', elapsed = time.time() - start, error = traceback.format_exc(limit = 3).strip().splitlines()[-1])
+
+
+def job_progress(job):
+    '''
+    The seconds since the job started
+    '''
+    return int(time.time() - job['started'])
+
+
+def start_pairing_job(league, round_no, byes = None, budget = None, engine = None, **fields):
+    '''
+    Pair round_no of league in the background, returning the id of the job,
+    engine the name of the pairing engine, by default the one of the
+    settings, and fields are kept in the job for the page confirming the
+    pairs. Without LEAGUE_PAIRING_BACKGROUND, or a shared cache, the job
+    runs in the calling thread.
+    '''
+    job_id = uuid.uuid4().hex
+    if budget is None:
+        budget = get_pairing_budget()
+    bye_ids = [ b.pk for b in byes or [] ]
+    update_job(job_id, status = 'queued', league = league.pk, round = round_no, budget = budget, started = time.time(), **fields)
+
+    if not run_in_background():
+        run_pairing_job(job_id, league.pk, round_no, bye_ids, budget, engine)
+        return job_id
+
+    def target():
+        try:
+            run_pairing_job(job_id, league.pk, round_no, bye_ids, budget, engine)
+        finally:
+            connection.close()
+    threading.Thread(target = target, daemon = True).start()
+    return job_id
@@ -0,0 +1,85 @@
+'''
+Rendered PDFs of the league tables and crosstables, kept in the Django cache.
+
+Each league has one entry per kind of PDF holding the bytes along with the
+League.updated_date they were rendered for, so a stale entry is never served
+even if an invalidation was missed. The standings engine drops the entries
+whenever it recomputes a league.
+
+The PDFs are drawn by the backend named by LEAGUE_PDF_BACKEND, either
+'matplotlib' (league.figures) or 'native' (league.pdfwriter), a minimal PDF
+writer that renders a page in milliseconds without importing matplotlib.
+'''
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+
+PDF_KINDS = ('table', 'crosstable')
+
+PDF_BACKENDS = {
+    'matplotlib' : 'league.figures',
+    'native' : 'league.pdfwriter',
+}
+
+
+def get_pdf_backend_name():
+    return getattr(settings, 'LEAGUE_PDF_BACKEND', 'matplotlib')
+
+
+def get_pdf_backend():
+    return import_module(PDF_BACKENDS[get_pdf_backend_name()])
+
+
+def pdf_cache_key(kind, league):
+    return 'league-pdf-%s-%s-%s' % (get_pdf_backend_name(), kind, league.pk)
+
+
+def pdf_version(league):
+    if league.updated_date is None:
+        return ''
+    return league.updated_date.isoformat()
+
+
+def pdf_etag(kind, league):
+    return '%s-%s-%s-%s' % (get_pdf_backend_name(), kind, league.pk, pdf_version(league))
+
+
+def pdf_data(kind, league):
+    from .utils import table_data, crosstable_data
+    return { 'table' : table_data, 'crosstable' : crosstable_data }[kind](league)
+
+
+def render_pdf(kind, league):
+    return get_pdf_backend().render(kind, pdf_data(kind, league))
+
+
+def get_league_pdf(kind, league):
+    '''
+    The PDF of a league from the cache, rendered if missing or out of date
+    '''
+    key = pdf_cache_key(kind, league)
+    version = pdf_version(league)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    pdf = render_pdf(kind, league)
+    cache.set(key, (version, pdf), getattr(settings, 'LEAGUE_PDF_CACHE_TIMEOUT', None))
+    return pdf
+
+
+def invalidate_league_pdfs(league):
+    cache.delete_many([ pdf_cache_key(kind, league) for kind in PDF_KINDS ])
+
+
+def export_pdfs(kind, leagues, workers = None):
+    '''
+    One PDF with a page for each of leagues. The data of every league is
+    loaded here and handed to the backend, the matplotlib one drawing the
+    figures in a pool of workers, LEAGUE_PDF_WORKERS or the number of CPUs
+    by default.
+    '''
+    data = [ pdf_data(kind, league) for league in leagues ]
+    if workers is None:
+        workers = getattr(settings, 'LEAGUE_PDF_WORKERS', None)
+    return get_pdf_backend().render_many(kind, data, workers)
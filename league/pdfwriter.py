@@ -0,0 +1,424 @@
+'''
+A minimal PDF writer for the league table and crosstable, the lightweight
+alternative to drawing them with matplotlib.
+
+Pages are grids of Helvetica text, one of the standard PDF fonts so that
+nothing has to be embedded, and the club logo decoded from its PNG. Like
+league.figures the pages are drawn from the plain data built by table_data
+and crosstable_data in league.utils.
+'''
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+A4 = (595.28, 841.89)
+
+# advance widths of the printable ASCII characters in 1/1000 of the font size
+HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+# resource name, base font and widths, by boldness
+FONTS = {
+    False : (b'F1', b'Helvetica', HELVETICA),
+    True  : (b'F2', b'Helvetica-Bold', HELVETICA_BOLD),
+}
+
+
+def encode_text(text):
+    # the fonts use WinAnsiEncoding, which is cp1252
+    return str(text).encode('cp1252', 'replace')
+
+
+def text_width(text, size, bold = False):
+    widths = FONTS[bold][2]
+    total = 0
+    for c in encode_text(text):
+        if 32 <= c < 127: total += widths[c - 32]
+        elif c == 0xbd: total += 834 # one half
+        else: total += 556
+    return total * size / 1000.0
+
+
+def escape(data):
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def unfilter_png(data, stride, height, bpp):
+    '''
+    Undo the PNG filter of each scanline, returning the raw samples
+    '''
+    out = bytearray(stride * height)
+    prior = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        kind = data[pos]
+        line = bytearray(data[pos + 1:pos + 1 + stride])
+        pos += stride + 1
+        if kind == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xff
+        elif kind == 2:
+            for i in range(stride):
+                line[i] = (line[i] + prior[i]) & 0xff
+        elif kind == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prior[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in range(stride):
+                a = line[i - bpp] if i >= bpp else 0
+                b = prior[i]
+                c = prior[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc: predictor = a
+                elif pb <= pc: predictor = b
+                else: predictor = c
+                line[i] = (line[i] + predictor) & 0xff
+        elif kind != 0:
+            raise ValueError('Unknown PNG filter %i' % kind)
+        out[y * stride:(y + 1) * stride] = line
+        prior = line
+    return out
+
+
+def read_png(path):
+    '''
+    Decode an 8 bit RGB or RGBA PNG, returning its width, height, RGB samples
+    and alpha samples, None if it has no alpha channel
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('%s is not a PNG' % path)
+    pos, idat, header = 8, [], None
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        if kind == b'IHDR': header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT': idat += [ chunk ]
+        elif kind == b'IEND': break
+        pos += 12 + length
+    width, height, depth, colour, compression, filtering, interlace = header
+    if depth != 8 or colour not in (2, 6) or interlace:
+        raise ValueError('%s is not an 8 bit RGB or RGBA PNG without interlacing' % path)
+    channels = 4 if colour == 6 else 3
+    samples = unfilter_png(zlib.decompress(b''.join(idat)), width * channels, height, channels)
+    if channels == 3:
+        return width, height, bytes(samples), None
+    rgb = bytearray(width * height * 3)
+    for c in range(3):
+        rgb[c::3] = samples[c::4]
+    return width, height, bytes(rgb), bytes(samples[3::4])
+
+
+@lru_cache(maxsize=None)
+def get_logo(path):
+    '''
+    The club logo compressed for a PDF image, decoded once per process
+    '''
+    width, height, rgb, alpha = read_png(path)
+    return width, height, zlib.compress(rgb), zlib.compress(alpha) if alpha is not None else None
+
+
+REFERENCE_RE = re.compile(rb'(\d+) 0 R')
+OBJECT_RE = re.compile(rb'\s*(\d+)\s+0\s+obj\s*')
+
+
+def read_pdf_objects(data):
+    '''
+    The objects of a PDF by number, as (head, stream data or None), found
+    through its cross-reference table
+    '''
+    xref = int(data[data.rindex(b'startxref') + 9:].split()[0])
+    lines = data[xref:data.index(b'trailer', xref)].split(b'\n')[1:]
+    offsets = []
+    while lines and lines[0].strip():
+        first, count = [ int(v) for v in lines[0].split() ]
+        for i, entry in enumerate(lines[1:count + 1]):
+            offset, generation, kind = entry.split()
+            if kind == b'n':
+                offsets += [ (first + i, int(offset)) ]
+        lines = lines[count + 1:]
+
+    bodies = {}
+    for n, offset in offsets:
+        match = OBJECT_RE.match(data, offset)
+        bodies[n] = data[match.end():]
+    objects = {}
+    for n, body in bodies.items():
+        end = body.index(b'endobj')
+        start = body.find(b'stream', 0, end)
+        if start < 0:
+            objects[n] = (body[:end].strip(), None)
+            continue
+        head = body[:start].strip()
+        # the length of the stream data, given directly or as an object
+        length = re.search(rb'/Length\s+(\d+)(\s+0\s+R)?', head)
+        size = int(length.group(1))
+        if length.group(2):
+            size = int(bodies[size][:bodies[size].index(b'endobj')])
+        start += len(b'stream')
+        start += 2 if body[start:start + 2] == b'\r\n' else 1
+        objects[n] = (head, body[start:start + size])
+    return objects
+
+
+class PdfDocument(object):
+    '''
+    Objects of the document are kept as bytes in order, object number i + 1
+    being self.objects[i], and written out by write
+    '''
+    def __init__(self):
+        self.objects = []
+        self.pages = []
+        self.images = {}
+        self.pages_id = self.reserve()
+        self.fonts = { name : self.add(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % base)
+            for name, base, widths in FONTS.values() }
+
+    def reserve(self):
+        self.objects += [ None ]
+        return len(self.objects)
+
+    def add(self, body):
+        self.objects += [ body ]
+        return len(self.objects)
+
+    def add_stream(self, data, entries = b''):
+        return self.add(b'<< %s /Filter /FlateDecode /Length %i >>\nstream\n%s\nendstream' % (entries, len(data), data))
+
+    def image(self, path):
+        '''
+        Resource name, width and height of the image of a PNG, added to the
+        document the first time it is used
+        '''
+        if path not in self.images:
+            width, height, rgb, alpha = get_logo(path)
+            entries = b'/Type /XObject /Subtype /Image /Width %i /Height %i /BitsPerComponent 8' % (width, height)
+            smask = b''
+            if alpha is not None:
+                smask = b' /SMask %i 0 R' % self.add_stream(alpha, entries + b' /ColorSpace /DeviceGray')
+            image = self.add_stream(rgb, entries + b' /ColorSpace /DeviceRGB' + smask)
+            self.images[path] = (b'Im%i' % (len(self.images) + 1), image, width, height)
+        name, image, width, height = self.images[path]
+        return name, width, height
+
+    def add_page(self, page):
+        content = self.add_stream(zlib.compress(b'\n'.join(page.ops)))
+        fonts = b' '.join(b'/%s %i 0 R' % (name, i) for name, i in self.fonts.items())
+        images = b' '.join(b'/%s %i 0 R' % (self.images[path][0], self.images[path][1]) for path in page.images)
+        self.pages += [ self.add(b'<< /Type /Page /Parent %i 0 R /MediaBox [0 0 %.2f %.2f] /Contents %i 0 R /Resources << /Font << %s >> /XObject << %s >> >> >>'
+            % (self.pages_id, page.width, page.height, content, fonts, images)) ]
+
+    def add_pdf(self, data):
+        '''
+        Append the pages of another PDF, one with a plain cross-reference
+        table as matplotlib and this writer make them. Every object but the
+        catalog, the page tree and the document info is copied, renumbered,
+        the stream data as it is.
+        '''
+        objects = read_pdf_objects(data)
+        trailer = data[data.rindex(b'trailer'):]
+        root = int(REFERENCE_RE.search(trailer[trailer.index(b'/Root'):]).group(1))
+        info = REFERENCE_RE.search(trailer[trailer.index(b'/Info'):]) if b'/Info' in trailer else None
+        skipped = set([ root ] + ([ int(info.group(1)) ] if info else []))
+
+        # the page tree is flattened into the one of this document
+        numbers, pages = {}, []
+        nodes = [ int(REFERENCE_RE.search(objects[root][0][objects[root][0].index(b'/Pages'):]).group(1)) ]
+        while nodes:
+            n = nodes.pop(0)
+            head = objects[n][0]
+            if re.search(rb'/Type\s*/Pages\b', head):
+                skipped.add(n)
+                numbers[n] = self.pages_id
+                kids = head[head.index(b'/Kids'):]
+                nodes += [ int(k) for k in REFERENCE_RE.findall(kids[:kids.index(b']')]) ]
+            else:
+                pages += [ n ]
+        for n in objects:
+            if n not in skipped:
+                numbers[n] = self.reserve()
+
+        def renumber(match):
+            return b'%i 0 R' % numbers.get(int(match.group(1)), 0)
+        for n, (head, stream) in objects.items():
+            if n not in skipped:
+                body = REFERENCE_RE.sub(renumber, head)
+                if stream is not None:
+                    body += b'\nstream\n%s\nendstream' % stream
+                self.objects[numbers[n] - 1] = body
+        self.pages += [ numbers[n] for n in pages ]
+
+    def write(self):
+        self.objects[self.pages_id - 1] = b'<< /Type /Pages /Kids [%s] /Count %i >>' % (
+            b' '.join(b'%i 0 R' % p for p in self.pages), len(self.pages))
+        catalog = self.add(b'<< /Type /Catalog /Pages %i 0 R >>' % self.pages_id)
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for i, body in enumerate(self.objects):
+            offsets += [ len(out) ]
+            out += b'%i 0 obj\n%s\nendobj\n' % (i + 1, body)
+        xref = len(out)
+        out += b'xref\n0 %i\n0000000000 65535 f \n' % (len(self.objects) + 1)
+        for offset in offsets:
+            out += b'%010i 00000 n \n' % offset
+        out += b'trailer\n<< /Size %i /Root %i 0 R >>\nstartxref\n%i\n%%%%EOF\n' % (len(self.objects) + 1, catalog, xref)
+        return bytes(out)
+
+
+class Page(object):
+    '''
+    Drawing operations of one page, y runs down from the top of the page
+    '''
+    def __init__(self, document, width, height):
+        self.document = document
+        self.width = width
+        self.height = height
+        self.ops = []
+        self.images = []
+
+    def text(self, x, y, text, size, bold = False, align = 'left'):
+        # y is the baseline
+        if align == 'center': x -= text_width(text, size, bold) / 2
+        elif align == 'right': x -= text_width(text, size, bold)
+        self.ops += [ b'BT /%s %.2f Tf %.2f %.2f Td (%s) Tj ET' % (FONTS[bold][0], size, x, self.height - y, escape(encode_text(text))) ]
+
+    def rect(self, x, y, width, height, fill = None, stroke = True):
+        box = b'%.2f %.2f %.2f %.2f re' % (x, self.height - y - height, width, height)
+        if fill is not None:
+            self.ops += [ b'%.3f g %s f 0 g' % (fill, box) ]
+        if stroke:
+            self.ops += [ b'%s S' % box ]
+
+    def image(self, path, x, y, height):
+        '''
+        Draw a PNG height high, returning its width
+        '''
+        name, w, h = self.document.image(path)
+        width = height * w / h
+        if path not in self.images: self.images += [ path ]
+        self.ops += [ b'q %.2f 0 0 %.2f %.2f %.2f cm /%s Do Q' % (width, height, x, self.height - y - height, name) ]
+        return width
+
+
+def fit_size(text, size, width, bold = False):
+    # shrink the font size for text to fit in width
+    w = text_width(text, size, bold)
+    return size if w <= width else size * width / w
+
+
+def draw_grid(page, x, y, widths, row_height, rows, size, header = None, fills = None, align = None):
+    '''
+    Draw a table of rows of cells from (x, y), the top left corner. Cells
+    may hold several lines separated by newlines, fills gives the grey level
+    of each cell, None for none, and align the alignment of each column.
+    '''
+    align = align or [ 'center' ] * len(widths)
+    lines = []
+    if header is not None:
+        lines += [ (header, True, None) ]
+    lines += [ (row, False, fills[i] if fills else None) for i, row in enumerate(rows) ]
+    for r, (row, bold, row_fills) in enumerate(lines):
+        top = y + r * row_height
+        left = x
+        for c, (cell, width) in enumerate(zip(row, widths)):
+            page.rect(left, top, width, row_height, fill = row_fills[c] if row_fills else None)
+            texts = str(cell).split('\n') if cell is not None else []
+            if texts:
+                leading = row_height / len(texts)
+                for l, text in enumerate(texts):
+                    s = fit_size(text, min(size, leading * 0.7), width - 4, bold)
+                    baseline = top + leading * l + (leading + s * 0.7) / 2
+                    if align[c] == 'left': tx = left + 2
+                    elif align[c] == 'right': tx = left + width - 2
+                    else: tx = left + width / 2
+                    page.text(tx, baseline, text, s, bold, align[c])
+            left += width
+    return y + len(lines) * row_height
+
+
+def draw_heading(page, data, logo_height, title_size):
+    # logo centred at the top with the title underneath, returns where the page continues
+    margin = 30
+    name, w, h = page.document.image(data['logo'])
+    page.image(data['logo'], (page.width - logo_height * w / h) / 2, margin, logo_height)
+    top = margin + logo_height + title_size * 1.5
+    page.text(page.width / 2, top, data['title'], title_size, align = 'center')
+    return top + title_size
+
+
+def draw_footer(page, data):
+    page.text(page.width / 2, page.height - 30, "Last updated on %s"%(data['updated']), 10, align = 'center')
+
+
+def draw_table(document, data):
+    page = Page(document, *A4)
+    margin = 42
+    top = draw_heading(page, data, 48, 20)
+    rows = data['rows']
+    available = page.width - 2 * margin
+    widths = [ available * 0.08 ] + [ available * 0.92 * f for f in (0.4, 0.12, 0.12, 0.12, 0.12, 0.12) ]
+    row_height = min(22.0, (page.height - top - 70) / (len(rows) + 1))
+    draw_grid(page, margin, top, widths, row_height,
+        [ [ p ] + list(r) for p, r in zip(data['positions'], rows) ],
+        min(14, row_height * 0.6),
+        header = [ '', 'Name', 'P', 'W', 'D', 'L', 'Pts' ],
+        fills = [ [ 0.9 if i % 2 else None ] * len(widths) for i in range(len(rows)) ],
+        align = [ 'center', 'left', 'center', 'center', 'center', 'center', 'center' ])
+    draw_footer(page, data)
+    document.add_page(page)
+
+
+def draw_crosstable(document, data):
+    page = Page(document, A4[1], A4[0])
+    margin = 30
+    top = draw_heading(page, data, 32, 16)
+    rows = data['rows']
+    n = len(rows)
+    available = page.width - 2 * margin
+    label, name, total = available * 0.04, available * 0.2, available * 0.05
+    cell = (available - label - name - 5 * total) / max(1, n)
+    widths = [ label, name ] + [ cell ] * n + [ total ] * 5
+    row_height = min(36.0, (page.height - top - 50) / (n + 1))
+    fills = [ [ None, None ] + [ 0.8 if i == j else None for j in range(n) ] + [ None ] * 5 for i in range(n) ]
+    draw_grid(page, margin, top, widths, row_height,
+        [ [ p ] + list(r) for p, r in zip(data['positions'], rows) ],
+        min(10, 200.0 / max(1, n)),
+        header = [ '', 'Name' ] + [ str(i + 1) for i in range(n) ] + [ 'P', 'W', 'D', 'L', 'Pts' ],
+        fills = fills,
+        align = [ 'center', 'left' ] + [ 'center' ] * (n + 5))
+    draw_footer(page, data)
+    document.add_page(page)
+
+
+DRAW = { 'table' : draw_table, 'crosstable' : draw_crosstable }
+
+
+def render(kind, data):
+    document = PdfDocument()
+    DRAW[kind](document, data)
+    return document.write()
+
+
+def render_many(kind, data, workers = None):
+    # drawing a page takes milliseconds, no point in a pool of workers
+    document = PdfDocument()
+    for d in data:
+        DRAW[kind](document, d)
+    return document.write()
@@ -0,0 +1,159 @@
+'''
+Parsing PGN games in full, in a pool of worker processes.
+
+python-chess parses a game in about a millisecond and a half, on one core,
+so a large file is split at the game boundaries by the header scan of
+pgnscan and the games are parsed in chunks of CHUNK_SIZE by a pool of worker
+processes, LEAGUE_PGN_WORKERS or the number of CPUs by default. For a file
+on disk the workers are only given the byte range of their chunk and read it
+themselves. The results come back in the order of the games.
+
+Each game is normalised into a ParsedGame: its headers, the moves of its main
+line in UCI, the position at the end, and the errors python-chess found on
+the way. The moves are read with a visitor rather than into a tree of nodes,
+and not written back in SAN, which would take longer than reading them.
+'''
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import chess.pgn
+
+from .pgnscan import scan_pgn
+
+# games parsed by a worker at a time
+CHUNK_SIZE = 200
+
+
+class ParsedGame(object):
+    '''
+    A game parsed in full, errors is empty for a valid one
+    '''
+    def __init__(self, headers, moves, fen, errors):
+        self.headers = headers
+        self.moves = moves
+        self.fen = fen
+        self.errors = errors
+
+    @property
+    def plies(self):
+        return len(self.moves)
+
+    def __repr__(self):
+        return '<ParsedGame %s - %s, %i plies>' % (self.headers.get('White'), self.headers.get('Black'), self.plies)
+
+
+class GameParser(chess.pgn.BaseVisitor):
+    '''
+    Reads a game into a ParsedGame without building its tree of moves.
+    Variations are skipped and the errors kept without logging them.
+    '''
+    def begin_game(self):
+        self.headers = {}
+        self.moves = []
+        self.board = None
+        self.errors = []
+        self.depth = 0
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        self.moves.append(move.uci())
+
+    def visit_board(self, board):
+        # the board of the main line, python-chess pushes every move onto it
+        self.board = board
+
+    def handle_error(self, error):
+        self.errors.append(str(error))
+
+    def result(self):
+        fen = self.board.fen() if self.board is not None else chess.STARTING_FEN
+        return ParsedGame(self.headers, self.moves, fen, self.errors)
+
+
+def parse_game(pgn):
+    '''
+    The ParsedGame of the text of one game
+    '''
+    game = chess.pgn.read_game(io.StringIO(pgn), Visitor = GameParser)
+    if game is None:
+        return ParsedGame({}, [], chess.STARTING_FEN, [ 'no game' ])
+    return game
+
+
+def parse_texts(texts):
+    return [ parse_game(pgn) for pgn in texts ]
+
+
+def parse_range(path, start, end):
+    '''
+    Parse the games between two byte offsets of a PGN file
+    '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return [ parse_game(g.text()) for g in scan_pgn(io.BytesIO(data), keep_text = True) ]
+
+
+def get_workers(workers = None):
+    if workers is None:
+        from django.conf import settings
+        workers = getattr(settings, 'LEAGUE_PGN_WORKERS', None) if settings.configured else None
+    return workers or os.cpu_count() or 1
+
+
+def chunked(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterable, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def run_chunks(func, chunks, workers):
+    '''
+    func on every chunk, in this process if workers is 1, yielding the
+    results game by game in order
+    '''
+    if workers <= 1:
+        for chunk in chunks:
+            for parsed in func(*chunk):
+                yield parsed
+        return
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        # a few chunks ahead of the one being yielded keep every worker busy
+        pending = []
+        chunks = iter(chunks)
+        for chunk in itertools.islice(chunks, 2 * workers):
+            pending.append(executor.submit(func, *chunk))
+        while pending:
+            results = pending.pop(0).result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(func, *chunk))
+            for parsed in results:
+                yield parsed
+
+
+def parse_pgn_file(path, workers = None, chunk_size = CHUNK_SIZE):
+    '''
+    The ParsedGame of every game of a PGN file, in order
+    '''
+    def ranges():
+        with open(path, 'rb') as f:
+            for games in chunked(scan_pgn(f), chunk_size):
+                yield path, games[0].start, games[-1].end
+    return run_chunks(parse_range, ranges(), get_workers(workers))
+
+
+def parse_pgn_texts(texts, workers = None, chunk_size = CHUNK_SIZE):
+    '''
+    The ParsedGame of each PGN of an iterable, in order
+    '''
+    return run_chunks(parse_texts, ((chunk,) for chunk in chunked(texts, chunk_size)), get_workers(workers))
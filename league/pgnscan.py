@@ -0,0 +1,138 @@
+'''
+Scanning PGN files for their headers without parsing the moves.
+
+Importing games or puzzles mostly needs the tags of each game (Site, White,
+Black, Result, Date...) and the PGN as it is, which python-chess only gives
+by parsing every move. scan_pgn goes through the file line by line instead,
+splitting it at the game boundaries and reading only the tag pairs, and
+yields a ScannedGame for each game with its headers and where it lies in
+the file. The moves are parsed, by python-chess, only when game() is called.
+'''
+import io
+import itertools
+import re
+
+import chess.pgn
+
+# the tag pairs python-chess reads, values are left as they are in the file
+TAG_RE = re.compile(r'^\s*\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+"([^\r]*)"\]\s*$')
+
+# the UTF-8 byte order mark some files start with
+BOM = b'\xef\xbb\xbf'
+
+# where the scanner is in the game
+TAGS, MOVES = range(2)
+
+
+def parse_tag(line):
+    '''
+    The (name, value) of a tag pair line, or None for any other line, e.g.
+    a [%clk] comment at the start of a line of moves
+    '''
+    match = TAG_RE.match(line)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def pgn_text(text):
+    '''
+    The text of a game, decoded if bytes, with the line endings of a text
+    file whatever those of the file
+    '''
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    return text.replace('\r\n', '\n').strip() + '\n'
+
+
+class ScannedGame(object):
+    '''
+    One game of a PGN file: its headers, the offsets in bytes of its first
+    line and of the end of its last one, and its text when the scan kept it
+    '''
+    def __init__(self, headers, start, end, source = None, pgn = None):
+        self.headers = headers
+        self.start = start
+        self.end = end
+        self.source = source
+        self.pgn = pgn
+
+    def text(self):
+        '''
+        The PGN of the game as it is in the file, read back from the file
+        when the scan did not keep it, which must then still be open
+        '''
+        if self.pgn is None:
+            position = self.source.tell()
+            self.source.seek(self.start)
+            pgn = self.source.read(self.end - self.start)
+            self.source.seek(position)
+            return pgn_text(pgn)
+        return self.pgn
+
+    def game(self):
+        '''
+        The game parsed by python-chess
+        '''
+        return chess.pgn.read_game(io.StringIO(self.text()))
+
+
+def scan_pgn(f, keep_text = False):
+    '''
+    The games of a PGN file, or any iterable of its lines, as ScannedGame.
+    keep_text keeps the text of each game, for a stream that can't be read
+    back, otherwise f must be a file opened in binary mode that can be
+    seeked: a text file can only seek to where tell() was, and its newline
+    translation makes the character counts wrong anyway.
+
+    A game starts at its first tag pair and a tag pair after its moves
+    starts the next one, as python-chess splits games.
+    '''
+    lines = iter(f)
+    first = next(lines, None)
+    if first is None:
+        return
+    # only the tag lines of a binary file are decoded
+    binary = isinstance(first, bytes)
+    if not binary and not keep_text:
+        raise TypeError('scan_pgn needs a file opened in binary mode to read the games back, or keep_text')
+    bracket = b'[' if binary else '['
+    # a byte order mark at the start of the file, as python-chess skips it
+    bom = BOM if binary else BOM.decode('utf-8')
+    skipped = 0
+    if first.startswith(bom):
+        first, skipped = first[len(bom):], len(BOM)
+
+    def scanned(headers, start, end, kept):
+        pgn = None
+        if keep_text:
+            pgn = pgn_text((b'' if binary else '').join(kept))
+        return ScannedGame(headers, start, end, None if keep_text else f, pgn)
+
+    headers, kept = {}, []
+    state, start, end, offset = None, 0, 0, skipped
+    for line in itertools.chain([first], lines):
+        stripped = line.strip()
+        tag = None
+        if stripped[:1] == bracket:
+            tag = parse_tag(line.decode('utf-8', 'replace') if binary else line)
+        if tag is not None and state == MOVES:
+            yield scanned(headers, start, end, kept)
+            headers, kept, state = {}, [], None
+        if tag is not None:
+            if state is None:
+                state, start = TAGS, offset
+            headers[tag[0]] = tag[1]
+        elif stripped:
+            if state is None:
+                # a game without tags
+                start = offset
+            state = MOVES
+        offset += len(line)
+        if state is not None:
+            if stripped:
+                end = offset
+            if keep_text:
+                kept.append(line)
+    if state is not None:
+        yield scanned(headers, start, end, kept)
@@ -0,0 +1,87 @@
+'''
+The teams, squads, fixtures and members of a season, loaded in a constant
+number of queries and shared by the season, team_fixtures and team_squads
+pages.
+
+The loaded seasons are kept in the Django cache under a generation number
+that league.signals bumps whenever a Season, Team, TeamPlayer, TeamFixture or
+Player changes, these change rarely and mostly while a season is being set up.
+'''
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Team, TeamPlayer, TeamFixture
+
+# the club's own name, a home fixture against another of the club's teams is
+# listed by both teams and only the away one is kept in the season's fixtures
+CLUB_NAME = 'wallasey'
+
+SEASON_GENERATION_KEY = 'season-data-generation'
+
+
+class SeasonData(object):
+    '''
+    teams are the teams of the season, each with its squad, ordered by
+    rating, and its fixtures, ordered by date. fixtures are the fixtures of
+    every team without the internal duplicates and members the players of
+    the season.
+    '''
+    def __init__(self, season, teams, members):
+        self.season = season
+        self.teams = teams
+        self.members = members
+        self.fixtures = sorted([ f for t in teams for f in t.fixtures if not is_internal_duplicate(f) ],
+            key = lambda f : (f.date is not None, f.date))
+
+    def squads(self):
+        return { t : t.squad for t in self.teams }
+
+    def fixtures_by_team(self):
+        return { t : t.fixtures for t in self.teams }
+
+
+def is_internal_duplicate(fixture):
+    return fixture.home and CLUB_NAME in (fixture.opponent or '').lower()
+
+
+def load_season(season):
+    '''
+    Load the data of a season from the database in four queries
+    '''
+    teams = list(Team.objects.filter(season = season).select_related('captain').order_by('pk').prefetch_related(
+        Prefetch('teamplayer_set', queryset = TeamPlayer.objects.select_related('player').order_by('-player__rating'), to_attr = 'squad'),
+        Prefetch('teamfixture_set', queryset = TeamFixture.objects.order_by('date'), to_attr = 'fixtures'),
+    ))
+    members = list(season.players.all().order_by('-rating'))
+    return SeasonData(season, teams, members)
+
+
+def get_season_generation():
+    generation = cache.get(SEASON_GENERATION_KEY)
+    if generation is None:
+        # from the clock so that an evicted counter never goes back
+        cache.add(SEASON_GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(SEASON_GENERATION_KEY)
+    return generation
+
+
+def invalidate_seasons():
+    try:
+        cache.incr(SEASON_GENERATION_KEY)
+    except ValueError:
+        cache.add(SEASON_GENERATION_KEY, int(time.time() * 1000), None)
+
+
+def get_season_data(season):
+    '''
+    The data of a season from the cache, loaded if missing
+    '''
+    key = 'season-data-%s-%s' % (season.pk, get_season_generation())
+    data = cache.get(key)
+    if data is None:
+        data = load_season(season)
+        cache.set(key, data, getattr(settings, 'LEAGUE_PAGE_CACHE_TIMEOUT', 600))
+    return data
@@ -0,0 +1,100 @@
+'''
+Invalidation of the cached league pages, player careers, seasons and Swiss
+pairing states when the models they are built from change
+'''
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import League, Schedule, Standings, Season, Player, Team, TeamPlayer, TeamFixture, PairingState
+from .pagecache import bump_league_version
+from .career import invalidate_careers
+from .seasons import invalidate_seasons
+
+
+@receiver(post_save, sender = League)
+@receiver(post_delete, sender = League)
+def league_changed(sender, instance, **kwargs):
+    bump_league_version(instance.slug)
+
+
+@receiver(post_save, sender = Schedule)
+@receiver(post_delete, sender = Schedule)
+def game_changed(sender, instance, **kwargs):
+    invalidate_careers(instance.white_id, instance.black_id)
+
+
+LEAGUE_POINTS = ('win_points', 'draw_points', 'lost_points')
+
+
+@receiver(pre_save, sender = League)
+def league_saving(sender, instance, **kwargs):
+    # the points before the save, standings_save saves the league routinely
+    # and only a change of the points makes the pairing states stale
+    instance._saved_points = None
+    if instance.pk is not None:
+        instance._saved_points = League.objects.filter(pk = instance.pk).values_list(*LEAGUE_POINTS).first()
+
+
+@receiver(post_save, sender = League)
+def league_points_changed(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_points', None)
+    if not created and saved is not None and saved != tuple(getattr(instance, f) for f in LEAGUE_POINTS):
+        PairingState.objects.filter(league = instance.pk).delete()
+
+
+def invalidate_pairing_states(games):
+    '''
+    Drop the pairing states made stale by games, (league id, round) pairs,
+    only a game of a round the state was stored after makes it stale
+    '''
+    for league, round in set(games):
+        if league is not None and round is not None:
+            PairingState.objects.filter(league = league, round__gte = round).delete()
+
+
+@receiver(pre_save, sender = Schedule)
+def game_saving(sender, instance, **kwargs):
+    # the league and round before the save, a game moved to another round or
+    # league leaves the states of the old one stale too
+    instance._saved_round = None
+    if instance.pk is not None:
+        instance._saved_round = Schedule.objects.filter(pk = instance.pk).values_list('league', 'round').first()
+
+
+@receiver(post_save, sender = Schedule)
+@receiver(post_delete, sender = Schedule)
+def round_changed(sender, instance, **kwargs):
+    games = [ (instance.league_id, instance.round) ]
+    if getattr(instance, '_saved_round', None) is not None:
+        games += [ instance._saved_round ]
+    invalidate_pairing_states(games)
+
+
+@receiver(post_save, sender = Schedule)
+@receiver(post_delete, sender = Schedule)
+@receiver(post_save, sender = Standings)
+@receiver(post_delete, sender = Standings)
+def league_game_changed(sender, instance, **kwargs):
+    if instance.league_id is None:
+        return
+    if sender._meta.get_field('league').is_cached(instance):
+        slug = instance.league.slug
+    else:
+        slug = League.objects.filter(pk = instance.league_id).values_list('slug', flat = True).first()
+    if slug is not None:
+        bump_league_version(slug)
+
+
+@receiver(post_save, sender = Season)
+@receiver(post_delete, sender = Season)
+@receiver(post_save, sender = Player)
+@receiver(post_delete, sender = Player)
+@receiver(post_save, sender = Team)
+@receiver(post_delete, sender = Team)
+@receiver(post_save, sender = TeamPlayer)
+@receiver(post_delete, sender = TeamPlayer)
+@receiver(post_save, sender = TeamFixture)
+@receiver(post_delete, sender = TeamFixture)
+@receiver(m2m_changed, sender = Season.players.through)
+def season_changed(sender, **kwargs):
+    invalidate_seasons()
@@ -0,0 +1,434 @@
+import copy
+import math
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import League, Schedule, Standings, PairingState, STANDINGS_ORDER
+from .pdf import invalidate_league_pdfs
+from .pagecache import invalidate_league_pages
+from .career import invalidate_careers
+
+# columns of Standings recomputed from the games, the position is set
+# afterwards by standings_position_update
+STANDINGS_FIELDS = (
+    'points', 'win', 'win1', 'lost', 'draws', 'matches', 'matches1', 'winpercent',
+    'form', 'nbs', 'buchholz', 'buchholzcut1', 'opprating', 'performance',
+)
+
+
+def get_league_games(league, players = None):
+    '''
+    Fetch the games of a league in one query, most recent first, with both
+    players joined in. If players is given only their games are returned.
+    '''
+    games = Schedule.objects.filter(league = league.pk)
+    if players is not None:
+        games = games.filter(Q(white__in = players) | Q(black__in = players))
+    return list(games.select_related('white', 'black').order_by('-date'))
+
+
+def save_games(games):
+    '''
+    Insert new games with one bulk_create in a single transaction. As
+    bulk_create sends no signals the cached pages, careers and pairing states
+    they would have invalidated are invalidated here, once per league.
+    '''
+    if len(games) == 0:
+        return games
+    leagues = {}
+    for g in games:
+        if g.league_id is not None:
+            leagues.setdefault(g.league_id, [ g.league, [] ])[1].append(g)
+    with transaction.atomic():
+        Schedule.objects.bulk_create(games)
+        for league, league_games in leagues.values():
+            rounds = [ int(g.round) for g in league_games if g.round is not None ]
+            if rounds:
+                PairingState.objects.filter(league = league.pk, round__gte = min(rounds)).delete()
+    for league, league_games in leagues.values():
+        invalidate_league_pages(league)
+    invalidate_careers(*set([ g.white_id for g in games ] + [ g.black_id for g in games ]))
+    return games
+
+
+class PlayerRecord(object):
+    '''
+    Running totals for one player while the games of a league are replayed
+    '''
+    def __init__(self, form_length):
+        self.form_length = form_length
+        self.points = 0
+        self.wins = 0
+        self.winswblack = 0
+        self.lost = 0
+        self.draws = 0
+        self.matches = 0
+        self.matcheswblack = 0
+        self.form = ''
+        self.wins_against = []
+        self.draws_against = []
+        self.lost_against = []
+        # for the performance rating
+        self.rated_games = 0
+        self.rated_total = 0.0
+
+    def add_form(self, result):
+        # games are replayed most recent first, matches has not been
+        # incremented yet so it is the index of this game
+        if self.matches < self.form_length:
+            self.form = result + self.form
+
+    def add_rated_game(self, opponent, won, lost):
+        if opponent is not None and opponent.rating != None and opponent.rating > 0:
+            self.rated_games += 1
+            self.rated_total += opponent.rating
+            if won: self.rated_total += 400
+            elif lost: self.rated_total -= 400
+
+    def performance(self):
+        if self.rated_games > 0:
+            return self.rated_total / self.rated_games
+        return self.rated_total
+
+
+def replay_games(league, players, games):
+    '''
+    Replay games, ordered by most recent first, and return a PlayerRecord
+    for each of the players ids
+    '''
+    win_points  = league.get_win_points_display()
+    draw_points = league.get_draw_points_display()
+    lost_points = league.get_lost_points_display()
+    form_length = 20 if league.get_format_display() == "Swiss" else 5
+
+    records = { p : PlayerRecord(form_length) for p in players }
+
+    for match in games:
+        white = records.get(match.white_id)
+        black = records.get(match.black_id)
+
+        # the performance rating counts every game, played or not
+        if white is not None:
+            white.add_rated_game(match.black, match.result == 1, match.result == 2)
+        if black is not None:
+            black.add_rated_game(match.white, match.result == 2, match.result == 1)
+
+        if match.result == 3: continue
+
+        if white is not None:
+            if match.result == 1:
+                white.add_form('W')
+                white.wins += 1
+                white.points += win_points
+                white.wins_against += [ match.black_id ]
+            elif match.result == 2:
+                white.add_form('L')
+                white.lost += 1
+                white.points += lost_points
+                white.lost_against += [ match.black_id ]
+            else:
+                white.add_form('D')
+                white.draws += 1
+                white.points += draw_points
+                white.draws_against += [ match.black_id ]
+            white.matches += 1
+
+        if black is not None:
+            if match.result == 2:
+                black.add_form('W')
+                black.wins += 1
+                black.winswblack += 1
+                black.points += win_points
+                black.wins_against += [ match.white_id ]
+            elif match.result == 1:
+                black.add_form('L')
+                black.lost += 1
+                black.points += lost_points
+                black.lost_against += [ match.white_id ]
+            elif match.result == 0:
+                black.add_form('D')
+                black.draws += 1
+                black.points += draw_points
+                black.draws_against += [ match.white_id ]
+            black.matches += 1
+            black.matcheswblack += 1
+    return records
+
+
+def pad_form(league, form, nrounds):
+    '''
+    In a Swiss, paired rounds should also be added to the form as P
+    '''
+    if league.get_format_display() == "Swiss":
+        while len(form) < nrounds:
+            form = form + 'P'
+    return form
+
+
+def apply_record(league, standing, record, nrounds):
+    '''
+    Copy the results of a replayed player onto their standing
+    '''
+    standing.form = pad_form(league, record.form, nrounds)
+    standing.points = record.points
+    standing.win = record.wins
+    standing.win1 = record.winswblack
+    standing.lost = record.lost
+    standing.draws = record.draws
+    standing.matches = record.matches
+    standing.matches1 = record.matcheswblack
+    standing.winpercent = float(record.wins) / record.matches if record.matches > 0 else 0.0
+    standing.performance = record.performance()
+
+
+def apply_tiebreaks(standings, records, players):
+    '''
+    Set the NBS, Buchholz and opponent rating of the standings of players
+    from their replayed records. standings holds every standing of the league
+    keyed by player id, with the points already up to date.
+    '''
+    # numpy is only loaded once standings are computed
+    from .tiebreaks import ScoreMatrix
+    ids = list(standings)
+    matrix = ScoreMatrix(ids,
+        [ standings[p].points for p in ids ],
+        [ standings[p].rating if standings[p].rating else 0 for p in ids ])
+    for p in players:
+        record = records[p]
+        matrix.add_results(p, record.wins_against, 1.0)
+        matrix.add_results(p, record.draws_against, 0.5)
+        matrix.add_results(p, record.lost_against, 0.0)
+
+    opponents    = matrix.opponents()
+    nbs          = matrix.sonneborn_berger()
+    buchholz     = matrix.buchholz()
+    buchholzcut1 = matrix.buchholz_cut1()
+    opprating    = matrix.opponent_rating()
+    for p in players:
+        i = matrix.index[p]
+        standing = standings[p]
+        standing.nbs = float(nbs[i])
+        standing.buchholz = float(buchholz[i])
+        standing.buchholzcut1 = float(buchholzcut1[i])
+        standing.opprating = float(opprating[i])
+        if opponents[i] == 0:
+            standing.performance = 0
+
+
+def compute_standings(league, standings, games):
+    '''
+    Fill in points, form, W/D/L and the tie break scores of standings from
+    games, a list of all the games in the league ordered by most recent first.
+    Nothing is written to the database.
+    '''
+    nrounds = len(set(g.round for g in games if g.round is not None))
+    records = replay_games(league, [ s.player_id for s in standings ], games)
+    for standing in standings:
+        apply_record(league, standing, records[standing.player_id], nrounds)
+    apply_tiebreaks({ s.player_id : s for s in standings }, records, records.keys())
+    return standings
+
+
+def touch_league(league):
+    '''
+    Mark the league updated now, the PDFs and their ETags are versioned by
+    updated_date
+    '''
+    league.updated_date = timezone.now()
+    League.objects.filter(pk = league.pk).update(updated_date = league.updated_date)
+
+
+def standings_refresh(league, games = None):
+    '''
+    Recompute every standing of a league from its games and write them back
+    with a single bulk update
+    '''
+    if games is None:
+        games = get_league_games(league)
+    standings = list(Standings.objects.filter(league = league.pk).select_related('player'))
+    compute_standings(league, standings, games)
+    Standings.objects.bulk_update(standings, STANDINGS_FIELDS)
+    touch_league(league)
+    invalidate_league_pdfs(league)
+    # bulk_update sends no signals
+    invalidate_league_pages(league)
+    return standings
+
+
+# for updating standings
+def standings_save(admin_site, request, instance):
+        league = League.objects.get(pk=instance.pk)
+        league.updated_date = timezone.now()
+        league.save()
+        for player in league.players.all():
+            obj, created = Standings.objects.get_or_create(league = league, player = player)
+            if created:
+                obj.rating = player.rating
+                obj.save()
+
+        standings = Standings.objects.filter(league = league).exclude(player__in = league.players.all())
+        for player in standings:
+                player.delete()
+
+def standings_value(standing, field):
+    # follow lookups like player__surename
+    value = standing
+    for attr in field.split('__'):
+        value = getattr(value, attr)
+    return value
+
+
+def standings_sort_key(field):
+    # None sorts lowest as it does in the database
+    def key(standing):
+        value = standings_value(standing, field)
+        return (False, 0) if value is None else (True, value)
+    return key
+
+
+def rank_standings(league, standings):
+    '''
+    Sort standings by the standings order of the league and number their
+    positions. Players level on every criterion but their name share a
+    position, the next player skipping the shared places.
+    '''
+    order = STANDINGS_ORDER[league.standings_order][1]
+    # a stable sort for each field, least significant first
+    for field in reversed(order):
+        standings.sort(key = standings_sort_key(field.lstrip('-')), reverse = field.startswith('-'))
+
+    criteria = [ f.lstrip('-') for f in order if not f.lstrip('-').startswith('player__') ]
+    previous = None
+    for i, standing in enumerate(standings):
+        key = tuple(standings_value(standing, f) for f in criteria)
+        if key != previous:
+            position = i + 1
+            previous = key
+        standing.position = position
+    return standings
+
+
+def standings_position_update(admin_site, request, league, standings = None):
+    '''
+    Re-rank a league, only the standings whose position changed are written
+    '''
+    if standings is None:
+        standings = list(Standings.objects.filter(league = league.pk).select_related('player'))
+    previous = { s.pk : s.position for s in standings }
+    rank_standings(league, standings)
+    changed = [ s for s in standings if s.position != previous[s.pk] ]
+    if changed:
+        Standings.objects.bulk_update(changed, ['position'])
+    invalidate_league_pdfs(league)
+    # bulk_update sends no signals
+    invalidate_league_pages(league)
+
+def standings_update(admin_site, request, instance):
+        games = get_league_games(instance)
+
+        players = set([ g.white for g in games if g.white is not None ] + [ g.black for g in games if g.black is not None])
+        listed = set(instance.players.values_list('pk', flat = True))
+        for p in players:
+            if p.pk not in listed:
+                admin_site.message_user(request, '%s has played a game in %s but is not listed among the league players'%(p,instance))
+
+        standings = standings_refresh(instance, games)
+        standings_position_update(admin_site, request, instance, standings)
+
+def standings_rebuild(admin_site, request, league):
+    '''
+    Full rebuild of the standings of a league, always correct but touches
+    every player
+    '''
+    standings_save(admin_site, request, league)
+    standings_update(admin_site, request, league)
+
+
+def standings_incremental_update(admin_site, request, league, players):
+    '''
+    Update the standings of a league after the games of players, a set of
+    player ids, have been added, changed or removed.
+
+    Only the players themselves and their opponents, whose Buchholz and NBS
+    depend on the players' points, are recomputed before re-ranking the
+    league. Falls back to a full rebuild when a player has no standing yet.
+    '''
+    players = set(p for p in players if p is not None)
+    standings = { s.player_id : s for s in Standings.objects.filter(league = league.pk).select_related('player') }
+    if not players.issubset(standings):
+        standings_rebuild(admin_site, request, league)
+        return
+
+    nrounds = 0
+    if league.get_format_display() == "Swiss":
+        nrounds = Schedule.objects.filter(league = league.pk, round__isnull = False).values('round').distinct().count()
+
+    games = get_league_games(league, players)
+    records = replay_games(league, players, games)
+
+    # anyone who has met the changed players needs their own games replayed,
+    # forfeits only count for one side so the results can't be used here
+    dependents = set([ g.white_id for g in games ] + [ g.black_id for g in games ])
+    dependents = set(p for p in dependents if p in standings) - players
+    if dependents:
+        games = get_league_games(league, dependents)
+        records.update(replay_games(league, dependents, games))
+
+    for p in players:
+        apply_record(league, standings[p], records[p], nrounds)
+
+    apply_tiebreaks(standings, records, players | dependents)
+
+    # a game in a new round adds a P to everyone else's form too, only
+    # results are W, L or D so the old padding can be stripped and redone
+    changed = players | dependents
+    if league.get_format_display() == "Swiss":
+        for p, standing in standings.items():
+            if p not in players:
+                form = pad_form(league, (standing.form or '').rstrip('P'), nrounds)
+                if form != standing.form:
+                    standing.form = form
+                    changed.add(p)
+
+    Standings.objects.bulk_update([ standings[p] for p in changed ], STANDINGS_FIELDS)
+    touch_league(league)
+    standings_position_update(admin_site, request, league, list(standings.values()))
+
+
+def standings_games_update(admin_site, request, games):
+    '''
+    Incrementally update the standings after games were saved or deleted,
+    games is an iterable of (league id, white id, black id) tuples, including
+    the values from before a change so that moved players are updated too
+    '''
+    by_league = {}
+    for league, white, black in games:
+        if league is not None:
+            by_league.setdefault(league, set()).update((white, black))
+    for league in League.objects.filter(pk__in = by_league.keys()):
+        standings_incremental_update(admin_site, request, league, by_league[league.pk])
+
+
+def standings_check(league):
+    '''
+    Compare the stored standings of a league with a full recomputation,
+    returning a list of (standing, field, stored value, expected value) for
+    every column that differs
+    '''
+    stored = list(Standings.objects.filter(league = league.pk).select_related('player'))
+    expected = compute_standings(league, [ copy.copy(s) for s in stored ], get_league_games(league))
+    rank_standings(league, expected)
+    expected = { e.pk : e for e in expected }
+    diffs = []
+    for s in stored:
+        e = expected[s.pk]
+        for field in STANDINGS_FIELDS + ('position',):
+            a, b = getattr(s, field), getattr(e, field)
+            if isinstance(a, float) or isinstance(b, float):
+                if a is not None and b is not None and math.isclose(a, b, abs_tol = 1e-9):
+                    continue
+            if a != b:
+                diffs += [ (s, field, a, b) ]
+    return diffs
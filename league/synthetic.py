@@ -0,0 +1,259 @@
+'''
+A synthetic club for trying the league code under load: seasons with a league
+of every tournament format, players with ratings, results drawn from the
+rating difference, PGNs, teams with squads and fixtures, and news.
+
+Everything is bulk created and the slugs start with the prefix, so a club can
+be generated next to real data and told apart from it.
+'''
+import datetime
+import math
+import random
+
+from django.utils import timezone
+
+from .models import (
+    Season, League, Player, Schedule, PGN, Team, TeamPlayer, TeamFixture, TOURNAMENT_FORMATS,
+)
+from .pairing import create_balanced_round_robin
+from .standings import standings_rebuild
+
+FIRST_NAMES = ('Alan', 'Beth', 'Chris', 'Dana', 'Eric', 'Fiona', 'Gary', 'Helen', 'Ian', 'Jane', 'Karl', 'Lucy',
+    'Mark', 'Nina', 'Owen', 'Paula', 'Rob', 'Sara', 'Tom', 'Vera')
+SURNAMES = ('Adams', 'Brown', 'Clarke', 'Davies', 'Evans', 'Foster', 'Green', 'Hughes', 'Jones', 'King', 'Lewis',
+    'Morris', 'Owen', 'Parry', 'Roberts', 'Smith', 'Taylor', 'Walker', 'White', 'Wright')
+OPPONENTS = ('Birkenhead', 'Hoylake', 'Liverpool', 'Chester', 'Southport', 'Crosby', 'Wallasey')
+OPENINGS = (
+    '1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O',
+    '1. d4 d5 2. c4 e6 3. Nc3 Nf6 4. Bg5 Be7 5. e3 O-O 6. Nf3 h6 7. Bh4 b6',
+    '1. e4 c5 2. Nf3 d6 3. d4 cxd4 4. Nxd4 Nf6 5. Nc3 a6 6. Be3 e5 7. Nb3 Be6',
+    '1. d4 Nf6 2. c4 g6 3. Nc3 Bg7 4. e4 d6 5. Nf3 O-O 6. Be2 e5 7. O-O Nc6',
+    '1. c4 e5 2. Nc3 Nf6 3. Nf3 Nc6 4. g3 d5 5. cxd5 Nxd5 6. Bg2 Nb6 7. O-O Be7',
+)
+PGN_RESULTS = { 0 : '1/2-1/2', 1 : '1-0', 2 : '0-1' }
+
+
+def expected_score(rating, opponent):
+    return 1.0 / (1.0 + math.pow(10, (opponent - rating) / 400.0))
+
+
+def random_result(rng, white, black):
+    '''
+    A result drawn from the Elo expectation of white, a third of the games
+    between close players being drawn
+    '''
+    expected = expected_score(white.rating, black.rating)
+    draw = 0.33 * (1.0 - abs(2 * expected - 1))
+    x = rng.random()
+    if x < draw: return 0
+    if x < draw + (1 - draw) * expected: return 1
+    return 2
+
+
+def swiss_rounds(rng, players, nrounds):
+    '''
+    Pairings of a Swiss, players of about the same score meet and nobody
+    meets the same opponent twice when it can be avoided
+    '''
+    scores = { p.pk : 0.0 for p in players }
+    met = set()
+    rounds = []
+    for r in range(nrounds):
+        order = sorted(players, key = lambda p : (-scores[p.pk], -p.rating, rng.random()))
+        pairs = []
+        while len(order) > 1:
+            white = order.pop(0)
+            opponent = next((o for o in order if (white.pk, o.pk) not in met), order[0])
+            order.remove(opponent)
+            if rng.random() < 0.5: white, opponent = opponent, white
+            met.update(((white.pk, opponent.pk), (opponent.pk, white.pk)))
+            pairs += [ (white, opponent) ]
+        if order:
+            pairs += [ (order[0], None) ]
+        for white, black in pairs:
+            if black is None:
+                scores[white.pk] += 1
+            else:
+                # the scores only steer the pairings, the results are drawn again
+                e = expected_score(white.rating, black.rating)
+                scores[white.pk] += e
+                scores[black.pk] += 1 - e
+        rounds += [ pairs ]
+    return rounds
+
+
+def swiss_games(rng, league, players, nrounds, start, in_progress):
+    '''
+    Pair and play the rounds of a Swiss one at a time with the Dutch pairing
+    engine, as the admin does. Should the engine fail to pair a round the
+    remaining rounds are paired by score.
+    '''
+    from swissdutch.dutch import DutchPairingEngine
+    from .pairing import get_last_round, get_next_round, get_pairs
+
+    for r in range(nrounds):
+        try:
+            pairs, id_pairs = get_pairs(get_next_round(r + 1, DutchPairingEngine(), get_last_round(league)))
+        except Exception:
+            rounds = swiss_rounds(rng, players, nrounds - r)
+            Schedule.objects.bulk_create(make_games(rng, league, rounds, start, 1 if in_progress else 0, first_round = r + 1))
+            return
+        unplayed = 1 if in_progress and r == nrounds - 1 else 0
+        Schedule.objects.bulk_create(make_games(rng, league, [ pairs ], start, unplayed, first_round = r + 1))
+
+
+def knockout_rounds(rng, players):
+    '''
+    The first round of a knockout for the largest power of two of players,
+    the later rounds are added as the results come in. Round 1 is the final.
+    '''
+    size = 2 ** int(math.log(len(players), 2))
+    entrants = sorted(players, key = lambda p : -p.rating)[:size]
+    return int(math.log(size, 2)), [ (entrants[i], entrants[size - 1 - i]) for i in range(size // 2) ]
+
+
+def make_games(rng, league, rounds, start, unplayed_rounds = 0, first_round = 1):
+    '''
+    Schedule objects for rounds of pairings, numbered from first_round and
+    played a week apart from start, the last unplayed_rounds without a result
+    '''
+    games = []
+    for r, pairs in enumerate(rounds, first_round - 1):
+        date = start + datetime.timedelta(days = 7 * r)
+        played = r - first_round + 1 < len(rounds) - unplayed_rounds
+        for board, (white, black) in enumerate(pairs):
+            if white is None:
+                white, black = black, None
+            game = Schedule(league = league, round = r + 1, board = board + 1, date = date, white = white, black = black,
+                white_rating = white.rating, black_rating = black.rating if black else None, result = 3)
+            if black is None:
+                # a bye
+                game.result = 1
+            elif played:
+                game.result = random_result(rng, white, black)
+            games += [ game ]
+    return games
+
+
+def make_pgn(rng, game, event):
+    headers = [ ('Event', event), ('Date', game.date.strftime('%Y.%m.%d')), ('Round', str(game.round)),
+        ('White', str(game.white)), ('Black', str(game.black)), ('Result', PGN_RESULTS[game.result]),
+        ('WhiteElo', str(game.white_rating)), ('BlackElo', str(game.black_rating)) ]
+    return '\n'.join('[%s "%s"]' % h for h in headers) + '\n\n%s %s\n' % (rng.choice(OPENINGS), PGN_RESULTS[game.result])
+
+
+def generate_club(seasons = 3, players = 60, league_size = 16, teams = 3, news = 10, pgn_fraction = 0.2,
+        prefix = 'synthetic', seed = 0, first_year = None):
+    '''
+    Generate a club and return the number of objects made of each kind. The
+    last season is in progress, its latest round has no results yet.
+    '''
+    from content.models import news as News
+
+    rng = random.Random(seed)
+    counts = {}
+    first_year = first_year or timezone.now().year - seasons + 1
+    members = Player.objects.bulk_create([ Player(name = rng.choice(FIRST_NAMES),
+        surename = '%s %s-%04i' % (rng.choice(SURNAMES), prefix, i),
+        rating = max(500, int(rng.gauss(1600, 300))), lichess = '%s%04i' % (prefix, i)) for i in range(players) ])
+    if members[0].pk is None:
+        members = list(Player.objects.filter(lichess__startswith = prefix).order_by('pk'))
+    counts['players'] = len(members)
+
+    all_games = []
+    pgns = []
+    counts['leagues'] = 0
+    counts['teams'] = 0
+    counts['team fixtures'] = 0
+    for s in range(seasons):
+        year = first_year + s
+        in_progress = s == seasons - 1
+        season = Season.objects.create(name = '%s %i/%i' % (prefix.title(), year, (year + 1) % 100),
+            slug = '%s-%i' % (prefix, year), start = datetime.date(year, 9, 1), end = datetime.date(year + 1, 6, 30))
+        squad = rng.sample(members, min(len(members), int(len(members) * 0.8)))
+        season.players.set(squad)
+        start = timezone.make_aware(datetime.datetime(year, 9, 7, 19, 30))
+
+        for fmt, name in TOURNAMENT_FORMATS:
+            entrants = rng.sample(squad, min(len(squad), league_size))
+            league = League.objects.create(season = season, name = name, slug = '%s-%s-%i' % (prefix, name.lower().replace(' ', '-'), year),
+                format = fmt, description = 'The %s of the %s season' % (name.lower(), season.name))
+            league.players.set(entrants)
+            counts['leagues'] += 1
+
+            if name == 'League':
+                # double round robin, the second half with colours reversed
+                rounds = create_balanced_round_robin(entrants)
+                rounds = rounds[::2] + rounds[1::2]
+            elif name == 'Round Robin':
+                rounds = create_balanced_round_robin(entrants)[::2]
+            else:
+                rounds = []
+            if name == 'Swiss':
+                # saved as they are paired, the engine reads the earlier rounds
+                standings_rebuild(None, None, league)
+                # the season in progress is halfway through
+                swiss_games(rng, league, entrants, 4 if in_progress else 7, start, in_progress)
+            elif name == 'Knockout':
+                all_games += knockout_games(rng, league, entrants, start, in_progress)
+            else:
+                all_games += make_games(rng, league, rounds, start, unplayed_rounds = 1 if in_progress else 0)
+
+        for t in range(teams):
+            team = Team.objects.create(name = 'Wallasey %s' % ('ABCDEFGH'[t]), league = 'Division %i' % (t + 1),
+                season = season, captain = squad[t])
+            TeamPlayer.objects.bulk_create([ TeamPlayer(team = team, player = p, listed = i < 4)
+                for i, p in enumerate(squad[t * 6:t * 6 + 8]) ])
+            fixtures = []
+            for f in range(10):
+                opponent = rng.choice(OPPONENTS)
+                played = not in_progress or f < 6
+                fixtures += [ TeamFixture(team = team, opponent = opponent if opponent != 'Wallasey' else 'Wallasey %s' % ('ABCDEFGH'[(t + 1) % 8]),
+                    home = f % 2 == 0, date = start + datetime.timedelta(days = 14 * f + 3),
+                    home_score = rng.randint(0, 8) if played else None, away_score = rng.randint(0, 8) if played else None) ]
+            TeamFixture.objects.bulk_create(fixtures)
+            counts['teams'] += 1
+            counts['team fixtures'] += len(fixtures)
+
+    Schedule.objects.bulk_create(all_games)
+    counts['games'] = len(all_games)
+
+    games = list(Schedule.objects.filter(league__slug__startswith = prefix + '-', result__in = PGN_RESULTS.keys(),
+        black__isnull = False).select_related('white', 'black', 'league'))
+    for game in rng.sample(games, int(len(games) * pgn_fraction)):
+        pgns += [ PGN(game = game, body = make_pgn(rng, game, game.league.name)) ]
+    PGN.objects.bulk_create(pgns)
+    counts['pgns'] = len(pgns)
+
+    now = timezone.now()
+    News.objects.bulk_create([ News(title = 'Club news %i' % (i + 1), text = '<p>Report number %i from the club.</p>' % (i + 1),
+        synopsis = 'Report number %i' % (i + 1), status = 'p', published_date = now - datetime.timedelta(days = 7 * i))
+        for i in range(news) ])
+    counts['news'] = news
+
+    for league in League.objects.filter(slug__startswith = prefix + '-'):
+        standings_rebuild(None, None, league)
+    return counts
+
+
+def knockout_games(rng, league, entrants, start, in_progress):
+    '''
+    Every round of a knockout, the winners going through, the final left
+    unplayed if the season is in progress
+    '''
+    nrounds, pairs = knockout_rounds(rng, entrants)
+    games = []
+    for r in range(nrounds, 0, -1):
+        date = start + datetime.timedelta(days = 28 * (nrounds - r))
+        winners = []
+        for board, (white, black) in enumerate(pairs):
+            game = Schedule(league = league, round = r, board = board + 1, date = date, white = white, black = black,
+                white_rating = white.rating, black_rating = black.rating, result = 3)
+            if not (in_progress and r == 1):
+                # a drawn knockout game goes to the higher rated player
+                game.result = random_result(rng, white, black)
+                if game.result == 0: game.comment = 'Won on tie-break'
+                winners += [ white if game.result == 1 or (game.result == 0 and white.rating >= black.rating) else black ]
+            games += [ game ]
+        pairs = [ (winners[i], winners[i + 1]) for i in range(0, len(winners) - 1, 2) ]
+    return games
@@ -3,6 +3,7 @@ from datetime import date, timedelta
 from league.models import Schedule, League, Standings
 import datetime
 from django.db.models import Q
+from league.pagecache import get_cached
 
 
 
@@ -50,8 +51,10 @@ def matches_widget(player, league = None, past_num=5, future_num=1):
 
 @register.inclusion_tag('content/standings_widget.html')
 def standings_widget(league):
-    league_pk = League.objects.get(slug=league).pk
-    standings = Standings.objects.filter(league=league_pk).order_by('position')
+    def build():
+        league_pk = League.objects.get(slug=league).pk
+        return list(Standings.objects.filter(league=league_pk).select_related('player').order_by('position'))
+    standings = get_cached('standings-widget', league, build)
 
     return {
         'standings': standings,
@@ -5,8 +5,48 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import asyncio
+import datetime
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+import chess.pgn
 import django
-from django.test import TestCase
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chessclub.instrumentation import REQUEST_LOG, InstrumentationMiddleware, QueryRecorder, RequestRecord, fingerprint
+
+from . import lichess_client, pairing, pairingjobs
+from .crosstable import build_crosstable, format_points
+from .ingest import BATCH_SIZE, import_games, ingest_games
+from .lichess_async import TokenBucket
+from .matching import MatchingPairingEngine, max_weight_matching, pairing_metrics
+from .models import PGN, TOURNAMENT_FORMATS, League, PairingState, Player, Schedule, Season, Standings, Team, TeamFixture, TeamPlayer
+from .pagecache import PAGE_CACHE_STATS, get_league_version, page_cache_stats
+from .pdf import export_pdfs, pdf_cache_key
+from .pdfwriter import REFERENCE_RE, read_pdf_objects, read_png, text_width
+from .pgnparse import parse_pgn_file, parse_pgn_texts
+from .pgnscan import scan_pgn
+from .standings import standings_check, standings_games_update, standings_position_update, standings_rebuild, standings_refresh, standings_save, standings_update
+from .tiebreaks import ScoreMatrix
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
@@ -23,3 +63,1249 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+
+class MessageSite(object):
+    """Stands in for the admin site, collecting the messages for the user."""
+    def __init__(self):
+        self.messages = []
+
+    def message_user(self, request, message):
+        self.messages.append(message)
+
+
+def make_league(nplayers, **kwargs):
+    season = Season.objects.create(name='2020', slug='2020', start=datetime.date(2020, 1, 1), end=datetime.date(2020, 12, 31))
+    kwargs.setdefault('name', 'Championship')
+    kwargs.setdefault('slug', 'championship-2020')
+    league = League.objects.create(season=season, **kwargs)
+    players = [ Player.objects.create(name='Player', surename='%02i'%(i), rating=2000 - 100*i) for i in range(nplayers) ]
+    league.players.set(players)
+    standings_save(None, None, league)
+    return league, players
+
+
+def round_date(round_no):
+    return timezone.make_aware(datetime.datetime(2020, 1, 1, 19, 30) + datetime.timedelta(days=7*round_no))
+
+
+class StandingsTest(TestCase):
+    """Tests for the standings engine."""
+
+    def setUp(self):
+        self.league, (self.a, self.b, self.c) = make_league(3, format=1, standings_order=3)
+        self.a.rating, self.b.rating, self.c.rating = 1800, 1600, 1400
+        for p in (self.a, self.b, self.c): p.save()
+        Standings.objects.filter(league=self.league, player=self.a).update(rating=1800)
+        Standings.objects.filter(league=self.league, player=self.b).update(rating=1600)
+        Standings.objects.filter(league=self.league, player=self.c).update(rating=1400)
+        Schedule.objects.create(league=self.league, round=1, white=self.a, black=self.b, result=1, date=round_date(1))
+        Schedule.objects.create(league=self.league, round=1, white=self.c, black=None, result=0, date=round_date(1))
+        Schedule.objects.create(league=self.league, round=2, white=self.b, black=self.c, result=0, date=round_date(2))
+        Schedule.objects.create(league=self.league, round=2, white=self.a, black=None, result=0, date=round_date(2))
+        Schedule.objects.create(league=self.league, round=3, white=self.c, black=self.a, result=3, date=round_date(3))
+
+    def test_standings_update(self):
+        """The Swiss table and its tie breaks are computed from the games."""
+        standings_update(MessageSite(), None, self.league)
+        table = { s.player : s for s in Standings.objects.filter(league=self.league) }
+        a, b, c = table[self.a], table[self.b], table[self.c]
+
+        self.assertEqual([a.position, c.position, b.position], [1, 2, 3])
+        self.assertEqual([a.points, b.points, c.points], [1.5, 0.5, 1.0])
+        self.assertEqual([a.form, b.form, c.form], ['WDP', 'LDP', 'DDP'])
+        self.assertEqual((b.matches, b.win, b.draws, b.lost, b.matches1), (2, 0, 1, 1, 1))
+        self.assertEqual([a.nbs, b.nbs, c.nbs], [0.5, 0.5, 0.25])
+        self.assertEqual([a.buchholz, b.buchholz, c.buchholz], [0.5, 2.5, 0.5])
+        self.assertEqual([a.buchholzcut1, b.buchholzcut1, c.buchholzcut1], [0, 1.5, 0])
+        self.assertEqual([a.opprating, b.opprating, c.opprating], [0, 1800, 0])
+        self.assertEqual([a.performance, b.performance, c.performance], [1700, 1400, 1700])
+
+    def test_unlisted_player(self):
+        """Players with games in a league they are not listed in are reported."""
+        outsider = Player.objects.create(name='Outsider')
+        Schedule.objects.create(league=self.league, white=outsider, black=self.a, result=0, date=round_date(4))
+        site = MessageSite()
+        standings_update(site, None, self.league)
+        self.assertEqual(len(site.messages), 1)
+
+    def test_incremental_update(self):
+        """Changing one result incrementally agrees with a full rebuild."""
+        standings_rebuild(MessageSite(), None, self.league)
+        game = Schedule.objects.get(league=self.league, round=3)
+        game.result = 2
+        game.save()
+        self.assertNotEqual(standings_check(self.league), [])
+        standings_games_update(MessageSite(), None, [(game.league_id, game.white_id, game.black_id)])
+        self.assertEqual(standings_check(self.league), [])
+        self.assertEqual(Standings.objects.get(league=self.league, player=self.a).points, 2.5)
+
+    def test_incremental_new_round(self):
+        """A game in a new round pads the form of players without one."""
+        d = Player.objects.create(name='Player', surename='03', rating=1200)
+        self.league.players.add(d)
+        standings_save(None, None, self.league)
+        standings_rebuild(MessageSite(), None, self.league)
+        game = Schedule.objects.create(league=self.league, round=4, white=self.a, black=None, result=0, date=round_date(4))
+        standings_games_update(MessageSite(), None, [(game.league_id, game.white_id, game.black_id)])
+        self.assertEqual(standings_check(self.league), [])
+        self.assertEqual(Standings.objects.get(league=self.league, player=d).form, 'PPPP')
+        game.delete()
+        standings_games_update(MessageSite(), None, [(game.league_id, game.white_id, game.black_id)])
+        self.assertEqual(standings_check(self.league), [])
+        self.assertEqual(Standings.objects.get(league=self.league, player=d).form, 'PPP')
+
+    def test_shared_positions(self):
+        """Players level on every criterion but their name share a position."""
+        Season.objects.all().delete()
+        league, players = make_league(3)
+        Standings.objects.filter(league=league).update(rating=1500)
+        Standings.objects.filter(league=league, player=players[1]).update(rating=1400)
+        standings_update(MessageSite(), None, league)
+        positions = dict(Standings.objects.filter(league=league).values_list('player', 'position'))
+        self.assertEqual([positions[p.pk] for p in players], [1, 3, 1])
+
+    def test_position_update_writes(self):
+        """Re-ranking an unchanged table writes nothing."""
+        standings_update(MessageSite(), None, self.league)
+        with self.assertNumQueries(1):
+            standings_position_update(MessageSite(), None, self.league)
+
+    def test_refresh_query_count(self):
+        """Refreshing the standings costs the same queries for any league size."""
+        for nplayers in (4, 12):
+            Season.objects.all().delete()
+            league, players = make_league(nplayers)
+            for i in range(0, nplayers, 2):
+                Schedule.objects.create(league=league, white=players[i], black=players[i+1], result=i % 3, date=round_date(1))
+            # games, standings, their bulk update and the league's updated_date
+            with self.assertNumQueries(4):
+                standings_refresh(league)
+
+
+class ScheduleConstraintTest(TestCase):
+    """Tests for the constraints on the games."""
+
+    def test_unique_lichess(self):
+        league, (a, b) = make_league(2)
+        Schedule.objects.create(league=league, white=a, black=b, lichess='abcdefgh')
+        # any number of games without a Lichess ID
+        Schedule.objects.create(league=league, white=a, black=b)
+        Schedule.objects.create(league=league, white=b, black=a)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Schedule.objects.create(league=league, white=b, black=a, lichess='abcdefgh')
+
+
+class CrosstableTest(TestCase):
+    """Tests for the crosstable matrix."""
+
+    def setUp(self):
+        self.league, (self.a, self.b, self.c) = make_league(3)
+        Schedule.objects.create(league=self.league, white=self.a, black=self.b, result=1, date=round_date(1))
+        Schedule.objects.create(league=self.league, white=self.b, black=self.a, result=0, date=round_date(2))
+        Schedule.objects.create(league=self.league, white=self.b, black=self.c, result=2, date=round_date(2))
+        Schedule.objects.create(league=self.league, white=self.c, black=self.a, result=3, date=round_date(3))
+        standings_update(MessageSite(), None, self.league)
+
+    def test_cells(self):
+        with self.assertNumQueries(2):
+            crosstable = build_crosstable(self.league)
+        self.assertEqual([s.player for s in crosstable.standings], [self.a, self.c, self.b])
+        # a, c, b by position
+        self.assertEqual(crosstable[0, 2], (1, 0.5))
+        self.assertEqual(crosstable[2, 0], (0.5, 0))
+        self.assertEqual(crosstable[1, 2], (None, 1))
+        self.assertEqual(crosstable[2, 1], (0, None))
+        # the unplayed game is left out
+        self.assertEqual(crosstable[0, 1], (None, None))
+        self.assertEqual(crosstable.cell_text(0, 2), '1\n½')
+        self.assertEqual(crosstable.cell_text(0, 1), '')
+
+    def test_format_points(self):
+        self.assertEqual([format_points(p) for p in (None, 0, 0.5, 1, 2.5)], ['', '0', '½', '1', '2½'])
+
+    def test_view(self):
+        response = self.client.get('/crosstable/championship-2020')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s.player for s, cells in response.context['rows']], [self.a, self.c, self.b])
+
+    def test_league_link(self):
+        # every player meets every other in a league and a round robin
+        for format, linked in ((0, True), (1, False), (2, True), (3, False)):
+            League.objects.filter(pk=self.league.pk).update(format=format)
+            cache.clear()
+            response = self.client.get('/league/championship-2020')
+            self.assertEqual(b'/crosstable/championship-2020' in response.content, linked, format)
+
+
+class FixturesTest(TestCase):
+    """Tests for the public league page."""
+
+    def play(self, nplayers, rounds, **kwargs):
+        league, players = make_league(nplayers, **kwargs)
+        for r in range(1, nplayers):
+            for i in range(0, nplayers, 2):
+                white, black = players[i], players[(i + r) % nplayers]
+                Schedule.objects.create(league=league, white=white, black=black, round=r if rounds else None,
+                    result=1 if r < nplayers - 1 else 3, date=round_date(r))
+        standings_update(MessageSite(), None, league)
+        return league
+
+    def assertConstantQueries(self, rounds, **kwargs):
+        for nplayers in (4, 12):
+            self.play(nplayers, rounds, **kwargs)
+            # the first request imports the URLconf, whose forms query the seasons
+            self.client.get('/league/championship-2020')
+            cache.clear()
+            with self.assertNumQueries(4):
+                response = self.client.get('/league/championship-2020')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['games']), nplayers - 1)
+            Season.objects.all().delete()
+            Player.objects.all().delete()
+        return response
+
+    def test_rounds(self):
+        response = self.assertConstantQueries(True, format=1)
+        self.assertTrue(response.context['useRounds'])
+        self.assertEqual(response.context['rounds'], list(range(1, 12)))
+        self.assertEqual(list(response.context['games'])[0], 'Round 11')
+
+    def test_dates(self):
+        response = self.assertConstantQueries(False)
+        self.assertFalse(response.context['useRounds'])
+        self.assertEqual(response.context['latest'], round_date(11).date())
+        self.assertEqual([len(g) for g in response.context['games'].values()], [6] * 11)
+
+
+class PageCacheTest(TestCase):
+    """Tests for the cached league pages."""
+
+    def setUp(self):
+        cache.clear()
+        PAGE_CACHE_STATS.clear()
+        self.league, (self.a, self.b, self.c) = make_league(3)
+        Schedule.objects.create(league=self.league, white=self.a, black=self.b, result=1, date=round_date(1))
+        standings_update(MessageSite(), None, self.league)
+
+    def get(self, **extra):
+        response = self.client.get('/league/championship-2020', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_cached(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(page_cache_stats(), {'fixtures': (1, 1)})
+
+    def test_invalidated_by_signals(self):
+        self.get()
+        Schedule.objects.create(league=self.league, white=self.b, black=self.c, result=2, date=round_date(2))
+        # rendered again with the new game
+        self.assertEqual(len(self.get().context['games']), 2)
+        self.assertEqual(page_cache_stats(), {'fixtures': (0, 2)})
+        League.objects.get(pk=self.league.pk).save()
+        self.get()
+        self.assertEqual(page_cache_stats(), {'fixtures': (0, 3)})
+
+    def test_invalidated_by_standings(self):
+        self.get()
+        # written with bulk_update, no signals are sent
+        standings_refresh(self.league)
+        self.get()
+        self.assertEqual(page_cache_stats(), {'fixtures': (0, 2)})
+
+    def test_mobile(self):
+        self.get()
+        self.get(HTTP_USER_AGENT='Mozilla/5.0 (iPhone; CPU iPhone OS 13_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148')
+        self.get()
+        self.assertEqual(page_cache_stats(), {'fixtures': (1, 2)})
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'league-page-cache-test'),
+}})
+class FilePageCacheTest(PageCacheTest):
+    """The cached league pages with a file-based cache."""
+
+
+class PlayerPageTest(TestCase):
+    """Tests for the player profile page."""
+
+    def setUp(self):
+        cache.clear()
+        self.league, (self.a, self.b, self.c) = make_league(3)
+        self.league.season.players.set([self.a, self.b, self.c])
+        self.cup = League.objects.create(season=self.league.season, name='Cup', slug='cup-2020', format=3)
+        Schedule.objects.create(league=self.league, white=self.a, black=self.b, result=1, date=round_date(1), black_rating=1900)
+        Schedule.objects.create(league=self.league, white=self.c, black=self.a, result=0, date=round_date(2), white_rating=1800)
+        Schedule.objects.create(league=self.league, white=self.a, black=self.c, result=3, date=round_date(3))
+        Schedule.objects.create(league=self.cup, white=self.b, black=self.a, result=2, round=1, date=round_date(4))
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_games(self):
+        response = self.get('/player/%i/' % self.a.pk)
+        games = response.context['games'][self.league.season]
+        self.assertEqual(list(games), [self.league, self.cup])
+        self.assertEqual(len(games[self.league]), 3)
+        self.assertFalse(list(games)[0].has_rounds)
+        self.assertTrue(list(games)[1].has_rounds)
+
+        # with the summary cached only the games of the league are read
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/player/%i/league=cup-2020' % self.a.pk)
+        self.assertEqual(len(response.context['games'][self.league.season][self.cup]), 1)
+        games = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT "league_schedule"')]
+        self.assertEqual(len(games), 1)
+        self.assertIn('"league_schedule"."league_id" = %i' % (self.cup.pk), games[0])
+
+    def test_constant_queries(self):
+        url = '/player/%i/' % self.a.pk
+        # the first request imports the URLconf, whose forms query the seasons
+        self.get(url)
+        for i in range(5, 15):
+            Schedule.objects.create(league=self.league, white=self.a, black=self.b, result=1, date=round_date(i))
+        # player, seasons played, latest season, games, notification
+        with self.assertNumQueries(5):
+            self.get(url)
+
+    def test_career(self):
+        career = self.get('/player/%i/' % self.a.pk).context['career']
+        self.assertEqual(len(career), 1)
+        record = career[0]
+        # the unplayed game is left out
+        self.assertEqual((record.games, record.score), (3, 2.5))
+        self.assertAlmostEqual(record.performance(), (1900 + 400 + 1800 + 1900 + 400) / 3.0)
+
+        # a new game drops the cached summary
+        Schedule.objects.create(league=self.league, white=self.b, black=self.a, result=1, date=round_date(5))
+        record = self.get('/player/%i/' % self.a.pk).context['career'][0]
+        self.assertEqual((record.games, record.score), (4, 2.5))
+
+
+class SeasonPageTest(TestCase):
+    """Tests for the season, team fixtures and team squads pages."""
+
+    def setUp(self):
+        cache.clear()
+        self.season = Season.objects.create(name='2020', slug='2020', start=datetime.date(2020, 1, 1), end=datetime.date(2020, 12, 31))
+        self.players = [ Player.objects.create(name='Player', surename='%02i'%(i), rating=2000 - 100*i) for i in range(6) ]
+        self.season.players.set(self.players)
+
+    def add_teams(self, n):
+        for i in range(n):
+            team = Team.objects.create(name='Wallasey %s' % 'ABCDEFGH'[i], league='Division %i' % (i + 1),
+                season=self.season, captain=self.players[i])
+            for p in self.players[i:i + 3]:
+                TeamPlayer.objects.create(team=team, player=p)
+            TeamFixture.objects.create(team=team, opponent='Birkenhead', home=True, date=round_date(i))
+            TeamFixture.objects.create(team=team, opponent='Wallasey Z', home=i % 2 == 0, date=round_date(i + 1))
+
+    def test_constant_queries(self):
+        # the first request imports the URLconf, whose forms query the seasons
+        self.client.get('/season/2020')
+        for n in (1, 4):
+            self.add_teams(n)
+            for url in ('/season/2020', '/team_fixtures/2020', '/team_squads/2020'):
+                cache.clear()
+                # season, teams, squads, fixtures, members, notification
+                with self.assertNumQueries(6):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                # season, notification
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_fixtures(self):
+        self.add_teams(2)
+        response = self.client.get('/season/2020')
+        # the home side of the internal fixture is left out
+        self.assertEqual([ (f.team.name, f.opponent) for f in response.context['fixtures'] ],
+            [('Wallasey A', 'Birkenhead'), ('Wallasey B', 'Birkenhead'), ('Wallasey B', 'Wallasey Z')])
+        squads = list(response.context['teams'].values())
+        self.assertEqual([ tp.player for tp in squads[0] ], self.players[0:3])
+
+    def test_invalidated(self):
+        self.add_teams(1)
+        self.assertEqual(len(self.client.get('/team_fixtures/2020').context['fixtures']), 1)
+        TeamFixture.objects.create(team=Team.objects.get(), opponent='Hoylake', home=False, date=round_date(5))
+        response = self.client.get('/team_fixtures/2020')
+        self.assertEqual(len(response.context['fixtures']), 2)
+
+
+class PdfCacheTest(TestCase):
+    """Tests for the cached league PDFs."""
+
+    def setUp(self):
+        cache.clear()
+        self.league, self.players = make_league(4)
+        Schedule.objects.create(league=self.league, white=self.players[0], black=self.players[1], result=1, date=round_date(1))
+        standings_update(MessageSite(), None, self.league)
+        self.url = '/export_league_pdf/championship-2020'
+
+    def test_cached_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        self.assertIsNotNone(cache.get(pdf_cache_key('table', self.league)))
+        # the repeat download is served from the cache, looking up the league once
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url)
+        self.assertEqual(repeat.content, response.content)
+
+    def test_conditional_download(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        # a new round refreshes the standings, as create_round_view does
+        Schedule.objects.create(league=self.league, white=self.players[2], black=self.players[3], result=2, round=1, date=round_date(2))
+        standings_update(MessageSite(), None, self.league)
+        fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+
+    def test_invalidated_by_standings(self):
+        self.client.get(self.url)
+        standings_rebuild(MessageSite(), None, self.league)
+        self.assertIsNone(cache.get(pdf_cache_key('table', self.league)))
+
+
+    def test_batch_export(self):
+        """A page per league, the same with a pool of workers."""
+        cup = League.objects.create(season=self.league.season, name='Cup', slug='cup-2020')
+        cup.players.set(self.league.players.all())
+        standings_save(None, None, cup)
+        leagues = League.objects.filter(pk__in=[self.league.pk, cup.pk])
+        for workers in (1, 2):
+            pdf = export_pdfs('crosstable', leagues, workers=workers)
+            self.assertIn(b'/Count 2', pdf)
+            # the pages saved by the workers are joined into one document
+            objects = read_pdf_objects(pdf)
+            self.assertEqual(len([h for h, data in objects.values() if re.search(rb'/Type\s*/Page\b', h)]), 2)
+            for head, data in objects.values():
+                for n in REFERENCE_RE.findall(head):
+                    self.assertIn(int(n), objects)
+
+
+
+@override_settings(LEAGUE_PDF_BACKEND='native')
+class NativePdfTest(PdfCacheTest):
+    """The cached PDF tests again with the native writer."""
+
+    def test_pages(self):
+        for kind, box in (('table', b'[0 0 595.28 841.89]'), ('crosstable', b'[0 0 841.89 595.28]')):
+            pdf = export_pdfs(kind, League.objects.filter(pk=self.league.pk))
+            self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+            self.assertIn(b'/MediaBox %s' % box, pdf)
+            self.assertIn(b'/Count 1', pdf)
+
+    def test_logo(self):
+        width, height, rgb, alpha = read_png(settings.BASE_DIR + '/static/img/wcc_logo_outline.png')
+        self.assertEqual((width, height, len(rgb), len(alpha)), (605, 72, 605 * 72 * 3, 605 * 72))
+
+    def test_text_width(self):
+        self.assertAlmostEqual(text_width('W 1', 10), 9.44 + 2.78 + 5.56)
+        self.assertAlmostEqual(text_width('W 1', 10, bold=True), 9.44 + 2.78 + 5.56)
+        self.assertAlmostEqual(text_width('½', 10), 8.34)
+
+
+# imported on first use only, never by the modules the views need
+HEAVY_MODULES = ('chess', 'berserk', 'swissdutch', 'matplotlib', 'numpy')
+
+
+class LazyUtilsTest(TestCase):
+    """The heavy helpers are still reachable through league.utils."""
+
+    def test_lazy_names(self):
+        from . import utils, pairing
+        self.assertIs(utils.create_balanced_round_robin, pairing.create_balanced_round_robin)
+        for name in utils.LAZY_NAMES:
+            self.assertTrue(callable(getattr(utils, name)), name)
+        with self.assertRaises(AttributeError):
+            utils.no_such_helper
+
+    def test_views_dependencies(self):
+        # a fresh interpreter, the test run itself has long imported them all
+        script = (
+            'import sys, django\n'
+            'django.setup()\n'
+            'import league.utils, league.ingest, league.pagecache, league.career, league.seasons, league.pairingjobs\n'
+            'print(\' \'.join(m for m in %r if m in sys.modules))\n' % (HEAVY_MODULES,))
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', script], cwd=root, check=True,
+            stdout=subprocess.PIPE, universal_newlines=True).stdout
+        self.assertEqual(output.split(), [])
+
+
+class GenerateClubDataTest(TestCase):
+    """Tests for the synthetic club generator."""
+
+    def test_generate(self):
+        call_command('generate_club_data', seasons=2, players=20, league_size=9, teams=2, news=3, stdout=StringIO())
+        self.assertEqual(Season.objects.filter(slug__startswith='synthetic-').count(), 2)
+        self.assertEqual(sorted(League.objects.values_list('format', flat=True)), sorted([f for f, name in TOURNAMENT_FORMATS] * 2))
+        self.assertEqual(Team.objects.count(), 4)
+        self.assertTrue(PGN.objects.exists())
+        for league in League.objects.exclude(format=3):
+            self.assertEqual(league.standings_set.count(), 9)
+            self.assertEqual(standings_check(league), [])
+        # the season in progress has a round to play
+        season = Season.objects.order_by('end').last()
+        self.assertTrue(Schedule.objects.filter(league__season=season, result=3).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('generate_club_data', seasons=1, stdout=StringIO())
+
+
+class PairingStateTest(TestCase):
+    """Tests for the stored Swiss pairing state."""
+
+    def setUp(self):
+        self.league, self.players = make_league(7, format=1)
+
+    def play_round(self, r, result=1):
+        # a rotation, the last player has a bye
+        order = self.players[r:] + self.players[:r]
+        for i in range(0, 6, 2):
+            Schedule.objects.create(league=self.league, round=r, white=order[i], black=order[i + 1], result=result, date=round_date(r))
+        Schedule.objects.create(league=self.league, round=r, white=order[6], black=None, result=1, date=round_date(r))
+
+    def assertState(self, stored_round):
+        paired = pairing.get_last_round(self.league, verify=True)
+        self.assertEqual(pairing.pairing_state_check(self.league), [])
+        self.assertEqual(set(PairingState.objects.filter(league=self.league).values_list('round', flat=True)),
+            set([stored_round]) if stored_round else set())
+        return paired
+
+    def test_incremental(self):
+        self.assertState(None)
+        for r in range(1, 5):
+            self.play_round(r, result=[0, 1, 2][r % 3])
+            paired = self.assertState(r)
+        self.assertEqual(sorted(len(pp.opponents) for pp in paired.values()), [4] * 7)
+        # only the games after the stored round are read
+        with self.assertNumQueries(3):
+            pairing.get_last_round(self.league)
+
+        # the state is stored after the last complete round
+        self.play_round(5, result=3)
+        self.assertState(4)
+        Schedule.objects.filter(round=5).first().delete()
+        self.assertState(4)
+
+        # correcting an earlier game replays the rounds again
+        game = Schedule.objects.filter(round=2, black__isnull=False).first()
+        game.result = 2
+        game.save()
+        self.assertFalse(PairingState.objects.exists())
+        self.assertState(4)
+
+        # saving the league, as the standings do, keeps the state
+        standings_rebuild(None, None, self.league)
+        self.league.save()
+        self.assertTrue(PairingState.objects.filter(league=self.league, round=4).exists())
+        # unless the points for a result change
+        self.league.draw_points = 2
+        self.league.save()
+        self.assertFalse(PairingState.objects.exists())
+        self.assertState(4)
+
+    def test_moved(self):
+        for r in range(1, 5):
+            self.play_round(r)
+        self.assertState(4)
+        other = League.objects.create(season=self.league.season, name='Other', slug='other-2020', format=1)
+        # a game moved to a later round, then to another league, leaves the old round stale
+        game = Schedule.objects.filter(league=self.league, round=2, black__isnull=False).first()
+        game.round = 6
+        game.save()
+        self.assertFalse(PairingState.objects.filter(league=self.league).exists())
+        game.round = 2
+        game.save()
+        self.assertState(4)
+        game.league = other
+        game.round = None
+        game.save()
+        self.assertFalse(PairingState.objects.filter(league=self.league).exists())
+        game.league = self.league
+        game.round = 2
+        game.save()
+        self.assertState(4)
+
+        # moved by an import, which updates without signals
+        game.lichess = 'movedGm1'
+        game.save()
+        self.assertState(4)
+        result = ingest_games(other, [('movedGm1', {'white': 'a', 'black': 'b', 'date': round_date(2), 'result': 1})])
+        self.assertEqual(len(result.moved), 1)
+        self.assertFalse(PairingState.objects.filter(league=self.league).exists())
+
+    def test_verify(self):
+        for r in range(1, 3):
+            self.play_round(r)
+        pairing.get_last_round(self.league)
+        state = PairingState.objects.filter(league=self.league).first()
+        state.score += 1
+        state.save()
+        self.assertEqual(len(pairing.pairing_state_check(self.league)), 1)
+        with self.assertRaises(AssertionError):
+            pairing.get_last_round(self.league, verify=True)
+
+
+@override_settings(LEAGUE_PAIRING_BACKGROUND=False)
+class PairingJobTest(TestCase):
+    """Tests for the background pairing of Swiss rounds."""
+
+    def setUp(self):
+        cache.clear()
+        self.league, self.players = make_league(8, format=1)
+        self.url = '/admin/league/league/%i/create_round/' % self.league.pk
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+    def create_round(self):
+        response = self.client.post(self.url, {'create_swiss_round': '1', 'datetime_0': '2020-01-08', 'datetime_1': '19:30:00'})
+        self.assertEqual(response.status_code, 302)
+        return self.client.get(response['Location'])
+
+    def test_create_round(self):
+        response = self.create_round()
+        self.assertEqual(len(response.context['pairs']), 4)
+        self.assertEqual(response.context['round'], 1)
+        # paired by the engine in its spawned process, not by score
+        self.assertEqual([str(m) for m in response.context['messages'] if 'Paired by score' in str(m)], [])
+        response = self.client.post(self.url, {'create_swiss_games': '1', 'date': '2020-01-08', 'time': '19:30:00', 'round': '1'})
+        self.assertEqual(response.status_code, 200)
+        games = Schedule.objects.filter(league=self.league, round=1)
+        self.assertEqual(games.count(), 4)
+        self.assertEqual(len(set(games.values_list('white', flat=True)) | set(games.values_list('black', flat=True))), 8)
+
+    def test_background(self):
+        with override_settings(LEAGUE_PAIRING_BACKGROUND=True):
+            self.assertTrue(pairingjobs.run_in_background())
+            # a job in a local-memory cache can't be polled from another process
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+                self.assertFalse(pairingjobs.run_in_background())
+        self.assertFalse(pairingjobs.run_in_background())
+
+    def test_unknown_job(self):
+        response = self.client.get(self.url + '?job=missing')
+        self.assertNotIn('pairs', response.context)
+
+    def test_budget(self):
+        for worker in ('process', 'thread'):
+            with override_settings(LEAGUE_PAIRING_WORKER=worker):
+                self.assertEqual(pairingjobs.run_with_budget(time.sleep, (2,), 0.1), ('timeout', None))
+                self.assertEqual(pairingjobs.run_with_budget(abs, (-2,), 5), ('done', 2))
+                status, error = pairingjobs.run_with_budget(int, ('x',), 5)
+                self.assertEqual(status, 'failed')
+                self.assertIn('ValueError', error)
+
+    def test_fallback(self):
+        # round 1 played, then the engine is given no time for round 2
+        for i in range(0, 8, 2):
+            Schedule.objects.create(league=self.league, round=1, white=self.players[i], black=self.players[i + 1], result=1, date=round_date(1))
+        job = pairingjobs.get_job(pairingjobs.start_pairing_job(self.league, 2, [self.players[7]], budget=0))
+        self.assertEqual(job['status'], 'done')
+        self.assertIn('more than 0 seconds', job['fallback'])
+        players = [p for pair in job['id_pairs'] for p in pair if p != 0]
+        self.assertEqual(sorted(players), sorted(p.pk for p in self.players))
+        self.assertIn((self.players[7].pk, 0), job['id_pairs'])
+        # the winners meet, nobody meets the same opponent again
+        met = set((g.white_id, g.black_id) for g in Schedule.objects.filter(league=self.league))
+        for a, b in job['id_pairs']:
+            self.assertNotIn((a, b), met)
+            self.assertNotIn((b, a), met)
+        self.assertIn(tuple(sorted((self.players[0].pk, self.players[2].pk))), [tuple(sorted(p)) for p in job['id_pairs']])
+
+    def test_fallback_odd(self):
+        # the bye of an odd number of players is given as an explicit one
+        Standings.objects.filter(league=self.league, player=self.players[7]).delete()
+        next_round = pairingjobs.fallback_round(1, pairing.get_last_round(self.league))
+        byes = [pp for pp in next_round.values() if pp.opponents[-1] == 0]
+        self.assertEqual(len(byes), 1)
+        self.assertLess(byes[0].pairing_no, 0)
+        pairs, id_pairs = pairing.get_pairs(next_round)
+        self.assertEqual(len(id_pairs), 4)
+        self.assertIn((self.players[6].pk, 0), id_pairs)
+
+
+class RoundCreationTest(TestCase):
+    """Tests for the bulk creation of generated rounds."""
+
+    def test_round_robin(self):
+        league, players = make_league(40, format=2)
+        version = get_league_version(league.slug)
+        with CaptureQueriesContext(connection) as queries:
+            games = pairing.create_round_robin(league, [round_date(1)])
+        # the players, then the inserts in as many batches as the database needs
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertLessEqual(len(queries) - len(inserts), 5)
+        self.assertLessEqual(len(inserts), 1560 // connection.ops.bulk_batch_size(['league'] * 11, games) + 1)
+        self.assertEqual(len(games), 1560)
+        self.assertEqual(Schedule.objects.filter(league=league).count(), 1560)
+        self.assertEqual(league.get_rounds(), list(range(1, 79)))
+        # every pair meets once with each colour
+        pairs = Schedule.objects.filter(league=league).values_list('white', 'black')
+        self.assertEqual(len(set(pairs)), 1560)
+        self.assertNotEqual(get_league_version(league.slug), version)
+
+    def test_id_pairs(self):
+        league, players = make_league(5, format=1)
+        id_pairs = [(players[0].pk, players[1].pk), (players[2].pk, players[3].pk), (players[4].pk, 0)]
+        with self.assertNumQueries(1):
+            games = pairing.create_games_from_id_pairs(league, 1, id_pairs, round_date(1))
+        self.assertEqual([(g.white, g.black) for g in games], [(players[0], players[1]), (players[2], players[3]), (players[4], None)])
+        self.assertEqual(games[2].result, 0)
+        next_round = pairing.get_next_round(1, MatchingPairingEngine(), pairing.get_last_round(league))
+        with self.assertNumQueries(1):
+            pairs, found = pairing.get_pairs(next_round)
+        self.assertEqual(len(found), 3)
+
+
+class MatchingEngineTest(TestCase):
+    """Tests for the weighted matching pairing engine."""
+
+    def brute_force(self, n, edges):
+        # the most edges then the most weight over every matching
+        weights = {}
+        for i, j, w in edges:
+            weights[(i, j)] = weights[(j, i)] = w
+        def best(free):
+            if not free:
+                return (0, 0)
+            v, rest = free[0], free[1:]
+            options = [best(rest)]
+            for u in rest:
+                if (v, u) in weights:
+                    count, weight = best([x for x in rest if x != u])
+                    options += [(count + 1, weight + weights[(v, u)])]
+            return max(options)
+        return best(list(range(n)))
+
+    def test_max_weight_matching(self):
+        rng = random.Random(0)
+        for t in range(200):
+            n = rng.randint(2, 8)
+            edges = [(i, j, rng.randint(-5, 20)) for i in range(n) for j in range(i + 1, n) if rng.random() < 0.6]
+            if not edges:
+                continue
+            mate = max_weight_matching(edges, maxcardinality=True)
+            weights = {(i, j): w for i, j, w in edges}
+            pairs = [(i, mate[i]) for i in range(len(mate)) if mate[i] > i]
+            self.assertEqual((len(pairs), sum(weights[p] for p in pairs)), self.brute_force(n, edges))
+
+    def test_rounds(self):
+        from swissdutch.constants import Colour
+        from swissdutch.player import Player as PairingPlayer
+        rng = random.Random(1)
+        players = [PairingPlayer(name='%02i' % i, rating=2000 - 10 * i) for i in range(21)]
+        engine = MatchingPairingEngine(lambda: Colour.white)
+        for r in range(1, 8):
+            players = list(engine.pair_round(r, tuple(players)))
+            metrics = pairing_metrics(players)
+            self.assertEqual(metrics['rematches'], 0)
+            self.assertEqual(metrics['colour_violations'], 0)
+            self.assertEqual(sum(1 for p in players if p.opponents[-1] == 0), 1)
+            by_number = {p.pairing_no: p for p in players}
+            for p in players:
+                if p.opponents[-1] != 0:
+                    self.assertEqual(by_number[p.opponents[-1]].opponents[-1], p.pairing_no)
+                    if p.colour_hist[-1] == Colour.white:
+                        p._score += rng.choice([0, 0.5, 1])
+        # nobody has two byes
+        self.assertTrue(all(p.opponents.count(0) <= 1 for p in players))
+
+    @override_settings(LEAGUE_PAIRING_BACKGROUND=False)
+    def test_league_round(self):
+        league, players = make_league(9, format=1)
+        for i in range(0, 8, 2):
+            Schedule.objects.create(league=league, round=1, white=players[i], black=players[i + 1], result=1, date=round_date(1))
+        Schedule.objects.create(league=league, round=1, white=players[8], black=None, result=1, date=round_date(1))
+        job = pairingjobs.get_job(pairingjobs.start_pairing_job(league, 2, engine='matching'))
+        self.assertIsNone(job['fallback'])
+        self.assertEqual(len(job['id_pairs']), 5)
+        self.assertEqual(sorted(p for pair in job['id_pairs'] for p in pair if p != 0), sorted(p.pk for p in players))
+        met = set((g.white_id, g.black_id) for g in Schedule.objects.filter(league=league))
+        self.assertFalse([p for p in job['id_pairs'] if p in met or p[::-1] in met])
+
+
+class InstrumentationTest(TestCase):
+    """Tests for the request instrumentation middleware."""
+
+    def setUp(self):
+        REQUEST_LOG.clear()
+        league, players = make_league(4)
+        for i in range(4):
+            Schedule.objects.create(league=league, white=players[i], black=players[(i + 1) % 4], result=1, date=round_date(i + 1))
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('SELECT * FROM "p" WHERE "id" = 12 AND "name" = \'a\'\'b\''),
+            'SELECT * FROM "p" WHERE "id" = ? AND "name" = ?')
+        self.assertEqual(fingerprint('SELECT 1 FROM "p" WHERE "id" IN (1, 2,  3)'), fingerprint('SELECT 2 FROM "p" WHERE "id" IN (4)'))
+
+    def test_disabled(self):
+        with override_settings(REQUEST_INSTRUMENTATION=False):
+            Client().get('/league/championship-2020')
+        self.assertEqual(REQUEST_LOG.recent(), [])
+
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_SLOW_MS=0, REQUEST_INSTRUMENTATION_DUPLICATES=1)
+    def test_recorded(self):
+        client = Client()
+        with self.assertLogs('chessclub.instrumentation', 'WARNING') as logs:
+            client.get('/league/championship-2020')
+            cache.clear()
+            client.get('/league/championship-2020')
+            client.get('/league/championship-2020')
+        self.assertTrue(any('slow request /league/championship-2020' in line for line in logs.output))
+
+        summary = REQUEST_LOG.summary()
+        self.assertEqual([v['view'] for v in summary], ['league'])
+        fixtures = summary[0]
+        self.assertEqual(fixtures['requests'], 3)
+        self.assertGreater(fixtures['max_queries'], fixtures['queries'] / 3)
+        self.assertGreater(fixtures['sql_time'], 0)
+
+        # an N+1 query is logged once its count passes the threshold
+        record = RequestRecord('/')
+        recorder = QueryRecorder(record)
+        with self.assertLogs('chessclub.instrumentation', 'WARNING') as logs:
+            with override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_DUPLICATES=2):
+                with connection.execute_wrapper(recorder):
+                    for p in Player.objects.all():
+                        Player.objects.get(pk=p.pk)
+                InstrumentationMiddleware(lambda request: None).log(record)
+        self.assertEqual(record.queries, 5)
+        self.assertEqual(list(record.duplicates().values()), [4])
+        self.assertIn('ran the same query 4 times', logs.output[-1])
+
+        with override_settings(REQUEST_INSTRUMENTATION_WINDOW=-1):
+            self.assertEqual(REQUEST_LOG.summary(), [])
+
+    def test_summary_page(self):
+        url = '/admin/instrumentation/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('member', 'member@example.com', 'x'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'x', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'instrumentation is off')
+
+
+class LichessStub(object):
+    """A local server replaying the Lichess responses recorded in testdata/lichess."""
+    routes = (
+        ('/api/tournament/', '/games', 'arena_%s.ndjson', 'application/x-ndjson'),
+        ('/api/swiss/', '/games', 'swiss_%s.pgn', 'application/x-chess-pgn'),
+        ('/game/export/', '', 'game_%s.json', 'application/json'),
+        ('/api/tournament/', '', 'tournament_%s.json', 'application/json'),
+        ('/api/swiss/', '', 'swissinfo_%s.json', 'application/json'),
+    )
+    directory = os.path.join(os.path.dirname(__file__), 'testdata', 'lichess')
+
+    def __init__(self):
+        self.requests = []
+        # how many of the next requests are answered with a 429
+        self.rate_limited = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                stub.requests.append((path, self.client_address[1]))
+                if stub.rate_limited > 0:
+                    stub.rate_limited -= 1
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                for prefix, suffix, name, content_type in stub.routes:
+                    if path.startswith(prefix) and path.endswith(suffix):
+                        name = os.path.join(stub.directory, name % (path[len(prefix):len(path) - len(suffix)]))
+                        if os.path.exists(name):
+                            with open(name, 'rb') as f:
+                                body = f.read()
+                            self.send_response(200)
+                            self.send_header('Content-Type', content_type)
+                            self.send_header('Content-Length', str(len(body)))
+                            self.end_headers()
+                            self.wfile.write(body)
+                            return
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%i' % (self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LichessIngestTest(TestCase):
+    """Tests for the streaming import of games from Lichess."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = LichessStub()
+        cls.settings = override_settings(LICHESS_URL=cls.stub.url, LICHESS_RATE=100)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.stub.close()
+        lichess_client.close_session()
+        super().tearDownClass()
+
+    def setUp(self):
+        lichess_client.close_session()
+        self.stub.requests.clear()
+        self.stub.rate_limited = 0
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_settings = override_settings(LICHESS_CACHE_DIR=cache_dir.name)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        self.league, players = make_league(4, format=3)
+        for p, lichess in zip(players, ['alice', 'bob', 'carol', 'dave']):
+            p.lichess = lichess
+            p.save()
+        self.league.players.set(players[:2] + players[3:])
+        self.other = League.objects.create(season=self.league.season, name='Arena', slug='arena-2020')
+        Schedule.objects.create(league=self.other, white=players[2], black=players[0], lichess='arenaAa4', result=2, date=round_date(1))
+
+    def test_arena(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = ingest_games(self.league, lichess_client.iter_arena_games('wcc2021a'))
+        self.assertEqual(result.added, ['arenaAa1', 'arenaAa2'])
+        self.assertEqual([(g, name) for g, v, name in result.moved], [('arenaAa4', 'Arena')])
+        self.assertEqual(result.unknown, [('arenaAa3', 'stranger')])
+        self.assertEqual(result.not_in_league, {'carol'})
+        self.assertEqual(len(result.messages()), 3)
+        # one query each for the players and the games already imported, and
+        # for the ids of the new games where bulk_create does not return them
+        lookups = [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and '"lichess" IN' in q['sql']]
+        self.assertEqual(len([q for q in lookups if 'league_player' in q['sql'].split(' WHERE ')[0]]), 1)
+        self.assertLessEqual(len(lookups), 3)
+
+        games = Schedule.objects.filter(league=self.league).order_by('lichess')
+        self.assertEqual([(g.lichess, g.white.lichess, g.black.lichess, g.result) for g in games],
+            [('arenaAa1', 'alice', 'bob', 1), ('arenaAa2', 'bob', 'carol', 0), ('arenaAa4', 'carol', 'alice', 2)])
+        self.assertEqual(games[0].date, datetime.datetime(2021, 3, 4, 19, 30, tzinfo=datetime.timezone.utc))
+        self.assertIn('Qxf7#', PGN.objects.get(game=games[0]).body)
+        self.assertEqual(PGN.objects.count(), 2)
+
+        # a second import finds everything already there
+        result = ingest_games(self.league, lichess_client.iter_arena_games('wcc2021a'))
+        self.assertEqual(result.added, [])
+        self.assertEqual(len(result.existing), 3)
+
+    def test_swiss_and_game(self):
+        result = ingest_games(self.league, lichess_client.iter_swiss_games('wccSwiss'), batch_size=2)
+        self.assertEqual(result.added, ['swissSw1', 'swissSw2', 'swissSw3'])
+        game = Schedule.objects.get(lichess='swissSw3')
+        self.assertEqual((game.white.lichess, game.black.lichess, game.result), ('carol', 'bob', 0))
+        self.assertEqual(game.date, datetime.datetime(2021, 3, 11, 19, 30, 15, tzinfo=datetime.timezone.utc))
+        self.assertIn('[%clk 0:05:00]', PGN.objects.get(game=game).body)
+
+        result = ingest_games(self.league, lichess_client.iter_game('arenaAa1'))
+        self.assertEqual(result.added, ['arenaAa1'])
+        # the JSON and the PGN of the game in one request, every request on one connection
+        self.assertEqual([path for path, port in self.stub.requests], ['/api/swiss/wccSwiss', '/api/swiss/wccSwiss/games', '/game/export/arenaAa1'])
+        self.assertEqual(len(set(port for path, port in self.stub.requests)), 1)
+
+    def test_swiss_without_date(self):
+        # swiss exports only carry the UTCDate, the Date is read as a fallback
+        pgn = ('[Site "https://lichess.org/swissSw9"]\n[White "Alice"]\n[Black "Bob"]\n[Result "0-1"]\n'
+            '[UTCDate "2021.03.11"]\n[UTCTime "19:30:15"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n\n')
+        game, = scan_pgn(pgn.splitlines(True), keep_text=True)
+        id, data = lichess_client.pgn2dict(game)
+        self.assertEqual((id, data['white'], data['black'], data['result']), ('swissSw9', 'alice', 'bob', 2))
+        self.assertEqual(data['date'], datetime.datetime(2021, 3, 11, 19, 30, 15, tzinfo=datetime.timezone.utc))
+
+    def test_cache(self):
+        games = list(lichess_client.iter_lichess_games(arenas=['wcc2021a'], swiss=['wccSwiss'], games=['arenaAa1']))
+        self.assertEqual([g for g, v in games], ['arenaAa1', 'arenaAa2', 'arenaAa3', 'arenaAa4', 'swissSw1', 'swissSw2', 'swissSw3', 'arenaAa1'])
+        self.assertEqual(len(self.stub.requests), 5)
+        # the finished arena and game come from the cache, the swiss is still being played
+        self.stub.requests.clear()
+        self.assertEqual(list(lichess_client.iter_lichess_games(arenas=['wcc2021a'], swiss=['wccSwiss'], games=['arenaAa1'])), games)
+        self.assertEqual(sorted(path for path, port in self.stub.requests), ['/api/swiss/wccSwiss', '/api/swiss/wccSwiss/games'])
+
+    def test_rate_limit(self):
+        self.stub.rate_limited = 2
+        with self.assertLogs('league.lichess_async', 'WARNING'):
+            self.assertEqual(list(lichess_client.get_game('arenaAa1')), ['arenaAa1'])
+        self.assertEqual(len(self.stub.requests), 3)
+        self.stub.rate_limited = 5
+        with override_settings(LICHESS_RETRIES=1), self.assertLogs('league.lichess_async', 'WARNING'):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                lichess_client.get_game('arenaAa2')
+
+    def test_token_bucket(self):
+        async def acquire(n):
+            bucket = TokenBucket(100, 1)
+            for i in range(n):
+                await bucket.acquire()
+            bucket.pause(0.05)
+            await bucket.acquire()
+        start = time.monotonic()
+        asyncio.run(acquire(5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_games_from_pgn(self):
+        with open(os.path.join(LichessStub.directory, 'swiss_wccSwiss.pgn')) as f:
+            games = lichess_client.get_games_from_pgn(f)
+        self.assertEqual(list(games), ['swissSw1', 'swissSw2', 'swissSw3'])
+        self.assertEqual(games['swissSw2']['result'], 2)
+
+    def test_manage_view(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/league/league/%i/manage/' % (self.league.pk)
+        response = self.client.post(url, {'lichess_arena_id': 'wcc2021a'}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        messages = [str(m) for m in response.context['messages']]
+        self.assertIn('added 3 games to Championship 2020', messages)
+        self.assertEqual(Schedule.objects.filter(league=self.league).count(), 3)
+        self.assertEqual(Standings.objects.get(league=self.league, player__lichess='alice').matches, 2)
+
+    def test_manage_schedule_view(self):
+        from .views import manage_schedule_view
+
+        class ScheduleSite(MessageSite):
+            manage_view_template = 'manage_game_form.html'
+
+            def has_change_permission(self, request, obj=None):
+                return True
+
+            def get_preserved_filters(self, request):
+                return ''
+
+        alice, bob, carol = [Player.objects.get(lichess=p) for p in ('alice', 'bob', 'carol')]
+        game = Schedule.objects.create(league=self.league, white=alice, black=carol, date=round_date(1))
+        request = RequestFactory().post('/', {'lichess_game_id': 'arenaAa1'})
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        site = ScheduleSite()
+        response = manage_schedule_view(request, game.pk, site)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(site.messages, ['Note that lichess id bob does not correspond to current player %s' % (carol),
+            'added lichess details to 2021-03-04: Player 00 1-0 Player 02'])
+        game.refresh_from_db()
+        self.assertEqual((game.lichess, game.result), ('arenaAa1', 1))
+        self.assertEqual(game.date, datetime.datetime(2021, 3, 4, 19, 30, tzinfo=datetime.timezone.utc))
+        self.assertIn('Qxf7#', PGN.objects.get(game=game).body)
+        self.assertEqual(Standings.objects.get(league=self.league, player=alice).points, 1)
+
+    def test_manage_view_dry_run(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        url = '/admin/league/league/%i/manage/' % (self.league.pk)
+        response = self.client.post(url, {'lichess_arena_id': 'wcc2021a', 'dry_run': 'on'}, follow=True)
+        messages = [str(m) for m in response.context['messages']]
+        self.assertIn('dry run, would add 2 games to Championship 2020 and move 1 from other leagues', messages)
+        self.assertIn('Player stranger is not in the database, skipping 1 games', messages)
+        self.assertEqual(Schedule.objects.filter(league=self.league).count(), 0)
+
+
+class ImportGamesTest(TestCase):
+    """Tests for the bulk import of games into a league."""
+
+    def setUp(self):
+        self.league, self.players = make_league(20, format=3)
+        for i, p in enumerate(self.players):
+            p.lichess = 'player%02i' % (i)
+        Player.objects.bulk_update(self.players, ['lichess'])
+
+    def games(self, n, start=0):
+        rng = random.Random(n)
+        for i in range(start, start + n):
+            white, black = rng.sample(range(20), 2)
+            yield 'game%05i' % (i), {'white': 'player%02i' % (white), 'black': 'player%02i' % (black),
+                'result': rng.choice([0, 1, 2]), 'date': round_date(i % 52), 'pgn': '[Event "%i"]\n\n1. e4 *\n' % (i)}
+
+    def test_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = ingest_games(self.league, self.games(2000))
+        self.assertEqual(len(result.added), 2000)
+        self.assertEqual(PGN.objects.count(), 2000)
+        # a handful of queries for each batch besides the inserts, which go in
+        # as many statements as the database needs
+        batches = 2000 // min(BATCH_SIZE, (connection.features.max_query_params or BATCH_SIZE * 2) // 2) + 1
+        others = [q for q in queries.captured_queries if not q['sql'].startswith('INSERT')]
+        self.assertLessEqual(len(others), 8 * batches)
+
+        # the same games with some new ones, and duplicates in the stream
+        games = list(self.games(2000)) + list(self.games(10, start=2000)) + list(self.games(10, start=2000))
+        result = ingest_games(self.league, games)
+        self.assertEqual((len(result.added), len(result.existing)), (10, 2000))
+        self.assertEqual(Schedule.objects.filter(league=self.league).count(), 2010)
+
+    def test_dry_run(self):
+        games = list(self.games(50)) + [('unknown1', {'white': 'player00', 'black': 'nobody', 'result': 1, 'date': round_date(1)})]
+        with CaptureQueriesContext(connection) as queries:
+            result = import_games(self.league, games, dry_run=True)
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertEqual(result.counts(), {'added': 50, 'moved': 0, 'existing': 0, 'unknown': 1, 'not_in_league': 0, 'invalid_pgn': 0})
+        self.assertEqual(result.unknown_players(), {'nobody': ['unknown1']})
+        self.assertEqual(Schedule.objects.count(), 0)
+
+    def test_standings(self):
+        self.league.players.remove(self.players[19])
+        result = import_games(self.league, self.games(100))
+        self.assertEqual(result.not_in_league, {'player19'})
+        standings = Standings.objects.filter(league=self.league)
+        self.assertEqual(sum(s.matches for s in standings), 2 * 100 - Schedule.objects.filter(
+            Q(white=self.players[19]) | Q(black=self.players[19])).count())
+        self.assertTrue(any('Player 19 has played a game' in w for w in result.warnings))
+        self.assertEqual(standings_check(self.league), [])
+
+
+class PgnScanTest(TestCase):
+    """Tests for the header-only PGN scanner."""
+
+    PGN = (
+        '[Event "Club \\"Blitz\\""]\n[Site "https://lichess.org/aaaa"]\n[White "A"]\n[Black "B"]\n[Result "1-0"]\n\n'
+        '1. e4 { [%clk 0:03:00] } e5\n[%clk 0:02:59] 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0\n\n\n'
+        '[Event "No moves"]\n[Result "*"]\n\n*\n\n'
+        '[Event "Puzzle"]\n[FEN "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"]\n[SetUp "1"]\n\n1. Rd8# *\n'
+    )
+
+    def test_scan(self):
+        f = io.BytesIO(self.PGN.encode())
+        games = list(scan_pgn(f))
+        self.assertEqual([g.headers.get('Event') for g in games], ['Club \\"Blitz\\"', 'No moves', 'Puzzle'])
+        self.assertEqual(games[2].headers['FEN'], '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1')
+        # the headers are those python-chess reads, the text that of the file
+        reference = io.StringIO(self.PGN)
+        for g in games:
+            self.assertEqual(dict(chess.pgn.read_headers(reference)), dict(chess.pgn.Headers(g.headers)))
+        self.assertTrue(games[0].text().startswith('[Event "Club'))
+        self.assertTrue(games[0].text().endswith('4. Qxf7# 1-0\n'))
+        self.assertEqual(self.PGN.encode()[games[1].start:games[1].end], b'[Event "No moves"]\n[Result "*"]\n\n*\n')
+        # the moves only when asked for
+        self.assertEqual(games[0].game().end().board().fen().split()[0], 'r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR')
+        self.assertEqual(len(list(games[2].game().mainline_moves())), 1)
+
+        kept = list(scan_pgn(self.PGN.splitlines(True), keep_text=True))
+        self.assertEqual([g.text() for g in kept], [g.text() for g in games])
+
+    def test_bom(self):
+        data = b'\xef\xbb\xbf' + self.PGN.encode()
+        games = list(scan_pgn(io.BytesIO(data)))
+        reference = io.StringIO(data.decode('utf-8'))
+        self.assertEqual([g.headers for g in games], [dict(chess.pgn.read_headers(reference)) for g in games])
+        self.assertEqual([g.headers.get('Event') for g in games], ['Club \\"Blitz\\"', 'No moves', 'Puzzle'])
+        self.assertEqual(games[0].start, 3)
+        self.assertTrue(games[0].text().startswith('[Event "Club'))
+        kept = list(scan_pgn(data.decode('utf-8').splitlines(True), keep_text=True))
+        self.assertEqual([g.text() for g in kept], [g.text() for g in games])
+
+    def test_crlf(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.pgn', delete=False) as f:
+            f.write(self.PGN.replace('\n', '\r\n').encode())
+        self.addCleanup(os.unlink, f.name)
+        expected = [g.text() for g in scan_pgn(io.BytesIO(self.PGN.encode()))]
+        # the offsets are in bytes, a text file can't be read back from them
+        with open(f.name) as text:
+            with self.assertRaises(TypeError):
+                list(scan_pgn(text))
+        with open(f.name) as text:
+            self.assertEqual([g.text() for g in scan_pgn(text, keep_text=True)], expected)
+        with open(f.name, 'rb') as binary:
+            games = list(scan_pgn(binary))
+            self.assertEqual([g.text() for g in games], expected)
+            self.assertEqual(games[2].headers['FEN'], '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1')
+            self.assertEqual(len(list(games[0].game().mainline_moves())), 7)
+
+
+class PgnParseTest(TestCase):
+    """Tests for the parallel parsing of PGN games."""
+
+    def setUp(self):
+        self.texts = [g.text() for g in scan_pgn(io.BytesIO(PgnScanTest.PGN.encode()))]
+        self.texts.insert(1, '[Event "Broken"]\n[White "C"]\n\n1. e4 e5 2. Ke3 *\n')
+
+    def test_parse(self):
+        parsed = list(parse_pgn_texts(self.texts, workers=1))
+        self.assertEqual([p.headers['Event'] for p in parsed], ['Club \\"Blitz\\"', 'Broken', 'No moves', 'Puzzle'])
+        self.assertEqual(parsed[0].moves, ['e2e4', 'e7e5', 'd1h5', 'b8c6', 'f1c4', 'g8f6', 'h5f7'])
+        self.assertEqual(parsed[0].plies, 7)
+        self.assertTrue(parsed[0].fen.startswith('r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b'))
+        self.assertEqual(parsed[1].errors and parsed[1].plies, 2)
+        self.assertEqual((parsed[2].plies, parsed[2].errors), (0, []))
+        self.assertEqual((parsed[3].plies, parsed[3].fen.split()[0]), (1, '3R2k1/5ppp/8/8/8/8/5PPP/6K1'))
+
+    def test_workers(self):
+        texts = self.texts * 20
+        with tempfile.NamedTemporaryFile('w', suffix='.pgn', delete=False) as f:
+            f.write('\n'.join(texts))
+        self.addCleanup(os.unlink, f.name)
+        inline = [(p.headers, p.moves, p.fen, p.errors) for p in parse_pgn_texts(texts, workers=1)]
+        # in the order of the games whatever the chunks and workers
+        for results in (parse_pgn_texts(texts, workers=2, chunk_size=3), parse_pgn_file(f.name, workers=2, chunk_size=7),
+                parse_pgn_file(f.name, workers=1)):
+            self.assertEqual([(p.headers, p.moves, p.fen, p.errors) for p in results], inline)
+
+        out = StringIO()
+        err = StringIO()
+        call_command('parse_pgn', f.name, workers=1, stdout=out, stderr=err)
+        self.assertIn('Parsed 80 games, 200 half moves, 20 with errors', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('parse_pgn', f.name + '.missing', stdout=out)
+
+    def test_import(self):
+        league, players = make_league(2, format=3)
+        for p, lichess in zip(players, ['alice', 'bob']):
+            p.lichess = lichess
+            p.save()
+        games = [('g%i' % (i), {'white': 'alice', 'black': 'bob', 'result': 1, 'date': round_date(1), 'pgn': pgn})
+            for i, pgn in enumerate(self.texts)]
+        result = import_games(league, games, validate_pgn=True)
+        self.assertEqual(len(result.added), 4)
+        self.assertEqual([g for g, error in result.invalid_pgn], ['g1'])
+        self.assertEqual(sorted(PGN.objects.values_list('game__lichess', flat=True)), ['g0', 'g2', 'g3'])
+
+
+class ScoreMatrixTest(TestCase):
+    """Tests for the score matrix tie breaks."""
+
+    def setUp(self):
+        # a double round robin between three players, p1 beat p2 twice,
+        # drew once with p3 and lost once to them, p2 and p3 drew twice
+        self.matrix = ScoreMatrix(['p1', 'p2', 'p3'], [3.5, 1.0, 2.5], [1800, 1600, 0])
+        self.matrix.add_results('p1', ['p2', 'p2', 'p3'], 1.0)
+        self.matrix.add_results('p1', ['p3'], 0.5)
+        self.matrix.add_results('p2', ['p1', 'p1'], 0.0)
+        self.matrix.add_results('p2', ['p3', 'p3'], 0.5)
+        self.matrix.add_results('p3', ['p1'], 0.5)
+        self.matrix.add_results('p3', ['p1'], 0.0)
+        self.matrix.add_results('p3', ['p2', 'p2', None], 0.5)
+
+    def test_buchholz(self):
+        self.assertEqual(list(self.matrix.buchholz()), [7.0, 12.0, 9.0])
+        self.assertEqual(list(self.matrix.buchholz_cut1()), [6.0, 9.5, 8.0])
+        self.assertEqual(list(self.matrix.median_buchholz()), [3.5, 6.0, 4.5])
+
+    def test_sonneborn_berger(self):
+        self.assertEqual(list(self.matrix.sonneborn_berger()), [5.75, 2.5, 2.75])
+
+    def test_ratings(self):
+        self.assertEqual(list(self.matrix.opponent_rating()), [3200 / 3, 1200, 5200 / 3])
+        self.assertEqual(list(self.matrix.performance()), [2000, 1400, 1600])
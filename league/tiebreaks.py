@@ -0,0 +1,113 @@
+'''
+Tie break scores for a league represented as a score matrix.
+
+Rows are players, columns are their opponents. games[i, j] counts the
+scored games player i has had against player j and score[i, j] the points
+taken from them, 1 for a win and a half for a draw, so that every tie break
+becomes a reduction over the rows.
+'''
+import numpy as np
+
+
+class ScoreMatrix(object):
+    '''
+    Score matrix of the players of a league, points and ratings are the
+    current values of each player in the same order as players
+    '''
+    def __init__(self, players, points, ratings):
+        self.players = list(players)
+        self.index = { p : i for i, p in enumerate(self.players) }
+        n = len(self.players)
+        self.points = np.asarray(points, dtype=float).reshape(n)
+        self.ratings = np.asarray(ratings, dtype=float).reshape(n)
+        self.games = np.zeros((n, n))
+        self.score = np.zeros((n, n))
+        # flat indices of the cells with games, kept sorted
+        self._cells = np.zeros(0, dtype=int)
+
+    def add_results(self, player, opponents, score):
+        '''
+        Record games of player against each of opponents in which the player
+        took score. Opponents outside the matrix, byes or players not in the
+        league, are ignored.
+        '''
+        cols = [ self.index[o] for o in opponents if o in self.index ]
+        self.add_games([ self.index[player] ] * len(cols), cols, [ score ] * len(cols))
+
+    def add_games(self, rows, cols, scores):
+        '''
+        Vectorised version of add_results, rows and cols are matrix indices
+        '''
+        n = len(self.players)
+        cells = np.asarray(rows, dtype=int) * n + np.asarray(cols, dtype=int)
+        # a league is sparse, only touch the cells that have games
+        cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        self.games.reshape(-1)[cells] += counts
+        self.score.reshape(-1)[cells] += np.bincount(inverse.reshape(-1), weights=np.asarray(scores, dtype=float), minlength=len(cells))
+        self._cells = np.union1d(self._cells, cells) if len(self._cells) else cells
+
+    def edges(self):
+        '''
+        Row and column indices of the pairs of players who have met, sorted
+        by row
+        '''
+        n = len(self.players)
+        return self._cells // n, self._cells % n
+
+    def opponents(self):
+        '''
+        Number of scored games of each player against players in the matrix
+        '''
+        return self.games.sum(axis=1)
+
+    def _opponent_reduce(self, ufunc, values):
+        # ufunc reduced over the values of the opponents of each player,
+        # 0 for players without any
+        rows, cols = self.edges()
+        reduced = np.zeros(len(self.players))
+        if len(rows):
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            reduced[rows[starts]] = ufunc.reduceat(values[cols], starts)
+        return reduced
+
+    def buchholz(self):
+        return self.games @ self.points
+
+    def buchholz_cut1(self):
+        return self.buchholz() - self._opponent_reduce(np.minimum, self.points)
+
+    def median_buchholz(self):
+        '''
+        Buchholz without the highest and lowest scoring opponent, 0 for
+        players with fewer than two games
+        '''
+        median = self.buchholz() - self._opponent_reduce(np.minimum, self.points) - self._opponent_reduce(np.maximum, self.points)
+        return np.where(self.opponents() >= 2, median, 0)
+
+    def sonneborn_berger(self):
+        '''
+        Neustadtl Sonneborn-Berger score, the opponents points weighted by
+        the points taken from them
+        '''
+        return self.score @ self.points
+
+    def opponent_rating(self):
+        '''
+        Average rating of the opponents with the lowest rated left out
+        '''
+        total = self.games @ self.ratings - self._opponent_reduce(np.minimum, self.ratings)
+        return total / np.maximum(1, self.opponents() - 1)
+
+    def performance(self):
+        '''
+        Performance rating against the rated opponents in the matrix, the
+        opponent rating plus or minus 400 for a win or loss
+        '''
+        rows, cols = self.edges()
+        n = len(self.players)
+        games = self.games[rows, cols] * (self.ratings[cols] > 0)
+        # wins less losses against each opponent
+        balance = 2 * self.score[rows, cols] - self.games[rows, cols]
+        rated = np.bincount(rows, weights=games, minlength=n)
+        total = np.bincount(rows, weights=games * self.ratings[cols] + 400 * balance * (games > 0), minlength=n)
+        return np.where(rated > 0, total / np.maximum(1, rated), 0)
@@ -12,6 +12,7 @@ from .views import (
     members,
     export_league_pdf,
     export_crosstable_pdf,
+    crosstable,
     trophycabinet,
     team_fixtures,
     team_squads,
@@ -36,6 +37,7 @@ urlpatterns = [
     url(r"^player/(?P<player_id>[0-9]+)/league=(?P<league>[-\w]+)$", player, name="player"),
     url(r"^player/(?P<player_id>[0-9]+)/season=(?P<season>[-\w]+)$", player, name="player"),
     url(r"^player/(?P<player_id>[0-9]+)[/]$", player, name="player"),
+    url(r"^crosstable/(?P<league>[-\w]+)$", crosstable, name="crosstable"),
     url(
         r"^export_league_pdf/(?P<league>[-\w]+)$",
         export_league_pdf,
@@ -11,17 +11,26 @@ from league.models import (
     TeamPlayer,
     PGN,
     STANDINGS_ORDER,
+    PAIRING_ENGINES,
 )
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import get_object_or_404, render, redirect
 import datetime
-from openpyxl import Workbook, load_workbook
+from django.utils import timezone
 
 from django.conf import settings
 from django.templatetags.static import static
 import re
-
+from django.utils.decorators import method_decorator
+from .pagecache import cache_league_page
+from .pairingjobs import start_pairing_job, get_job, job_progress
+from .career import player_page
+from .seasons import get_season_data
+from .ingest import import_games
+import itertools
+
+@method_decorator(cache_league_page('standings'), name='dispatch')
 class StandingsFull(ListView):
     template_name = "standings.html"
     model = Standings
@@ -58,6 +67,7 @@ class StandingsFull(ListView):
         return qs
 
 
+@method_decorator(cache_league_page('schedule'), name='dispatch')
 class ScheduleFull(ListView):
     template_name = "schedule.html"
     model = Schedule
@@ -91,61 +101,80 @@ class ScheduleFull(ListView):
 # Create your views here.
 
 
-def fixtures(request, league, **kwargs):
-    l = get_object_or_404(League, slug=league)
-    games = Schedule.objects.filter(league=l)
-    # let's decide how to break this down, if we have rounds
-    # group by round
-    # else we group by date
-    reverse = False
-    if l.get_format_display() == "Knockout":
-        rounds = sorted(set([g.round for g in games if g.round != None]), reverse=False)
+def group_fixtures(league, games):
+    '''
+    Split the games of a league, ordered by date, into rounds or, if there
+    are none, into days. Returns the groups keyed by their display name, the
+    round numbers and the group to show first, the most recent round with
+    results or the last day before today.
+    '''
+    by_round = {}
+    by_date = {}
+    for g in games:
+        if g.round != None:
+            # count the games with a result in the same pass
+            round_games, ncomplete = by_round.get(g.round, ([], 0))
+            round_games.append(g)
+            by_round[g.round] = (round_games, ncomplete + (g.result != 3))
+        if g.date != None:
+            by_date.setdefault(timezone.localtime(g.date).date(), []).append(g)
+
+    games_display = {}
+    latest = None
+    if league.get_format_display() == "Knockout":
+        rounds = sorted(by_round, reverse=False)
         # if there is a preliminary round, put it at the back
-        if rounds[0] == 0:
+        if rounds and rounds[0] == 0:
             rounds.remove(0)
             rounds.append(0)
     else:
-        rounds = sorted(set([g.round for g in games if g.round != None]), reverse=True)
-    dates = sorted(set([g.date.date() for g in games if g.date != None]), reverse=True)
-    games_display = {}
-    useRounds = len(rounds) > 0
-    latest = None
+        rounds = sorted(by_round, reverse=True)
+
     if len(rounds) > 0:
-        latest = l.get_round_display(list(rounds)[0])
+        latest = league.get_round_display(rounds[0])
         pccurrcomplete = 0
         pcprevcomplete = 0
         for r in rounds:
-            # games_round = games.filter(Q(round=r) & ~Q(black=None) & ~Q(white=None)).order_by('date')
-            games_round = games.filter(round=r).order_by("date")
-            games_display[l.get_round_display(r)] = games_round
+            games_round, ncomplete = by_round[r]
+            games_display[league.get_round_display(r)] = games_round
             # now find which round to show, the last complete one
             pcprevcomplete = pccurrcomplete
-            ncomplete = 0
-            for g in games_round:
-                if g.result != 3:
-                    ncomplete += 1
             pccurrcomplete = float(ncomplete) / len(games_round)
             if pcprevcomplete == 1.0 or pccurrcomplete > 0:
-                latest = l.get_round_display(r)
+                latest = league.get_round_display(r)
     else:
         # no rounds, let's organise by date instead
-        # games_display['rounds'] = False
+        dates = sorted(by_date, reverse=True)
         if len(dates) > 0:
             for d in dates:
-                games_date = games.filter(date__date=d).order_by("date")
-                games_display[d] = games_date
+                games_display[d] = by_date[d]
             today = datetime.datetime.today().date()
             prev_dates = [d for d in dates if d < today]
             latest = max(prev_dates) if len(prev_dates) > 0 else dates[0]
+    return games_display, rounds, latest
+
+
+@cache_league_page('fixtures')
+def fixtures(request, league, **kwargs):
+    l = get_object_or_404(League.objects.select_related("season"), slug=league)
+    # every game of the league in one query, grouped in memory by round or
+    # by date
+    games = list(
+        Schedule.objects.filter(league=l)
+        .select_related("white", "black", "league")
+        .order_by("date", "pk")
+    )
+    games_display, rounds, latest = group_fixtures(l, games)
 
     # let's get the standings now
-    standings = Standings.objects.filter(league=l).order_by("position")
+    standings = Standings.objects.filter(league=l).select_related("player").order_by("position")
     return render(
         request,
         "fixtures.html",
         {
             "games": games_display,
-            "useRounds": useRounds,
+            "useRounds": len(rounds) > 0,
+            "rounds": sorted(rounds),
             "latest": latest,
             "standings": standings,
             "league": l,
@@ -158,27 +187,22 @@ def player(request, player_id, **kwargs):
     active_seasons = Season.objects.order_by("end").filter(players__in = [player])
     games = {}
     if "league" in kwargs:
-        league = get_object_or_404(League, slug=kwargs["league"])
-        games[league.season] = {}
-        games[league.season][league] = Schedule.objects.filter(
-            (Q(white=player_id) | Q(black=player_id)) & Q(league=league)
-        ).order_by("date")
+        league = get_object_or_404(League.objects.select_related("season"), slug=kwargs["league"])
+        season = league.season
+        by_league, career = player_page(player, league=league)
+        games[season] = { league : by_league.get(league, []) }
+        league.has_rounds = any(g.round is not None for g in games[season][league])
     else:
         if "season" in kwargs:
             season = get_object_or_404(Season, slug=kwargs["season"])
         else:
             season = Season.objects.order_by("end").last()
 
-        games[season] = {}
-        for league in season.league_set.all():
-            league_pk = league.pk
-            season_league_games = Schedule.objects.filter(
-                Q(white=player_id) | Q(black=player_id), league=league_pk
-            ).order_by("date")
-            if len(season_league_games) > 0:
-                games[season][league] = season_league_games
+        # every game of the season in one query, grouped by league
+        by_league, career = player_page(player, season=season)
+        games[season] = by_league
 
-    return render(request, "games.html", {"player": player, "games": games, "active_seasons" : active_seasons, "selected_season" : season })
+    return render(request, "games.html", {"player": player, "games": games, "career": career, "active_seasons" : active_seasons, "selected_season" : season })
 
 
 def game(request, game_id):
@@ -213,21 +237,19 @@ def cabinet(request):
     return render(request, "cabinet.html")
 
 
-def season(request, **kwargs):
+def get_season(kwargs):
     if "season_slug" in kwargs:
-        f = get_object_or_404(Season, slug=kwargs["season_slug"])
-    else:
-        f = Season.objects.order_by("end").last()
-    teams = Team.objects.filter(season=f)
-    team_squads = {t: TeamPlayer.objects.filter(team=t).order_by("-player__rating") for t in teams}
-    fixtures = TeamFixture.objects.filter(team__in=teams).order_by('date')
-    fixtures = [ f for f in fixtures if not (f.home and 'wallasey' in f.opponent.lower())]
-    team_fixtures = {t: TeamFixture.objects.filter(team=t).order_by("date") for t in teams}
-    members = f.players.all().order_by("-rating")
+        return get_object_or_404(Season, slug=kwargs["season_slug"])
+    return Season.objects.order_by("end").last()
+
+
+def season(request, **kwargs):
+    f = get_season(kwargs)
+    data = get_season_data(f)
     return render(
         request,
         "season.html",
-        {"season": f, "teams": team_squads, "fixtures": fixtures, "members": members, "team_fixtures" : team_fixtures },
+        {"season": f, "teams": data.squads(), "fixtures": data.fixtures, "members": data.members, "team_fixtures" : data.fixtures_by_team() },
     )
 
 def members(request, **kwargs):
@@ -243,31 +265,21 @@ def members(request, **kwargs):
     )
 
 def team_fixtures(request, **kwargs):
-    if "season_slug" in kwargs:
-        f = get_object_or_404(Season, slug=kwargs["season_slug"])
-    else:
-        f = Season.objects.order_by("end").last()
-    teams = Team.objects.filter(season=f)
-    fixtures = TeamFixture.objects.filter(team__in=teams).order_by('date')
-    fixtures = [ f for f in fixtures if not (f.home and 'wallasey' in f.opponent.lower())]
-    team_fixtures = {t: TeamFixture.objects.filter(team=t).order_by("date") for t in teams}
+    f = get_season(kwargs)
+    data = get_season_data(f)
     return render(
         request,
         "team_fixtures.html",
-        {"season": f, "fixtures": fixtures, "fixtures_by_team" : team_fixtures },
+        {"season": f, "fixtures": data.fixtures, "fixtures_by_team" : data.fixtures_by_team() },
     )
 
 def team_squads(request, **kwargs):
-    if "season_slug" in kwargs:
-        f = get_object_or_404(Season, slug=kwargs["season_slug"])
-    else:
-        f = Season.objects.order_by("end").last()
-    teams = Team.objects.filter(season=f)
-    team_squads = {t: TeamPlayer.objects.filter(team=t).order_by("-player__rating") for t in teams}
+    f = get_season(kwargs)
+    data = get_season_data(f)
     return render(
         request,
         "team_squads.html",
-        {"season": f, "teams": team_squads },
+        {"season": f, "teams": data.squads() },
     )
 
 
@@ -277,7 +289,7 @@ def team_squads(request, **kwargs):
 from io import BytesIO
 
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.contrib.admin.templatetags.admin_urls import add_preserved_filters
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render
@@ -295,44 +307,73 @@ from .forms import (
     ExportGamesForm,
 )
 
-from swissdutch.dutch import DutchPairingEngine
+from . import utils
 from .utils import (
-    get_arena_games,
-    get_swiss_games,
-    get_game,
     make_table,
     make_crosstable,
     standings_save,
     standings_update,
+    standings_games_update,
 )
+from .crosstable import build_crosstable, format_points
+from .pdf import get_league_pdf, pdf_etag
+from django.views.decorators.http import condition
 
 
-def export_league_pdf(request, league):
-    obj = get_object_or_404(League, slug=league)
-    response = HttpResponse(content_type="application/pdf")
+def crosstable(request, league):
+    l = get_object_or_404(League, slug=league)
+    results = build_crosstable(l)
+    rows = [
+        (s, [(format_points(w), format_points(b)) for w, b in cells])
+        for s, cells in results.rows()
+    ]
+    return render(
+        request,
+        "crosstable.html",
+        {
+            "league": l,
+            "rows": rows,
+        },
+    )
+
+
+def get_pdf_league(request, league):
+    # the etag, the last modified date and the view share a single query
+    if not hasattr(request, "pdf_league"):
+        request.pdf_league = League.objects.select_related("season").filter(slug=league).first()
+    return request.pdf_league
+
+
+def pdf_etag_func(kind):
+    def etag(request, league):
+        obj = get_pdf_league(request, league)
+        return pdf_etag(kind, obj) if obj else None
+    return etag
+
+
+def pdf_last_modified(request, league):
+    obj = get_pdf_league(request, league)
+    return obj.updated_date if obj else None
+
+
+def league_pdf_response(request, kind, league):
+    obj = get_pdf_league(request, league)
+    if obj is None:
+        raise Http404("No League matches the given query.")
+    response = HttpResponse(get_league_pdf(kind, obj), content_type="application/pdf")
     filename = "%s_%s" % (obj, obj.updated_date.date())
     response["Content-Disposition"] = "attachment; filename={0}.pdf".format(filename)
-    buffer = BytesIO()
-    fig = make_table(obj)
-    fig.savefig(buffer, format="pdf")
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
     return response
 
 
+@condition(etag_func=pdf_etag_func("table"), last_modified_func=pdf_last_modified)
+def export_league_pdf(request, league):
+    return league_pdf_response(request, "table", league)
+
+
+@condition(etag_func=pdf_etag_func("crosstable"), last_modified_func=pdf_last_modified)
 def export_crosstable_pdf(request, league):
-    obj = get_object_or_404(League, slug=league)
-    response = HttpResponse(content_type="application/pdf")
-    filename = "%s_%s" % (obj, obj.updated_date.date())
-    response["Content-Disposition"] = "attachment; filename={0}.pdf".format(filename)
-    buffer = BytesIO()
-    fig = make_crosstable(obj)
-    fig.savefig(buffer, format="pdf")
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
-    return response
+    return league_pdf_response(request, "crosstable", league)
 
 
 def manage_league_view(request, id, admin_site):
@@ -345,16 +386,14 @@ def manage_league_view(request, id, admin_site):
     rounds = obj.get_rounds()
     round_form.fields["round_no"].choices = tuple((i, i) for i in rounds)
 
-    ngames = 0
-    nchanges = 0
     if request.POST:
-        games = {}
+        games = []
         if request.POST.get("lichess_arena_id") is not None:
-            games.update(get_arena_games(request.POST.get("lichess_arena_id")))
+            games += [utils.iter_arena_games(request.POST.get("lichess_arena_id"))]
         if request.POST.get("lichess_swiss_id") is not None:
-            games.update(get_swiss_games(request.POST.get("lichess_swiss_id")))
+            games += [utils.iter_swiss_games(request.POST.get("lichess_swiss_id"))]
         if request.POST.get("lichess_game_id") is not None:
-            games.update(get_game(request.POST.get("lichess_game_id")))
+            games += [utils.iter_game(request.POST.get("lichess_game_id"))]
         if request.POST.get("round_no") is not None:
             message = ""
             for g in Schedule.objects.filter(
@@ -376,70 +415,13 @@ def manage_league_view(request, id, admin_site):
                         )
 
             admin_site.message_user(request, mark_safe(message))
-        for g, v in games.items():
-            if len(Schedule.objects.filter(lichess=g)) > 0:
-                schedule = Schedule.objects.filter(lichess=g)[0]
-                if schedule.league != obj:
-                    admin_site.message_user(
-                        request,
-                        "Game between %s and %s is in %s, changing to %s"
-                        % (v["white"], v["black"], schedule.league, obj),
-                    )
-                    schedule.league = obj
-                    schedule.save()
-                    nchanges += 1
-                else:
-                    admin_site.message_user(
-                        request,
-                        "Game between %s and %s is already in the database"
-                        % (v["white"], v["black"]),
-                    )
-                continue
-            white = Player.objects.filter(lichess=v["white"])
-            black = Player.objects.filter(lichess=v["black"])
-            if len(white) == 0:
-                admin_site.message_user(
-                    request,
-                    "Player %s is not in the database, skipping game" % (v["white"]),
-                )
-                continue
-            if len(black) == 0:
-                admin_site.message_user(
-                    request,
-                    "Player %s is not in the database, skipping game" % (v["black"]),
-                )
-                continue
-            if white[0] not in obj.players.all():
-                admin_site.message_user(
-                    request,
-                    "Warning: Player %s is in the database but not the league"
-                    % (v["white"]),
-                )
-            if black[0] not in obj.players.all():
-                admin_site.message_user(
-                    request,
-                    "Warning: Player %s is in the database but not the league"
-                    % (v["black"]),
-                )
-            schedule = Schedule(
-                league=obj,
-                lichess=g,
-                white=white[0],
-                black=black[0],
-                date=v["date"],
-                result=v["result"],
+        if games:
+            result = import_games(
+                obj, itertools.chain(*games), dry_run=request.POST.get("dry_run") is not None
             )
-            if "pgn" in v.keys():
-                schedule.pgn = v["pgn"]
-            schedule.save()
-            ngames += 1
-        if ngames + nchanges > 0:
-            standings_save(obj)
-            standings_update(obj)
-
-        admin_site.message_user(
-            request, "added %i games to %s" % (ngames + nchanges, obj)
-        )
+            for message in result.messages():
+                admin_site.message_user(request, message)
+            admin_site.message_user(request, result.summary(obj))
 
     if not admin_site.has_change_permission(request, obj):
         raise PermissionDenied
@@ -504,6 +486,7 @@ def create_round_robin_view(request, id, admin_site):
             "%s %s" % (date, time), "%Y-%m-%d %H:%M:%S"
         )
         games = utils.create_round_robin(obj, [round_date])
+        utils.standings_update(admin_site, request, obj)
 
         # context['pairs'] = pairs
         # context['round'] = next_round_no
@@ -560,8 +543,8 @@ def create_round_view(request, id, admin_site):
                 admin_site.message_user(request, "%s will get a bye" % (g.white))
             else:
                 admin_site.message_user(request, "%s will play %s" % (g.white, g.black))
-            g.save()
-        utils.standings_update(obj)
+        utils.save_games(games)
+        utils.standings_update(admin_site, request, obj)
 
     elif request.POST and request.POST.get("create_swiss_round") is not None:
         # here we've been asked to create a round
@@ -582,26 +565,48 @@ def create_round_view(request, id, admin_site):
                 "%s %s" % (date, time), "%Y-%m-%d %H:%M:%S"
             )
             rounds = obj.get_rounds()
-            standings = Standings.objects.filter(league=obj)
             next_round_no = 1
             if len(rounds) > 0:
                 next_round_no = rounds[-1] + 1
-            engine = DutchPairingEngine()
-            last_round = utils.get_last_round(obj)
             byes = []
-            if request.POST.get("byes"):
-                for p in request.POST.get("byes"):
-                    player = Player.objects.get(id=p)
-                    byes += [player]
-            next_round = utils.get_next_round(
-                next_round_no, engine, last_round, byes=byes
+            for p in request.POST.getlist("byes"):
+                player = Player.objects.get(id=p)
+                byes += [player]
+            if not admin_site.has_change_permission(request, obj):
+                raise PermissionDenied
+            # paired in the background, the page polls for the pairs
+            engine = request.POST.get("engine")
+            if engine not in dict(PAIRING_ENGINES):
+                engine = None
+            job_id = start_pairing_job(
+                obj, next_round_no, byes, engine=engine, date=date, time=time
             )
-            pairs, id_pairs = utils.get_pairs(next_round)
-            context["pairs"] = pairs
-            context["round"] = next_round_no
-            context["date"] = date
-            context["time"] = time
-            request.session["pairs"] = id_pairs
+            return redirect("%s?job=%s" % (request.path, job_id))
+
+    elif request.GET.get("job"):
+        job = get_job(request.GET.get("job"))
+        if job is None or job.get("league") != obj.pk:
+            admin_site.message_user(
+                request, "The pairing has expired, please create the round again"
+            )
+        elif job["status"] == "done":
+            if job["fallback"]:
+                admin_site.message_user(
+                    request,
+                    "Paired by score as %s, please check the pairs" % (job["fallback"]),
+                )
+            context["pairs"] = job["pairs"]
+            context["round"] = job["round"]
+            context["date"] = job["date"]
+            context["time"] = job["time"]
+            request.session["pairs"] = job["id_pairs"]
+        elif job["status"] == "failed":
+            admin_site.message_user(
+                request, "The round could not be paired: %s" % (job["error"])
+            )
+        else:
+            context["job"] = job
+            context["progress"] = job_progress(job)
 
     if not admin_site.has_change_permission(request, obj):
         raise PermissionDenied
@@ -616,15 +621,14 @@ def manage_schedule_view(request, id, admin_site):
     if request.POST:
         if request.POST.get("lichess_game_id") is not None:
             game_id = request.POST.get("lichess_game_id")
-            game = utils.get_game(game_id)
-            white = obj.white
-            black = obj.black
-        if game["white"] != obj.white.lichess:
-            admin_site.message_user(
-                request,
-                "Note that lichess id %s does not correspond to current player %s"
-                % (game["white"], obj.white),
-            )
+            # get_game returns the games by id, as the other importers
+            game = utils.get_game(game_id)[game_id]
+            if game["white"] != obj.white.lichess:
+                admin_site.message_user(
+                    request,
+                    "Note that lichess id %s does not correspond to current player %s"
+                    % (game["white"], obj.white),
+                )
             if game["black"] != obj.black.lichess:
                 admin_site.message_user(
                     request,
@@ -634,11 +638,14 @@ def manage_schedule_view(request, id, admin_site):
             obj.lichess = game_id
             obj.date = game["date"]
             obj.result = game["result"]
-            if "pgn" in game.keys():
-                obj.pgn = game["pgn"]
             obj.save()
-            utils.standings_save(obj.league)
-            utils.standings_update(obj.league)
+            if game.get("pgn"):
+                # pgn is the reverse side of PGN.game, it can't be assigned
+                obj.pgn.all().delete()
+                PGN.objects.create(game=obj, body=game["pgn"])
+            standings_games_update(
+                admin_site, request, [(obj.league_id, obj.white_id, obj.black_id)]
+            )
 
         admin_site.message_user(request, "added lichess details to %s" % (obj))
 
@@ -712,19 +719,20 @@ def add_club_night_view(request, admin_site):
     if request.POST:
         date = request.POST.get("datetime_0")
         time = request.POST.get("datetime_1")
-        leagues_updated = []
+        games_updated = []
         round_night = datetime.datetime.strptime(
             "%s %s" % (date, time), "%Y-%m-%d %H:%M:%S"
         )
         formset_result = ScheduleModelFormset(request.POST)
         admin_site.message_user(request, "Added Club Night on %s at %s" % (date, time))
+        games = []
         for form in formset_result:
             if form.is_valid():
                 game = form.save(commit=False)
                 game.date = round_night
                 game.white_rating = game.white.rating
                 game.black_rating = game.black.rating
-                game.save()
+                games += [game]
                 admin_site.message_user(
                     request,
                     "Added %s %s %s in the %s on %s"
@@ -736,17 +744,16 @@ def add_club_night_view(request, admin_site):
                         game.date,
                     ),
                 )
-                if game.league not in leagues_updated:
-                    leagues_updated += [game.league]
+                games_updated += [(game.league_id, game.white_id, game.black_id)]
             else:
                 admin_site.message_user(
                     request,
                     "Game between %s and %s is not valid"
                     % (form.cleaned_data["white"], form.cleaned_data["black"]),
                 )
-        for obj in leagues_updated:
-            standings_update(admin_site, request, obj)
-            standings_save(admin_site, request, obj)
+        utils.save_games(games)
+        # one incremental update per league for all the games of the night
+        standings_games_update(admin_site, request, games_updated)
 
     return render(request, admin_site.add_clubnight_template, context)
 